@@ -1,21 +1,40 @@
 import os
+import hmac
 import jwt
-import requests
 import datetime
-from flask import Flask, jsonify, request, g
+from flask import Flask, jsonify, request, g, Response, stream_with_context
 from functools import wraps
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
 from werkzeug.security import generate_password_hash, check_password_hash
 from dotenv import load_dotenv
-from sqlalchemy import text
+from sqlalchemy import func, literal, any_, tuple_, delete
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import aliased, Bundle
+from sqlalchemy.dialects.postgresql import ARRAY, UUID
 import threading
+import time
+import click
 
 # Load environment variables
 load_dotenv()
 
 # Import models
-from models import db, User, Conversation, Message, Post, Comment, style_enum
+from models import db, User, Conversation, Message, Post, Comment, BotJob, style_enum, get_current_time
+import feed
+import counters
+from pagination import InvalidCursor, page_size, keyset_page
+import migrations
+import serializers
+import conditional
+import cache
+import google_tokens
+import background
+import jobs
+import chat_events
+from replies import record_last_message
+from user_context import current_user, decode_access_token, invalidate_profile
+from serializers import json_response, MESSAGE_COLUMNS, POST_COLUMNS, AUTHOR_COLUMNS
 
 app = Flask(__name__)
 
@@ -32,31 +51,74 @@ CORS(app)
 
 # Initialize DB
 db.init_app(app)
+background.init_app(app)
 
-with app.app_context():
-    # Ensure pgvector extension is enabled
-    db.session.execute(text('CREATE EXTENSION IF NOT EXISTS vector'))
-    db.session.commit()
-    db.create_all()
+# 스키마 변경은 `flask --app app migrate`로만 적용 (웹 프로세스는 시작 시 DDL을 하지 않음)
+@app.cli.command('migrate')
+@click.option('--target', type=int, default=None, help='Stop after this migration version.')
+def migrate_command(target):
+    """Apply pending schema migrations."""
+    applied = migrations.migrate(db.engine, target=target)
+    if applied:
+        print(f"Applied migrations: {', '.join(str(v) for v in applied)}")
+    else:
+        print("Database is up to date")
+
+@app.cli.command('show-migrations')
+def show_migrations():
+    """List migrations that have not been applied yet."""
+    for version, name in migrations.pending(db.engine):
+        print(f"pending {version:04d}_{name}")
+
+# 피드 ranker / 카운터 보정 스레드는 실제로 요청을 처리하는 웹 프로세스에서만 띄운다 (CLI 명령에서는 띄우지 않음)
+_background_started = False
+_background_lock = threading.Lock()
+
+@app.before_request
+def start_background_workers():
+    global _background_started
+    if _background_started:
+        return
+    with _background_lock:
+        if not _background_started:
+            if os.getenv('FEED_RANKER', '1') == '1':
+                feed.start_ranker(app)
+            if os.getenv('COUNTER_RECONCILER', '1') == '1':
+                counters.start_reconciler(app)
+            if GOOGLE_CLIENT_ID:
+                google_tokens.google_keys.start_refresher()
+            chat_events.start_listener(db.engine)
+            _background_started = True
+
+@app.cli.command('rebuild-feed-ranking')
+def rebuild_feed_ranking():
+    """Recompute POST.hot_score for every post."""
+    updated = feed.rebuild_scores()
+    print(f"Rebuilt hot_score for {updated} posts")
+
+@app.cli.command('requeue-dead-bot-jobs')
+def requeue_dead_bot_jobs():
+    """Retry every dead-lettered bot reply job from scratch."""
+    print(f"Requeued {jobs.requeue_dead(db.session)} bot jobs")
+
+@app.cli.command('reconcile-counters')
+def reconcile_counters_command():
+    """Recompute USER/POST counters from the source tables and repair drift."""
+    users_fixed, posts_fixed = counters.reconcile_counters()
+    print(f"Repaired {users_fixed} users and {posts_fixed} posts")
 
 # --- Auth Utilities ---
 
 def verify_google_token(token):
+    # 서명은 캐시된 Google JWKS 키로 로컬 검증 (tokeninfo 엔드포인트 호출 없음)
+    if not GOOGLE_CLIENT_ID:
+        print("Google Token Verification Error: GOOGLE_CLIENT_ID is not configured")
+        return None
     try:
-        # Verify the token with Google's API
-        url = f"https://oauth2.googleapis.com/tokeninfo?id_token={token}"
-        response = requests.get(url)
-        
-        if response.status_code != 200:
-            return None
-        
-        data = response.json()
-        
-        # Verify audience (optional but recommended)
-        # if data['aud'] != GOOGLE_CLIENT_ID:
-        #     return None
-            
-        return data
+        return google_tokens.verify_id_token(token, audience=GOOGLE_CLIENT_ID)
+    except jwt.InvalidTokenError as e:
+        print(f"Invalid Google token: {e}")
+        return None
     except Exception as e:
         print(f"Google Token Verification Error: {e}")
         return None
@@ -87,7 +149,8 @@ def require_auth(f):
         
         token = auth_header.split(" ")[1]
         try:
-            payload = jwt.decode(token, JWT_SECRET, algorithms=['HS256'])
+            # 검증된 토큰은 만료 전까지 프로세스 캐시에서 claims를 재사용
+            payload = decode_access_token(token, JWT_SECRET)
             if payload.get('type') != 'access':
                  return jsonify({"error": "Invalid token type"}), 401
             
@@ -106,6 +169,20 @@ def require_auth(f):
         return f(*args, **kwargs)
     return decorated
 
+# 운영용 엔드포인트: 사용자 로그인이 아니라 내부 토큰(X-Metrics-Token)으로만 연다. 토큰을 설정하지 않으면 404
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
+def require_metrics_token(f):
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        if not METRICS_TOKEN:
+            return jsonify({"error": "Not found"}), 404
+        token = request.headers.get('X-Metrics-Token', '')
+        if not hmac.compare_digest(token.encode(), METRICS_TOKEN.encode()):
+            return jsonify({"error": "Forbidden"}), 403
+        return f(*args, **kwargs)
+    return decorated
+
 # --- Auth ---
 
 @app.route('/auth/google', methods=['POST'])
@@ -258,39 +335,47 @@ def update_chat_room_title():
 @app.route('/chat', methods=['GET'])
 @require_auth
 def get_chat_room():
-    user = User.query.get(g.user_id)
+    # 목록이 바뀌면 방 개수나 max(updated_at)이 바뀐다: (user_id, deleted, updated_at) 인덱스만 읽는 검증자
+    room_count, last_updated = (
+        db.session.query(func.count(Conversation.id), func.max(Conversation.updated_at))
+        .filter(Conversation.user_id == g.user_id, Conversation.deleted == False)
+        .one()
+    )
+    # 방을 지우면 max(updated_at)은 그대로일 수 있어 Last-Modified로는 알 수 없다: 방 개수가 들어간 ETag로만 검증
+    etag = conditional.make_etag(g.user_id, room_count, last_updated)
+    cached = conditional.not_modified(etag)
+    if cached:
+        return cached
+
+    user = current_user()
     if not user:
         return jsonify({"error": "User not found"}), 404
         
     conversations = Conversation.query.filter_by(user_id=g.user_id, deleted=False).order_by(Conversation.updated_at.desc()).all()
-    
-    results = []
-    for conv in conversations:
-        # Get last message
-        last_msg = Message.query.filter_by(conversation_id=conv.id).order_by(Message.created_at.desc()).first()
-        
-        # Get all messages for the room
-        msgs = Message.query.filter_by(conversation_id=conv.id).order_by(Message.created_at.asc()).all()
-        formatted_msgs = []
-        for m in msgs:
-            formatted_msgs.append({
-                "id": str(m.id),
-                "sender": "user" if m.role == "user" else "bot",
-                "content": m.content,
-                "timestamp": m.created_at.isoformat() if m.created_at else None
-            })
-
-        results.append({
-            "id": str(conv.id),
-            "title": conv.title or "새 채팅",
-            "lastMessage": last_msg.content if last_msg else "",
-            "messages": formatted_msgs,
-            "createdAt": conv.created_at.isoformat() if conv.created_at else None,
-            "updatedAt": conv.updated_at.isoformat() if conv.updated_at else None,
-            "authorEmail": user.email
-        })
-    
-    return jsonify(results)
+
+    # summary=1: 사이드바용 요약만 반환 (메시지 전체는 /chat/messages로만 조회)
+    summary = request.args.get('summary') in ('1', 'true')
+
+    msgs_by_conv = {}
+    if not summary and conversations:
+        # 기존 클라이언트 호환용: 모든 방의 메시지를 한 번의 쿼리로 가져온다
+        rows = (
+            db.session.query(Message.conversation_id, *MESSAGE_COLUMNS)
+            .filter(Message.conversation_id.in_([c.id for c in conversations]))
+            .order_by(Message.created_at.asc())
+            .all()
+        )
+        for row in rows:
+            msgs_by_conv.setdefault(row[0], []).append(row[1:])
+
+    results = [
+        serializers.conversation(
+            conv, user.email,
+            messages=None if summary else serializers.message_rows(msgs_by_conv.get(conv.id, []))
+        )
+        for conv in conversations
+    ]
+    return conditional.with_validators(json_response(results), etag)
 
 @app.route('/chat', methods=['DELETE'])
 @require_auth
@@ -311,7 +396,7 @@ def delete_chat_room():
 @app.route('/chat', methods=['POST'])
 @require_auth
 def create_chat_room():
-    user = User.query.get(g.user_id)
+    user = current_user()
     if not user:
         return jsonify({"error": "User not found"}), 404
         
@@ -326,15 +411,10 @@ def create_chat_room():
     db.session.commit()
     
     # Return formatted new conversation
-    return jsonify({
-        "id": str(new_conv.id),
-        "title": new_conv.title,
-        "lastMessage": "",
-        "messages": [],
-        "createdAt": new_conv.created_at.isoformat() if new_conv.created_at else None,
-        "updatedAt": new_conv.updated_at.isoformat() if new_conv.updated_at else None,
-        "authorEmail": user.email
-    }), 201
+    return json_response(serializers.conversation(new_conv, user.email, messages=[]), 201)
+
+MESSAGE_PAGE_SIZE = 50
+MAX_MESSAGE_PAGE_SIZE = 200
 
 @app.route('/chat/messages', methods=['GET'])
 @require_auth
@@ -344,18 +424,144 @@ def get_chat_messages():
     conv = Conversation.query.filter_by(id=conversation_id, user_id=g.user_id).first()
     if not conv:
         return jsonify({"error": "Conversation not found or access denied"}), 404
-    
-    messages = Message.query.filter_by(conversation_id=conversation_id).order_by(Message.created_at.asc()).all()
-    formatted_msgs = []
-    for m in messages:
-        formatted_msgs.append({
-            "id": str(m.id),
-            "sender": "user" if m.role == "user" else "bot",
-            "content": m.content,
-            "timestamp": m.created_at.isoformat() if m.created_at else None
-        })
-    
-    return jsonify(formatted_msgs)
+
+    # 메시지가 추가될 때마다 message_count/last_message_at이 바뀌므로, 새 메시지가 없으면
+    # 대화방 PK 조회 한 번으로 304를 돌려준다 (봇 응답 폴링)
+    last_modified = conv.last_message_at or conv.created_at
+    validators = (conditional.make_etag(conv.id, conv.message_count, last_modified), last_modified)
+    cached = conditional.not_modified(*validators)
+    if cached:
+        return cached
+
+    after = request.args.get('after')
+    before = request.args.get('before')
+    paginated = after or before or 'limit' in request.args
+    if not paginated:
+        # 기존 클라이언트 호환: 전체 히스토리를 배열로 반환
+        rows = (
+            db.session.query(*MESSAGE_COLUMNS)
+            .filter(Message.conversation_id == conversation_id)
+            .order_by(Message.created_at.asc(), Message.id.asc())
+            .all()
+        )
+        return conditional.with_validators(json_response(serializers.message_rows(rows)), *validators)
+
+    if after and before:
+        return jsonify({"error": "after와 before는 함께 사용할 수 없습니다."}), 400
+    limit = request.args.get('limit', MESSAGE_PAGE_SIZE, type=int)
+    limit = max(1, min(limit, MAX_MESSAGE_PAGE_SIZE))
+
+    # (created_at, id) 키셋 커서: after/before는 클라이언트가 마지막으로 본 메시지 id
+    anchor = None
+    if after or before:
+        anchor = (
+            db.session.query(Message.created_at, Message.id)
+            .filter_by(id=after or before, conversation_id=conversation_id)
+            .first()
+        )
+        if not anchor:
+            return jsonify({"error": "Cursor message not found"}), 400
+
+    key = tuple_(Message.created_at, Message.id)
+    query = db.session.query(*MESSAGE_COLUMNS).filter(Message.conversation_id == conversation_id)
+    if after:
+        # 폴링: 마지막으로 본 메시지 이후의 새 메시지만
+        query = query.filter(key > tuple_(anchor.created_at, anchor.id)).order_by(Message.created_at.asc(), Message.id.asc())
+    else:
+        # 최신 메시지부터 거꾸로 lazy load
+        if before:
+            query = query.filter(key < tuple_(anchor.created_at, anchor.id))
+        query = query.order_by(Message.created_at.desc(), Message.id.desc())
+    messages = query.limit(limit + 1).all()
+
+    has_more = len(messages) > limit
+    messages = messages[:limit]
+    if not after:
+        messages.reverse()
+
+    payload = {"messages": serializers.message_rows(messages), "hasMore": has_more}
+    return conditional.with_validators(json_response(payload), *validators)
+
+# long-poll/SSE가 동시에 붙잡을 수 있는 스레드 수 (프로세스당). 나머지 스레드는 일반 요청용으로 남겨 둔다
+STREAM_MAX_ACTIVE = int(os.getenv('CHAT_STREAM_MAX_ACTIVE', '24'))
+_stream_lock = threading.Lock()
+_active_streams = 0
+
+def acquire_stream_slot():
+    global _active_streams
+    with _stream_lock:
+        if _active_streams >= STREAM_MAX_ACTIVE:
+            return False
+        _active_streams += 1
+        return True
+
+def release_stream_slot():
+    global _active_streams
+    with _stream_lock:
+        _active_streams -= 1
+
+def streams_busy():
+    return jsonify({"error": "Too many open streams, try again shortly"}), 503, {"Retry-After": "5"}
+
+WAIT_DEFAULT_SECONDS = 25
+WAIT_MAX_SECONDS = 30
+WAIT_FALLBACK_SECONDS = 5  # LISTEN 연결이 끊겼을 때의 재확인 주기
+
+# 봇 답변 long-poll: after 이후 메시지가 생기면 바로, 없으면 timeout 뒤 빈 목록 (기다리는 동안 DB 커넥션은 잡지 않음)
+@app.route('/chat/wait', methods=['GET'])
+@require_auth
+def wait_chat_messages():
+    conversation_id = request.args.get('conversation_id')
+    after = request.args.get('after')
+    if not after:
+        return jsonify({"error": "after is required"}), 400
+    timeout = request.args.get('timeout', WAIT_DEFAULT_SECONDS, type=int)
+    timeout = max(0, min(timeout, WAIT_MAX_SECONDS))
+
+    anchor = (
+        db.session.query(Message.created_at, Message.id)
+        .join(Conversation, Conversation.id == Message.conversation_id)
+        .filter(Message.id == after, Message.conversation_id == conversation_id, Conversation.user_id == g.user_id)
+        .first()
+    )
+    if not anchor:
+        return jsonify({"error": "Conversation not found or access denied"}), 404
+
+    if timeout and not acquire_stream_slot():
+        return streams_busy()
+    key = tuple_(Message.created_at, Message.id)
+    deadline = time.monotonic() + timeout
+    try:
+        # 조회 전에 구독해야 조회와 대기 사이에 온 알림을 놓치지 않는다
+        with chat_events.listener.subscribe(conversation_id) as notified:
+            while True:
+                notified.clear()
+                rows = (
+                    db.session.query(*MESSAGE_COLUMNS)
+                    .filter(Message.conversation_id == conversation_id, key > tuple_(anchor.created_at, anchor.id))
+                    .order_by(Message.created_at.asc(), Message.id.asc())
+                    .limit(MAX_MESSAGE_PAGE_SIZE + 1)
+                    .all()
+                )
+                failed = not rows and db.session.query(BotJob.status).filter(BotJob.message_id == anchor.id).scalar() == 'dead'
+                # 기다리는 동안에는 커넥션을 풀에 돌려준다
+                db.session.commit()
+                remaining = deadline - time.monotonic()
+                if rows or failed or remaining <= 0:
+                    break
+                if not chat_events.listener.connected:
+                    remaining = min(remaining, WAIT_FALLBACK_SECONDS)
+                notified.wait(remaining)
+    finally:
+        if timeout:
+            release_stream_slot()
+
+    payload = {
+        "messages": serializers.message_rows(rows[:MAX_MESSAGE_PAGE_SIZE]),
+        "hasMore": len(rows) > MAX_MESSAGE_PAGE_SIZE,
+        "replyFailed": failed,
+    }
+    return json_response(payload)
 
 @app.route('/chat/messages', methods=['POST'])
 @require_auth
@@ -382,97 +588,181 @@ def add_chat_message():
         content=content
     )
     db.session.add(new_msg)
+    db.session.flush()
     
-    # Update conversation updated_at
+    # Update conversation updated_at and list summary
     conv.updated_at = datetime.datetime.utcnow()
+    record_last_message(conv, content)
     
-    db.session.commit()
-    
-    # Trigger chatbot response in background if it's a user message
+    # Queue the chatbot response if it's a user message (worker.py가 생성, 메시지와 같은 트랜잭션)
     if role == 'user':
-        # Get user settings for persona
-        thread = threading.Thread(target=trigger_chatbot_response, args=(app.config['SQLALCHEMY_DATABASE_URI'], conversation_id, g.user_id, useLocalLLM))
-        thread.start()
-        
-    return jsonify({
-        "id": str(new_msg.id),
-        "sender": "user" if new_msg.role == "user" else "bot",
-        "content": new_msg.content,
-        "timestamp": new_msg.created_at.isoformat() if new_msg.created_at else None
-    }), 201
-
-def trigger_chatbot_response(db_url, conversation_id, user_id, useLocalLLM=False):
-    # Use a new app context for the thread
-    from models import db, User, Conversation, Message
-    from sqlalchemy import create_engine
-    from sqlalchemy.orm import sessionmaker
-    
-    engine = create_engine(db_url)
-    Session = sessionmaker(bind=engine)
-    session = Session()
+        jobs.enqueue(db.session, new_msg.id, conv.id, g.user_id, useLocalLLM)
     
+    db.session.commit()
+        
+    return json_response(serializers.message(new_msg), 201)
+
+# chat_events 알림으로 깨어나고, 알림을 못 받는 경우를 대비해 이 주기로도 다시 확인한다
+STREAM_POLL_SECONDS = float(os.getenv('CHAT_STREAM_POLL_SECONDS', '2'))
+# 스트림 하나가 스레드를 붙잡는 최대 시간: 끝나면 클라이언트가 Last-Event-ID로 다시 붙는다
+STREAM_MAX_SECONDS = int(os.getenv('CHAT_STREAM_MAX_SECONDS', '55'))
+STREAM_HEARTBEAT_SECONDS = 15
+STREAM_RETRY_MS = 1000  # EventSource 재연결 대기
+
+# Last-Event-ID 형식: "<attempt>:<offset>"
+def parse_stream_position(value):
     try:
-        user = session.query(User).get(user_id)
-        if not user:
-            return
+        attempt, offset = value.split(':')
+        return int(attempt), int(offset)
+    except (AttributeError, ValueError):
+        return None, 0
 
-        # Fetch conversation history
-        messages = session.query(Message).filter_by(conversation_id=conversation_id).order_by(Message.created_at.asc()).all()
-        
-        # Prepare messages for LLM
-        formatted_history = []
-        
-        for m in messages:
-            role = "user" if m.role == "user" else "assistant"
-            formatted_history.append({"role": role, "content": m.content})
-            
-        # Call Inference Server running on the host
-        try:
-            # Use host.docker.internal to reach the host machine from inside the container
-            inference_url = "http://host.docker.internal:5000/generate"
-            config = {
-                "mbti": user.setting_mbti,
-                "intensity": user.setting_intensity,
-                "style": user.style,
-                "temperature": 0.85,
-                "name": user.display_name,
-                "age": user.age,
-                "gender": user.gender,
-                "useLocalLLM": useLocalLLM
-            }
-            resp = requests.post(inference_url, json={"messages": formatted_history, "config": config}, timeout=120)
-            if resp.status_code == 200:
-                bot_content = resp.json().get('response', '')
-                if bot_content:
-                    # Save bot message
-                    bot_msg = Message(
-                        conversation_id=conversation_id,
-                        user_id=user_id,
-                        role='bot',
-                        content=bot_content
-                    )
-                    session.add(bot_msg)
-                    # Update conversation
-                    conv = session.query(Conversation).get(conversation_id)
-                    conv.updated_at = datetime.datetime.utcnow()
-                    session.commit()
-            else:
-                print(f"LLM Server returned error: {resp.status_code} - {resp.text}")
-        except Exception as e:
-            print(f"Error calling LLM inference: {e}")
-            
-    except Exception as e:
-        print(f"Error in trigger_chatbot_response: {e}")
-    finally:
-        session.close()
+# 봇 답변 SSE: delta / reset(재시도로 처음부터) / done / failed
+@app.route('/chat/stream', methods=['GET'])
+@require_auth
+def stream_bot_reply():
+    message_id = request.args.get('message_id')
+    found = (
+        db.session.query(BotJob.id, BotJob.conversation_id)
+        .filter(BotJob.message_id == message_id, BotJob.user_id == g.user_id)
+        .first()
+    )
+    if not found:
+        return jsonify({"error": "Reply not found"}), 404
+    job_id, conversation_id = found
+    attempt, offset = parse_stream_position(request.headers.get('Last-Event-ID') or request.args.get('lastEventId'))
+    db.session.commit()
+    if not acquire_stream_slot():
+        return streams_busy()
 
-# --- Like Utility ---
-def update_user_like_cnt(user_id):
-    from models import Like, User
-    user = User.query.get(user_id)
-    if user:
-        user.like_cnt = Like.query.filter_by(user_id=user_id).count()
-        db.session.commit()
+    def events():
+        yield f"retry: {STREAM_RETRY_MS}\n\n".encode()
+        with chat_events.listener.subscribe(conversation_id) as notified:
+            yield from relay(notified)
+
+    def relay(notified):
+        nonlocal attempt, offset
+        deadline = time.monotonic() + STREAM_MAX_SECONDS
+        next_heartbeat = time.monotonic() + STREAM_HEARTBEAT_SECONDS
+        while time.monotonic() < deadline:
+            notified.clear()
+            job = (
+                db.session.query(BotJob.status, BotJob.attempts, BotJob.partial_text, BotJob.reply_id)
+                .filter(BotJob.id == job_id)
+                .first()
+            )
+            # 폴링 사이에는 커넥션을 풀에 돌려준다
+            db.session.commit()
+            if job is None:
+                yield serializers.sse_event('failed', {"error": "Reply was cancelled"})
+                return
+            if job.attempts != attempt:
+                if attempt is not None and offset:
+                    yield serializers.sse_event('reset', {"attempt": job.attempts})
+                attempt, offset = job.attempts, 0
+            text = job.partial_text or ""
+            if len(text) > offset:
+                yield serializers.sse_event('delta', {"text": text[offset:]}, event_id=f"{attempt}:{len(text)}")
+                offset = len(text)
+            if job.status == 'done':
+                reply = db.session.query(*MESSAGE_COLUMNS).filter(Message.id == job.reply_id).first()
+                db.session.commit()
+                yield serializers.sse_event('done', serializers.message(reply) if reply else None)
+                return
+            if job.status == 'dead':
+                yield serializers.sse_event('failed', {"error": "Reply generation failed"})
+                return
+            if time.monotonic() >= next_heartbeat:
+                yield b": keep-alive\n\n"
+                next_heartbeat = time.monotonic() + STREAM_HEARTBEAT_SECONDS
+            notified.wait(STREAM_POLL_SECONDS)
+        yield serializers.sse_event('timeout', {"retry": True})
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    response = Response(stream_with_context(events()), mimetype='text/event-stream', headers=headers)
+    # 제너레이터가 시작도 못 하고 끊겨도 WSGI 서버가 close()를 부르므로 슬롯이 반환된다
+    response.call_on_close(release_stream_slot)
+    return response
+
+# --- Post Loader ---
+
+# 뷰어와 무관한 게시글 payload (작성자·메시지는 각각 쿼리 한 번, likedByMe는 항상 False)
+def load_post_payloads(posts, anonymize=True, like_counts=False, authors=None):
+    from models import Like
+    if not posts:
+        return []
+
+    post_ids = [p.id for p in posts]
+    author_ids = {p.user_id for p in posts}
+    message_ids = list({m_id for p in posts if p.msgs for m_id in p.msgs})
+
+    if authors is None:
+        authors = {a.id: a for a in db.session.query(*AUTHOR_COLUMNS).filter(User.id.in_(author_ids)).all()}
+
+    messages = {}
+    if message_ids:
+        msg_rows = db.session.query(*MESSAGE_COLUMNS).filter(
+            Message.id == any_(literal(message_ids, ARRAY(UUID(as_uuid=True))))
+        ).all()
+        messages = {m["id"]: m for m in serializers.message_rows(msg_rows)}
+
+    counts = {}
+    if like_counts:
+        counts = dict(
+            db.session.query(Like.post_id, func.count(Like.id))
+            .filter(Like.post_id.in_(post_ids))
+            .group_by(Like.post_id)
+            .all()
+        )
+
+    return [
+        serializers.post(
+            p, authors.get(p.user_id), messages,
+            hearts=counts.get(p.id, 0) if like_counts else p.hearts,
+            anonymize=anonymize,
+        )
+        for p in posts
+    ]
+
+# post_ids 중 viewer가 좋아요한 글
+def liked_post_ids(viewer_id, post_ids):
+    from models import Like
+    if not post_ids:
+        return set()
+    return {
+        row.post_id for row in
+        db.session.query(Like.post_id).filter(Like.user_id == viewer_id, Like.post_id.in_(post_ids)).all()
+    }
+
+# 공유 payload를 복사해서 likedByMe만 채움
+def with_liked_by(payloads, viewer_id):
+    liked = liked_post_ids(viewer_id, [p["id"] for p in payloads]) if viewer_id else set()
+    return [dict(p, likedByMe=p["id"] in liked) for p in payloads]
+
+def build_post_payloads(posts, viewer_id=None, anonymize=True, like_counts=False, authors=None):
+    return with_liked_by(load_post_payloads(posts, anonymize, like_counts, authors), viewer_id)
+
+# 공유 payload를 복사해서 좋아요 수만 바꿈
+def with_hearts(payload, hearts):
+    return dict(payload, reactions=[dict(r, count=hearts) for r in payload["reactions"]])
+
+# 피드용 익명 payload (게시글 캐시 경유)
+def cached_post_payloads(posts):
+    by_key = {cache.post_key(p.id): p for p in posts}
+
+    def load_missing(keys):
+        bodies = load_post_payloads([by_key[key] for key in keys])
+        return {cache.post_key(body["id"]): body for body in bodies}
+
+    found = cache.get_many_or_load(list(by_key), load_missing, cache.POST_TTL)
+    # 캐시된 본문은 다른 워커가 받은 좋아요를 모를 수 있으므로 좋아요 수는 방금 읽은 행에서 가져온다
+    return [with_hearts(found[key], p.hearts) for key, p in by_key.items()]
+
+# 뷰어와 무관한 피드 페이지: (순위 점수, payload) 목록과 다음 페이지 위치
+def load_feed_page(version, position, limit):
+    rows, scores, next_position = feed.fetch_page(version, position, limit)
+    bodies = cached_post_payloads(rows)
+    return {"posts": list(zip(scores, bodies)), "next": next_position}
 
 # --- Community ---
 
@@ -481,18 +771,24 @@ def update_user_like_cnt(user_id):
 @require_auth
 def like_post(post_id):
     from models import Like, Post
-    post = Post.query.get(post_id)
-    if not post:
+    if not db.session.query(Post.id).filter_by(id=post_id).first():
         return jsonify({"error": "Post not found"}), 404
-    existing = Like.query.filter_by(user_id=g.user_id, post_id=post_id).first()
-    if existing:
+    # (user_id, post_id) 유니크 인덱스로 중복 좋아요를 원자적으로 걸러낸다
+    inserted = db.session.execute(
+        pg_insert(Like)
+        .values(user_id=g.user_id, post_id=post_id)
+        .on_conflict_do_nothing(index_elements=[Like.user_id, Like.post_id])
+        .returning(Like.id)
+    ).scalar()
+    if not inserted:
+        db.session.rollback()
         return jsonify({"message": "Already liked"}), 200
-    new_like = Like(user_id=g.user_id, post_id=post_id)
-    db.session.add(new_like)
-    # hearts +1
-    post.hearts = (post.hearts or 0) + 1
+    # hearts +1, like_cnt +1
+    counters.bump_post_hearts(post_id, 1)
+    counters.bump_user(g.user_id, like_cnt=1)
     db.session.commit()
-    update_user_like_cnt(g.user_id)
+    cache.invalidate(cache.post_key(post_id))
+    feed.bump_version()
     return jsonify({"message": "Liked"}), 201
 
 # 좋아요 취소
@@ -500,16 +796,18 @@ def like_post(post_id):
 @require_auth
 def unlike_post(post_id):
     from models import Like, Post
-    like = Like.query.filter_by(user_id=g.user_id, post_id=post_id).first()
-    if not like:
+    deleted = db.session.execute(
+        delete(Like).where(Like.user_id == g.user_id, Like.post_id == post_id).returning(Like.post_id)
+    ).scalar()
+    if not deleted:
+        db.session.rollback()
         return jsonify({"error": "Like not found"}), 404
-    post = Post.query.get(like.post_id)
-    db.session.delete(like)
-    # hearts -1 (최소 0)
-    if post and post.hearts and post.hearts > 0:
-        post.hearts -= 1
+    # hearts -1, like_cnt -1 (최소 0)
+    counters.bump_post_hearts(deleted, -1)
+    counters.bump_user(g.user_id, like_cnt=-1)
     db.session.commit()
-    update_user_like_cnt(g.user_id)
+    cache.invalidate(cache.post_key(deleted))
+    feed.bump_version()
     return jsonify({"message": "Unliked"}), 200
 
 @app.route('/community', methods=['POST'])
@@ -521,210 +819,100 @@ def create_community_post():
     is_anonymous = data.get('is_anonymous', False)
     
     # Create new post
+    now = get_current_time()
     new_post = Post(
         user_id=g.user_id,
         msgs=message_ids, # ARRAY(UUID)
         hearts=0,
-        is_anonymous=is_anonymous
+        is_anonymous=is_anonymous,
+        created_at=now,
+        hot_score=feed.hot_score(now, 0, now)
     )
     db.session.add(new_post)
     
-    # Update user stats
-    user = User.query.get(g.user_id)
-    if not user:
+    # Update user stats (내 글 목록은 POST.user_id 인덱스로 조회하므로 history 배열은 두지 않음)
+    if not counters.bump_user(g.user_id, post_cnt=1):
+        db.session.rollback()
         return jsonify({"error": "User not found"}), 404
-        
-    user.post_cnt = (user.post_cnt or 0) + 1
-    # Use post_history column, not posts relationship
-    current_history = list(user.post_history) if user.post_history else []
-    current_history.append(new_post.id)
-    user.post_history = current_history
     
     db.session.commit()
+    feed.bump_version()
     
-    author = user
-    post_msgs = []
-    if new_post.msgs:
-        for m_id in new_post.msgs:
-            msg = Message.query.get(m_id)
-            if msg:
-                post_msgs.append({
-                    "id": str(msg.id),
-                    "sender": "user" if msg.role == "user" else "bot",
-                    "content": msg.content,
-                    "timestamp": msg.created_at.isoformat() if msg.created_at else None
-                })
-
-    return jsonify({
-        "id": str(new_post.id),
-        "chatId": chat_id,
-        "messageIds": [str(m_id) for m_id in new_post.msgs] if new_post.msgs else [],
-        "messages": post_msgs,
-        "author": author.display_name if author else "Unknown",
-        "authorEmail": author.email if author else "",
-        "createdAt": new_post.created_at.isoformat() if new_post.created_at else None,
-        "reactions": [
-            {"type": "empathy", "count": new_post.hearts, "users": []}
-        ],
-        "comments": []
-    }), 201
+    result = build_post_payloads([new_post], anonymize=False)[0]
+    result.pop("likedByMe")
+    result["chatId"] = chat_id
+    return json_response(result, 201)
 
 @app.route('/community', methods=['GET'])
 @require_auth
 def get_community_posts():
-    # 최신순(생성일 내림차순)으로 정렬
-    posts = Post.query.order_by(Post.created_at.desc()).all()
-
-    import random
-    import math
-    from datetime import datetime, timezone
-
-    def score_post(post, now=None):
-        if now is None:
-            now = datetime.now(timezone.utc)
-
-        age_hours = (now - post.created_at).total_seconds() / 3600
-        time_score = math.exp(-age_hours / 24)  # 하루 기준 감쇠
-        heart_score = math.log1p(post.hearts)  # log(hearts + 1)
-        random_score = random.random()
-
-        # 가중치
-        W_TIME = 0.6
-        W_HEART = 0.35
-        W_RANDOM = 0.7
-
-        return (
-            W_TIME * time_score +
-            W_HEART * heart_score +
-            W_RANDOM * random_score
-        )
+    # 페이지네이션 파라미터가 없으면 기존처럼 전체 피드를 배열로 반환
+    paginated = 'limit' in request.args or 'cursor' in request.args
+    cursor = request.args.get('cursor')
+    session = request.args.get('session')
+    limit = page_size(request.args) if paginated else None
 
-    def sort_posts(posts):
-        now = datetime.now(timezone.utc)
-        return sorted(
-            posts,
-            key=lambda post: score_post(post, now),
-            reverse=True
-        )
-    posts = sort_posts(posts)
+    # 피드 버전은 글 작성/삭제, 좋아요, 랭킹 tick마다 증가한다 (likedByMe와 순서는 사용자별)
+    version = feed.feed_version()
+    etag = conditional.make_etag(version, g.user_id)
+    cached = conditional.not_modified(etag)
+    if cached:
+        return cached
 
-    results = []
-    from models import Like
-    for p in posts:
-        author = User.query.get(p.user_id)
-
-        # Fetch messages in the post
-        post_msgs = []
-        if p.msgs:
-            for m_id in p.msgs:
-                msg = Message.query.get(m_id)
-                if msg:
-                    post_msgs.append({
-                        "id": str(msg.id),
-                        "sender": "user" if msg.role == "user" else "bot",
-                        "content": msg.content,
-                        "timestamp": msg.created_at.isoformat() if msg.created_at else None,
-                    })
-
-        # 현재 로그인한 사용자가 이 포스트에 좋아요를 눌렀는지 확인
-        liked_by_me = False
-        if hasattr(g, 'user_id') and g.user_id:
-            liked_by_me = Like.query.filter_by(user_id=g.user_id, post_id=p.id).first() is not None
-
-        results.append({
-            "id": str(p.id),
-            "chatId": "", 
-            "messageIds": [str(m_id) for m_id in p.msgs] if p.msgs else [],
-            "messages": post_msgs,
-            "author": "익명의 사용자" if (p.is_anonymous or not author.display_name) else author.display_name,
-            "authorEmail": author.email if author else "",
-            "createdAt": p.created_at.isoformat() if p.created_at else None,
-            "reactions": [
-                {"type": "empathy", "count": p.hearts, "users": []}
-            ],
-            "likedByMe": liked_by_me,
-            "comments": [] # Comments are now fetched via /community/comment
-        })
+    try:
+        session, position = feed.resolve_cursor(cursor, session)
+    except InvalidCursor:
+        return jsonify({"error": "Invalid cursor"}), 400
 
-    # 최신순 정렬된 결과를 그대로 반환 (최신글이 배열 첫 번째에 오도록)
-    return jsonify(results)
+    # 페이지(순서 + 포스트 본문)는 피드 버전별로 모든 사용자가 공유하고,
+    # 세션 jitter와 likedByMe만 요청마다 얹는다
+    page = cache.get_or_load(
+        cache.feed_page_key(version, position, limit),
+        lambda: load_feed_page(version, position, limit),
+        cache.FEED_PAGE_TTL,
+    )
+    items = feed.shuffle_page(page["posts"], g.user_id, session, score=lambda item: item[0], post_id=lambda item: item[1]["id"])
+    results = with_liked_by([body for _, body in items], g.user_id)
+    next_cursor = feed.encode_feed_cursor(session, page["next"])
+    if not paginated:
+        return conditional.with_validators(json_response(results), etag)
+    payload = {"posts": results, "session": session, "nextCursor": next_cursor}
+    return conditional.with_validators(json_response(payload), etag)
 
 @app.route('/community/<post_id>', methods=['GET'])
 @require_auth
 def get_community_post(post_id):
-    from models import Post, User, Message, Like
-    post = Post.query.get(post_id)
-    if not post:
+    try:
+        key = cache.post_key(post_id)
+    except ValueError:
         return jsonify({"error": "Post not found"}), 404
-    author = User.query.get(post.user_id)
-    # Fetch messages in the post
-    post_msgs = []
-    if post.msgs:
-        for m_id in post.msgs:
-            msg = Message.query.get(m_id)
-            if msg:
-                post_msgs.append({
-                    "id": str(msg.id),
-                    "sender": "user" if msg.role == "user" else "bot",
-                    "content": msg.content,
-                    "timestamp": msg.created_at.isoformat() if msg.created_at else None,
-                })
-    # 현재 로그인한 사용자가 이 포스트에 좋아요를 눌렀는지 확인
-    liked_by_me = False
-    if hasattr(g, 'user_id') and g.user_id:
-        liked_by_me = Like.query.filter_by(user_id=g.user_id, post_id=post.id).first() is not None
-    result = {
-        "id": str(post.id),
-        "chatId": "",
-        "messageIds": [str(m_id) for m_id in post.msgs] if post.msgs else [],
-        "messages": post_msgs,
-        "author": "익명의 사용자" if (post.is_anonymous or not author.display_name) else author.display_name,
-        "authorEmail": author.email if author else "",
-        "createdAt": post.created_at.isoformat() if post.created_at else None,
-        "reactions": [
-            {"type": "empathy", "count": post.hearts, "users": []}
-        ],
-        "likedByMe": liked_by_me,
-        "comments": [] # Comments are now fetched via /community/comment
-    }
-    return jsonify(result)
+
+    def load():
+        post = db.session.query(*POST_COLUMNS).filter(Post.id == post_id).first()
+        return load_post_payloads([post])[0] if post else None
+
+    body = cache.get_or_load(key, load, cache.POST_TTL)
+    if body is None:
+        return jsonify({"error": "Post not found"}), 404
+    return json_response(with_liked_by([body], g.user_id)[0])
 
 @app.route('/community/<post_id>', methods=['DELETE'])
 @require_auth
 def delete_community_post(post_id):
-    post = Post.query.get(post_id)
-    if not post:
+    owner_id = db.session.query(Post.user_id).filter_by(id=post_id).scalar()
+    if not owner_id:
         return jsonify({"error": "Post not found"}), 404
-    if str(post.user_id) != str(g.user_id):
+    if str(owner_id) != str(g.user_id):
         return jsonify({"error": "Unauthorized"}), 403
-    # Delete related comments first, and update each comment author's stats (방법 C)
-    related_comments = Comment.query.filter_by(post_id=post_id).all()
-    for comment in related_comments:
-        comment_author = User.query.get(comment.user_id)
-        if comment_author:
-            comment_author.comment_cnt = max(0, (comment_author.comment_cnt or 1) - 1)
-            if comment_author.comment_history and str(comment.id) in [str(cid) for cid in comment_author.comment_history]:
-                comment_author.comment_history = [cid for cid in comment_author.comment_history if str(cid) != str(comment.id)]
-        db.session.delete(comment)
-    # Delete related likes and update like_cnt for each user
-    from models import Like
-    related_likes = Like.query.filter_by(post_id=post_id).all()
-    affected_user_ids = set()
-    for like in related_likes:
-        affected_user_ids.add(like.user_id)
-        db.session.delete(like)
-    db.session.delete(post)
+    # 댓글/좋아요를 한 번에 지우면서 작성자별 comment_cnt, like_cnt를 묶어서 차감 (한 트랜잭션)
+    counters.delete_post_rows("COMMENT", "comment_cnt", post_id)
+    counters.delete_post_rows("LIKE", "like_cnt", post_id)
+    db.session.execute(delete(Post).where(Post.id == post_id), execution_options={"synchronize_session": False})
     # Update user stats
-    user = User.query.get(g.user_id)
-    if user:
-        user.post_cnt = max(0, (user.post_cnt or 1) - 1)
-        if user.post_history and post_id in [str(pid) for pid in user.post_history]:
-            new_history = [pid for pid in user.post_history if str(pid) != str(post_id)]
-            user.post_history = new_history
+    counters.bump_user(g.user_id, post_cnt=-1)
     db.session.commit()
-    # 좋아요한 유저들의 like_cnt 갱신
-    for uid in affected_user_ids:
-        update_user_like_cnt(uid)
+    cache.invalidate(cache.post_key(post_id), cache.comments_key(post_id))
+    feed.bump_version()
     return jsonify({"message": "Post deleted"}), 200
 
 @app.route('/community/comment', methods=['POST'])
@@ -749,25 +937,16 @@ def create_community_comment():
     )
     db.session.add(new_comment)
     
-    # Update user stats (항상 DB 기준으로 재계산)
-    user = User.query.get(g.user_id)
+    # Update user stats
+    user = current_user()
     if not user:
         return jsonify({"error": "User not found"}), 404
-    user.comment_cnt = Comment.query.filter_by(user_id=g.user_id).count()
-    # Use comment_history column, not comments relationship
-    current_history = list(user.comment_history) if user.comment_history else []
-    current_history.append(new_comment.id)
-    user.comment_history = current_history
+    counters.bump_user(g.user_id, comment_cnt=1)
     
     db.session.commit()
+    cache.invalidate(cache.comments_key(post_id))
     
-    return jsonify({
-        "id": str(new_comment.id),
-        "author": "익명" if new_comment.anonymous else user.display_name,
-        "authorEmail": user.email,
-        "content": new_comment.content,
-        "timestamp": new_comment.created_at.isoformat() if new_comment.created_at else None
-    }), 201
+    return json_response(serializers.comment(new_comment, user.display_name, user.email), 201)
 
 @app.route('/community/comment', methods=['GET'])
 @require_auth
@@ -776,19 +955,29 @@ def get_community_comments():
     if not post_id:
         return jsonify({"error": "post_id is required"}), 400
     
-    comments = Comment.query.filter_by(post_id=post_id).all()
-    formatted_comments = []
-    for c in comments:
-        c_author = User.query.get(c.user_id)
-        formatted_comments.append({
-            "id": str(c.id),
-            "author": "익명" if c.anonymous else (c_author.display_name if c_author else "Unknown"),
-            "authorEmail": c_author.email if c_author else "",
-            "content": c.content,
-            "timestamp": c.created_at.isoformat() if c.created_at else None
-        })
-    
-    return jsonify(formatted_comments)
+    try:
+        key = cache.comments_key(post_id)
+    except ValueError:
+        return jsonify({"error": "Post not found"}), 404
+
+    def load():
+        # 댓글과 작성자 컬럼을 한 번의 조인으로 조회
+        rows = (
+            db.session.query(*serializers.COMMENT_COLUMNS, User.display_name, User.email)
+            .outerjoin(User, User.id == Comment.user_id)
+            .filter(Comment.post_id == post_id)
+            .all()
+        )
+        return [
+            serializers.comment(
+                row,
+                row.display_name if row.email is not None else "Unknown",
+                row.email or "",
+            )
+            for row in rows
+        ]
+
+    return json_response(cache.get_or_load(key, load, cache.COMMENTS_TTL))
 @app.route('/community/comment/<comment_id>', methods=['DELETE'])
 @require_auth
 def delete_community_comment(comment_id):
@@ -799,30 +988,25 @@ def delete_community_comment(comment_id):
     if str(comment.user_id) != str(g.user_id):
         return jsonify({"error": "Unauthorized"}), 403
         
+    post_id = comment.post_id
     db.session.delete(comment)
     
-    # Update user stats (항상 DB 기준으로 재계산)
-    user = User.query.get(g.user_id)
-    if user:
-        user.comment_cnt = Comment.query.filter_by(user_id=g.user_id).count()
-        if user.comment_history and comment_id in [str(cid) for cid in user.comment_history]:
-            new_history = [cid for cid in user.comment_history if str(cid) != str(comment_id)]
-            user.comment_history = new_history
-            
+    # Update user stats
+    counters.bump_user(g.user_id, comment_cnt=-1)
     db.session.commit()
+    cache.invalidate(cache.comments_key(post_id))
     return jsonify({"message": "Comment deleted"}), 200
 
 # --My Page--
 @app.route('/my', methods=['GET', 'PATCH'])
 @require_auth
 def manage_user_profile():
+    # 카운터를 보여주고 설정을 수정해야 하므로 캐시된 스냅샷 대신 행을 직접 조회
     user = User.query.get(g.user_id)
     if not user:
         return jsonify({"error": "User not found"}), 404
     
     if request.method == 'GET':
-        from models import Like
-        like_cnt = Like.query.filter_by(user_id=user.id).count()
         return jsonify({
             "user": {
                 "id": str(user.id),
@@ -835,7 +1019,7 @@ def manage_user_profile():
                 "style": user.style,
                 "postCnt": user.post_cnt,
                 "commentCnt": user.comment_cnt,
-                "likeCnt": like_cnt
+                "likeCnt": user.like_cnt or 0
             }
         })
     
@@ -857,132 +1041,123 @@ def manage_user_profile():
     if 'style' in data:
         user.style = data['style']
     db.session.commit()
+    invalidate_profile(user.id)
+    if 'name' in data:
+        # 피드의 작성자 이름이 바뀜: 이 사용자의 글과 댓글을 단 글의 캐시만 비운다
+        post_ids = [row.id for row in db.session.query(Post.id).filter(Post.user_id == user.id)]
+        commented = [row.post_id for row in db.session.query(Comment.post_id).filter(Comment.user_id == user.id).distinct()]
+        cache.invalidate(
+            *(cache.post_key(p_id) for p_id in post_ids),
+            *(cache.comments_key(p_id) for p_id in commented),
+        )
+        feed.bump_version()
     return jsonify({"message": "Settings updated successfully"})
 
 @app.route('/my/posts', methods=['GET'])
 @require_auth
 def get_my_posts():
-    user = User.query.get(g.user_id)
+    user = current_user()
     if not user:
         return jsonify({"error": "User not found"}), 404
         
-    posts = Post.query.filter_by(user_id=g.user_id).all()
-    results = []
-    
-    for p in posts:
-        # Fetch messages in the post
-        post_msgs = []
-        if p.msgs:
-            for m_id in p.msgs:
-                msg = Message.query.get(m_id)
-                if msg:
-                    post_msgs.append({
-                        "id": str(msg.id),
-                        "sender": "user" if msg.role == "user" else "bot",
-                        "content": msg.content,
-                        "timestamp": msg.created_at.isoformat() if msg.created_at else None
-                    })
-        
-        # Comments for this post (optional, but CommunityPage logic expects it)
-        # However, for MyPage we just need the post itself
-        results.append({
-            "id": str(p.id),
-            "chatId": "", # Not strictly needed for MyPage but kept for interface consistency
-            "messageIds": [str(m_id) for m_id in p.msgs] if p.msgs else [],
-            "messages": post_msgs,
-            "author": user.display_name,
-            "authorEmail": user.email,
-            "originalAuthorEmail": user.email,
-            "createdAt": p.created_at.isoformat() if p.created_at else None,
-            "reactions": [
-                {"type": "empathy", "count": p.hearts, "users": []} # Simplified
-            ],
-            "comments": [] 
-        })
+    posts = db.session.query(*POST_COLUMNS).filter(Post.user_id == g.user_id).all()
+    results = build_post_payloads(posts, anonymize=False)
+    for post in results:
+        # MyPage에서는 likedByMe가 필요 없고, 원 작성자 이메일만 추가
+        post.pop("likedByMe")
+        post["originalAuthorEmail"] = user.email
     
-    return jsonify(results)
+    return json_response(results)
 
 @app.route('/my/comments', methods=['GET'])
 @require_auth
 def get_my_comments():
-    user = User.query.get(g.user_id)
+    user = current_user()
     if not user:
         return jsonify({"error": "User not found"}), 404
-        
-    comments = Comment.query.filter_by(user_id=g.user_id).all()
+
+    # 댓글 + 원글 + 원글의 첫 메시지를 한 번의 조인으로 조회
+    first_msg = aliased(Message)
+    query = (
+        db.session.query(*serializers.COMMENT_COLUMNS, first_msg.content.label('first_content'))
+        .outerjoin(Post, Post.id == Comment.post_id)
+        .outerjoin(first_msg, first_msg.id == Post.msgs[1])
+        .filter(Comment.user_id == g.user_id)
+        .order_by(Comment.created_at.desc(), Comment.id.desc())
+    )
+    paginated = 'limit' in request.args or 'cursor' in request.args
+    if paginated:
+        try:
+            rows, next_cursor = keyset_page(query, request.args, Comment.created_at, Comment.id)
+        except InvalidCursor:
+            return jsonify({"error": "Invalid cursor"}), 400
+    else:
+        rows, next_cursor = query.all(), None
+
     results = []
-    
-    for c in comments:
-        post = Post.query.get(c.post_id)
+    for c in rows:
         post_content = ""
-        if post and post.msgs:
-            first_msg = Message.query.get(post.msgs[0])
-            if first_msg:
-                post_content = first_msg.content[:50] + "..." if len(first_msg.content) > 50 else first_msg.content
-
-        results.append({
-            "id": str(c.id),
-            "postId": str(c.post_id),
+        if c.first_content:
+            post_content = c.first_content[:50] + "..." if len(c.first_content) > 50 else c.first_content
+
+        result = serializers.comment(c, user.display_name, user.email)
+        result.update({
+            "postId": c.post_id,
             "postContent": post_content,
-            "author": "익명" if c.anonymous else user.display_name,
-            "authorEmail": user.email,
             "originalAuthorEmail": user.email,
-            "content": c.content,
-            "timestamp": c.created_at.isoformat() if c.created_at else None
         })
-        
-    return jsonify(results)
+        results.append(result)
+
+    if not paginated:
+        return json_response(results)
+    return json_response({"comments": results, "nextCursor": next_cursor})
 
 # 내가 좋아요한 포스트 목록 조회
 @app.route('/my/likes', methods=['GET'])
 @require_auth
 def get_my_likes():
-    user = User.query.get(g.user_id)
+    user = current_user()
     if not user:
         return jsonify({"error": "User not found"}), 404
 
-    from models import Like, Post
-    likes = Like.query.filter_by(user_id=g.user_id).order_by(Like.created_at.desc()).all()
-    post_ids = [like.post_id for like in likes]
-    posts = Post.query.filter(Post.id.in_(post_ids)).all()
+    from models import Like
+    # 좋아요 + 포스트 + 작성자를 한 번의 조인으로 조회 (Like.created_at 최신순)
+    query = (
+        db.session.query(Like.created_at, Like.id, Bundle('post', *POST_COLUMNS), Bundle('author', *AUTHOR_COLUMNS))
+        .join(Post, Post.id == Like.post_id)
+        .join(User, User.id == Post.user_id)
+        .filter(Like.user_id == g.user_id)
+        .order_by(Like.created_at.desc(), Like.id.desc())
+    )
+    paginated = 'limit' in request.args or 'cursor' in request.args
+    if paginated:
+        try:
+            rows, next_cursor = keyset_page(query, request.args, Like.created_at, Like.id, key=lambda row: row[:2])
+        except InvalidCursor:
+            return jsonify({"error": "Invalid cursor"}), 400
+    else:
+        rows, next_cursor = query.all(), None
 
-    # 최신순으로 정렬 (Like.created_at 기준)
-    post_dict = {str(post.id): post for post in posts}
-    results = []
-    for like in likes:
-        post = post_dict.get(str(like.post_id))
-        if not post:
-            continue
-        author = User.query.get(post.user_id)
-        # Fetch messages in the post
-        post_msgs = []
-        if post.msgs:
-            for m_id in post.msgs:
-                msg = Message.query.get(m_id)
-                if msg:
-                    post_msgs.append({
-                        "id": str(msg.id),
-                        "sender": "user" if msg.role == "user" else "bot",
-                        "content": msg.content,
-                        "timestamp": msg.created_at.isoformat() if msg.created_at else None
-                    })
-        from models import Like as LikeModel
-        like_count = db.session.query(LikeModel).filter_by(post_id=post.id).count()
-        results.append({
-            "id": str(post.id),
-            "chatId": "",
-            "messageIds": [str(m_id) for m_id in post.msgs] if post.msgs else [],
-            "messages": post_msgs,
-            "author": author.display_name if author else "Unknown",
-            "authorEmail": author.email if author else "",
-            "createdAt": post.created_at.isoformat() if post.created_at else None,
-            "reactions": [
-                {"type": "empathy", "count": like_count, "users": []}
-            ],
-            "likedByMe": True,
-            "comments": [] # Comments are now fetched via /community/comment
-        })
-    return jsonify({"count": len(results), "posts": results})
+    posts = [post for _, _, post, _ in rows]
+    authors = {author.id: author for _, _, _, author in rows}
+    # 좋아요 수는 GROUP BY 한 번으로 집계
+    results = build_post_payloads(posts, anonymize=False, like_counts=True, authors=authors)
+    for post in results:
+        post["likedByMe"] = True
+    response = {"count": len(results), "posts": results}
+    if paginated:
+        response["nextCursor"] = next_cursor
+    return json_response(response)
+
+# 운영용 지표: 내부 토큰 필요 (공개 포트에서는 nginx도 막는다)
+@app.route('/metrics/background', methods=['GET'])
+@require_metrics_token
+def background_metrics():
+    return jsonify({
+        "botJobs": jobs.queue_stats(db.session),
+        "chatListener": {"connected": chat_events.listener.connected, "waiting": chat_events.listener.waiting()},
+        "streams": {"active": _active_streams, "max": STREAM_MAX_ACTIVE},
+    })
 
 @app.route('/test')
 def test_connection():
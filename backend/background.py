@@ -0,0 +1,100 @@
+"""
+Shared resources for work done outside the request cycle.
+
+Session is a session factory bound to the app's pooled engine, so background
+jobs reuse the same connection pool as the web requests instead of building
+an engine per job. BoundedExecutor runs jobs on a fixed number of threads,
+rejects new work once its queue is full and keeps queue-depth and wait-time
+counters (worker.py uses it to bound its in-flight bot jobs).
+"""
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy.orm import sessionmaker
+
+from models import db
+
+WAIT_SAMPLES = 200  # 대기 시간 통계에 쓰는 최근 작업 수
+
+Session = sessionmaker()
+
+
+def init_app(app):
+    """Bind Session to the Flask-SQLAlchemy engine (one pool per process)."""
+    with app.app_context():
+        Session.configure(bind=db.engine)
+
+
+class BoundedExecutor:
+    """
+    Thread pool with at most `max_workers` running and `queue_limit` waiting
+    jobs. submit() returns None instead of queueing past the limit.
+    """
+
+    def __init__(self, max_workers, queue_limit, name):
+        self.name = name
+        self.max_workers = max_workers
+        self.queue_limit = queue_limit
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._slots = threading.BoundedSemaphore(max_workers + queue_limit)
+        self._lock = threading.Lock()
+        self._waits = deque(maxlen=WAIT_SAMPLES)
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def has_capacity(self):
+        with self._lock:
+            return self.queued + self.running < self.max_workers + self.queue_limit
+
+    def submit(self, fn, *args, **kwargs):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            return None
+        submitted_at = time.monotonic()
+        with self._lock:
+            self.queued += 1
+
+        def run():
+            with self._lock:
+                self.queued -= 1
+                self.running += 1
+                self._waits.append(time.monotonic() - submitted_at)
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                with self._lock:
+                    self.failed += 1
+                print(f"{self.name} job failed: {e}")
+                raise
+            finally:
+                with self._lock:
+                    self.running -= 1
+                    self.completed += 1
+                self._slots.release()
+
+        return self._pool.submit(run)
+
+    def stats(self):
+        with self._lock:
+            waits = sorted(self._waits)
+            return {
+                "workers": self.max_workers,
+                "queueLimit": self.queue_limit,
+                "queueDepth": self.queued,
+                "running": self.running,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "waitSecondsAvg": sum(waits) / len(waits) if waits else 0.0,
+                "waitSecondsP95": waits[min(len(waits) - 1, int(len(waits) * 0.95))] if waits else 0.0,
+                "waitSecondsMax": waits[-1] if waits else 0.0,
+            }
+
+    def shutdown(self, wait=True):
+        self._pool.shutdown(wait=wait)
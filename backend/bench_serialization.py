@@ -0,0 +1,117 @@
+"""
+Microbenchmark: serialize a 1,000-post feed the old way (hand-built dicts with
+str()/isoformat() sent through jsonify) and through serializers.py.
+
+No database is needed; rows are synthesized in memory with the same shape the
+feed query returns.
+
+    python bench_serialization.py --posts 1000 --messages 4 --repeat 20
+"""
+import argparse
+import datetime
+import random
+import statistics
+import time
+import uuid
+from collections import namedtuple
+
+from flask import Flask, jsonify
+
+import serializers
+
+PostRow = namedtuple('PostRow', ['id', 'user_id', 'msgs', 'hearts', 'is_anonymous', 'created_at', 'hot_score'])
+AuthorRow = namedtuple('AuthorRow', ['id', 'display_name', 'email'])
+MessageRow = namedtuple('MessageRow', ['id', 'role', 'content', 'created_at'])
+
+
+def synthesize(n_posts, n_messages, n_authors=200):
+    now = datetime.datetime.now(datetime.timezone.utc)
+    authors = [AuthorRow(uuid.uuid4(), f"user{i}", f"user{i}@example.com") for i in range(n_authors)]
+    posts, messages = [], []
+    for i in range(n_posts):
+        msgs = []
+        for j in range(n_messages):
+            msg = MessageRow(uuid.uuid4(), "user" if j % 2 == 0 else "bot", "오늘 하루 어땠어? " * 8,
+                             now - datetime.timedelta(minutes=i * 10 + j))
+            messages.append(msg)
+            msgs.append(msg.id)
+        posts.append(PostRow(uuid.uuid4(), random.choice(authors).id, msgs, random.randint(0, 50),
+                             i % 7 == 0, now - datetime.timedelta(hours=i), random.random()))
+    return posts, {a.id: a for a in authors}, messages
+
+
+# --- Previous path (copied from app.py before serializers.py) ---
+
+def legacy_format_message(msg):
+    return {
+        "id": str(msg.id),
+        "sender": "user" if msg.role == "user" else "bot",
+        "content": msg.content,
+        "timestamp": msg.created_at.isoformat() if msg.created_at else None
+    }
+
+
+def legacy_feed(posts, authors, messages):
+    messages = {m.id: m for m in messages}
+    results = []
+    for p in posts:
+        author = authors.get(p.user_id)
+        post_msgs = [legacy_format_message(messages[m_id]) for m_id in (p.msgs or []) if m_id in messages]
+        author_name = "익명의 사용자" if (p.is_anonymous or not author or not author.display_name) else author.display_name
+        results.append({
+            "id": str(p.id),
+            "chatId": "",
+            "messageIds": [str(m_id) for m_id in p.msgs] if p.msgs else [],
+            "messages": post_msgs,
+            "author": author_name,
+            "authorEmail": author.email if author else "",
+            "createdAt": p.created_at.isoformat() if p.created_at else None,
+            "reactions": [{"type": "empathy", "count": p.hearts, "users": []}],
+            "likedByMe": False,
+            "comments": []
+        })
+    return jsonify(results).get_data()
+
+
+# --- serializers.py ---
+
+def serializer_feed(posts, authors, messages):
+    messages = {m["id"]: m for m in serializers.message_rows(messages)}
+    results = [serializers.post(p, authors.get(p.user_id), messages, hearts=p.hearts) for p in posts]
+    return serializers.json_response(results).get_data()
+
+
+def bench(fn, args, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        body = fn(*args)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings), min(timings), len(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--posts', type=int, default=1000)
+    parser.add_argument('--messages', type=int, default=4, help='messages attached to each post')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    random.seed(0)
+    data = synthesize(args.posts, args.messages)
+    app = Flask(__name__)
+    encoder = "orjson" if serializers.orjson is not None else "json (orjson not installed)"
+    print(f"{args.posts} posts x {args.messages} messages, {args.repeat} runs, encoder: {encoder}")
+    with app.app_context():
+        results = [
+            ("jsonify + hand-built dicts", bench(legacy_feed, data, args.repeat)),
+            ("serializers.json_response", bench(serializer_feed, data, args.repeat)),
+        ]
+    baseline = results[0][1][0]
+    for name, (median, best, size) in results:
+        print(f"{name:<28} median {median * 1000:8.2f} ms  best {best * 1000:8.2f} ms  "
+              f"{size / 1024:8.1f} KiB  x{baseline / median:.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+"""
+Read-through cache for community reads.
+
+The default backend is an in-process LRU with per-entry TTL. Anything with
+the same get_many/set/delete methods (e.g. a Redis-backed class) can be
+installed with set_backend(); only the backend has to be shared between
+processes, the single-flight coalescing below is always per process.
+
+Cached values are shared between requests and threads: treat them as
+read-only and copy before adding per-user fields.
+
+With the in-process backend, invalidation only reaches the worker that made
+the write, so other gunicorn workers can serve a stale post body for up to
+POST_TTL seconds. Feed pages are keyed by the feed version and take the
+hearts count from the POST rows read for that page, not from the cached
+body; the rest of a body (author, messages) can still lag by POST_TTL.
+"""
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+MAX_ENTRIES = int(os.getenv('CACHE_MAX_ENTRIES', '10000'))
+POST_TTL = int(os.getenv('CACHE_POST_TTL_SECONDS', '60'))
+FEED_PAGE_TTL = int(os.getenv('CACHE_FEED_PAGE_TTL_SECONDS', '60'))
+COMMENTS_TTL = int(os.getenv('CACHE_COMMENTS_TTL_SECONDS', '60'))
+
+
+class LocalCache:
+    """Thread-safe LRU cache with a per-entry TTL."""
+
+    def __init__(self, max_entries=MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def get_many(self, keys):
+        now = time.monotonic()
+        found = {}
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                if entry[0] <= now:
+                    del self._entries[key]
+                    continue
+                self._entries.move_to_end(key)
+                found[key] = entry[1]
+        return found
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_backend = LocalCache()
+
+
+def get_backend():
+    return _backend
+
+
+def set_backend(backend):
+    global _backend
+    _backend = backend
+
+
+# --- Single flight ---
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+_flights = {}
+_flights_lock = threading.Lock()
+
+
+def _single_flight(key, load):
+    """Run `load` once per key at a time; concurrent callers wait for its result."""
+    with _flights_lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = _Flight()
+    if not leader:
+        flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.value
+    try:
+        flight.value = load()
+        return flight.value
+    except Exception as e:
+        flight.error = e
+        raise
+    finally:
+        with _flights_lock:
+            _flights.pop(key, None)
+        flight.done.set()
+
+
+# --- Read-through API ---
+
+def get_or_load(key, load, ttl):
+    """
+    Return the cached value for `key`, or call `load()` (once across
+    concurrent misses) and cache its result. None results are not cached.
+    """
+    found = _backend.get_many([key])
+    if key in found:
+        return found[key]
+
+    def fill():
+        value = load()
+        if value is not None:
+            _backend.set(key, value, ttl)
+        return value
+    return _single_flight(key, fill)
+
+
+def get_many_or_load(keys, load_missing, ttl):
+    """
+    Return {key: value} for `keys`. Keys not in the cache are loaded together
+    with `load_missing(missing_keys) -> {key: value}` and cached.
+    """
+    found = _backend.get_many(keys)
+    missing = [key for key in keys if key not in found]
+    if missing:
+        loaded = load_missing(missing)
+        for key, value in loaded.items():
+            if value is not None:
+                _backend.set(key, value, ttl)
+        found.update(loaded)
+    return found
+
+
+def invalidate(*keys):
+    _backend.delete(*keys)
+
+
+# --- Keys ---
+# id는 UUID로 정규화해서 같은 글이 항상 같은 키가 되게 한다 (잘못된 id는 ValueError)
+
+def post_key(post_id):
+    return f"post:{uuid.UUID(str(post_id))}"
+
+
+def comments_key(post_id):
+    return f"comments:{uuid.UUID(str(post_id))}"
+
+
+def feed_page_key(version, position, limit):
+    if position is None:
+        where = "first"
+    else:
+        snapshot, offset, after = position
+        where = f"{snapshot}:{offset}" if offset is not None else f"{snapshot}:{after[0]!r}:{after[1]}"
+    return f"feed:{version}:{where}:{limit if limit is not None else 'all'}"
@@ -0,0 +1,101 @@
+"""
+Conversation change notifications over Postgres LISTEN/NOTIFY.
+
+Writers call notify() inside the transaction that changes a conversation;
+Postgres delivers the notification only if that transaction commits. Each web
+process keeps ONE listening connection (ChatListener) and wakes every request
+waiting on the notified conversation, so long-polling clients cost a thread
+each but no database connection while they wait.
+"""
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+import psycopg
+from sqlalchemy import text
+
+CHANNEL = 'chat_events'
+RECONNECT_SECONDS = 5
+
+
+def notify(session, conversation_id):
+    """Queue a notification for `conversation_id`; sent when the session commits."""
+    session.execute(text('SELECT pg_notify(:channel, :payload)'), {"channel": CHANNEL, "payload": str(conversation_id)})
+
+
+class ChatListener:
+    """One LISTEN connection per process, fanned out to in-process waiters."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._waiters = defaultdict(set)
+        self._thread = None
+        self.connected = False
+
+    def start(self, conninfo):
+        with self._lock:
+            if self._thread is not None:
+                return self._thread
+            self._thread = threading.Thread(target=self._run, args=(conninfo,), name="chat-listener", daemon=True)
+        self._thread.start()
+        return self._thread
+
+    @contextmanager
+    def subscribe(self, conversation_id):
+        """
+        Yield an Event that is set when `conversation_id` is notified.
+        Subscribe BEFORE reading the current state, otherwise a notification
+        that arrives between the read and the wait is lost.
+        """
+        key = str(conversation_id)
+        event = threading.Event()
+        with self._lock:
+            self._waiters[key].add(event)
+        try:
+            yield event
+        finally:
+            with self._lock:
+                waiters = self._waiters.get(key)
+                if waiters is not None:
+                    waiters.discard(event)
+                    if not waiters:
+                        del self._waiters[key]
+
+    def waiting(self):
+        with self._lock:
+            return sum(len(w) for w in self._waiters.values())
+
+    def _wake(self, key=None):
+        with self._lock:
+            if key is None:
+                events = [e for waiters in self._waiters.values() for e in waiters]
+            else:
+                events = list(self._waiters.get(key, ()))
+        for event in events:
+            event.set()
+
+    def _run(self, conninfo):
+        while True:
+            try:
+                with psycopg.connect(conninfo, autocommit=True) as conn:
+                    conn.execute(f'LISTEN {CHANNEL}')
+                    self.connected = True
+                    # 연결이 끊긴 동안 놓친 알림이 있을 수 있으니 모두 깨워서 DB를 다시 보게 한다
+                    self._wake()
+                    for notification in conn.notifies():
+                        self._wake(notification.payload)
+            except Exception as e:
+                print(f"Chat listener error: {e}")
+            self.connected = False
+            self._wake()
+            time.sleep(RECONNECT_SECONDS)
+
+
+listener = ChatListener()
+
+
+def start_listener(engine):
+    """Start the process-wide listener on the database behind `engine`."""
+    conninfo = engine.url.set(drivername='postgresql').render_as_string(hide_password=False)
+    return listener.start(conninfo)
@@ -0,0 +1,41 @@
+"""
+Conditional GET support.
+
+Routes compute a cheap validator (a version counter, or count + max timestamp
+from an index) before doing any real work, return not_modified() early when
+the client already has that version, and otherwise attach the validator to
+the full response with with_validators().
+"""
+import hashlib
+
+from flask import Response, request
+
+
+def make_etag(*parts):
+    """Strong ETag value for the given validator parts plus the query string."""
+    raw = "|".join(str(part) for part in parts) + "?" + request.query_string.decode()
+    return hashlib.sha1(raw.encode()).hexdigest()[:32]
+
+
+def with_validators(response, etag, last_modified=None):
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    # 브라우저/프록시가 매번 재검증하도록 (응답은 사용자별)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def not_modified(etag, last_modified=None):
+    """
+    Return a 304 response if the request's If-None-Match / If-Modified-Since
+    still matches, else None. If-None-Match wins when both are sent.
+    """
+    if request.if_none_match:
+        if not request.if_none_match.contains(etag):
+            return None
+    elif last_modified is None or request.if_modified_since is None:
+        return None
+    elif last_modified.replace(microsecond=0) > request.if_modified_since:
+        return None
+    return with_validators(Response(status=304), etag, last_modified)
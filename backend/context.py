@@ -0,0 +1,172 @@
+"""
+Prompt context for bot replies: a rolling summary of the older conversation
+plus the most recent turns that fit a token budget.
+
+Token counts come from the inference server's /tokenize (the model's own
+tokenizer) and are cached in MESSAGE.content_len, so each message is
+tokenized once instead of on every turn. Turns that fall out of the window
+are folded into CONVERSATION.summary by update_summary(), which the worker
+runs after a reply; it only calls the model once the unsummarized dropped
+turns add up to SUMMARY_TRIGGER_TOKENS. The inference server adds a fixed
+system prompt on top, so the prompt size stays roughly constant however long
+the conversation gets.
+"""
+import os
+
+from sqlalchemy import bindparam, update, tuple_
+
+import inference_client
+from models import Conversation, Message
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv('CONTEXT_TOKEN_BUDGET', '1500'))
+# 한 번에 살펴보는 최근 메시지 수 (예산보다 훨씬 많은 토큰을 덮을 만큼)
+CONTEXT_MAX_MESSAGES = int(os.getenv('CONTEXT_MAX_MESSAGES', '100'))
+# 메시지마다 chat template이 붙이는 역할/구분 토큰
+MESSAGE_TOKEN_OVERHEAD = 4
+TOKENIZE_PATH = '/tokenize'
+SUMMARIZE_PATH = '/summarize'
+SUMMARY_TRIGGER_TOKENS = int(os.getenv('SUMMARY_TRIGGER_TOKENS', '800'))
+# 한 번의 요약에 넣는 최대 메시지 수 (밀린 대화는 다음 턴들에서 이어서 요약)
+SUMMARY_MAX_MESSAGES = int(os.getenv('SUMMARY_MAX_MESSAGES', '60'))
+SUMMARY_MAX_CHARS = 2000
+
+
+def estimate_tokens(content):
+    # 토크나이저를 못 쓸 때의 보수적인 추정 (한국어는 대략 글자당 1토큰 이하)
+    return len(content or "")
+
+
+def fill_token_counts(session, rows):
+    """
+    Return {message id: token count} for `rows` (id, content, content_len),
+    tokenizing only the messages without a cached count and storing those.
+    If the inference server can't tokenize, estimates are used and not stored.
+    """
+    counts = {row.id: row.content_len for row in rows if row.content_len is not None}
+    missing = [row for row in rows if row.content_len is None]
+    if not missing:
+        return counts
+    try:
+        result = inference_client.client.post(TOKENIZE_PATH, {"texts": [row.content or "" for row in missing]})
+        tokenized = result["counts"]
+        if len(tokenized) != len(missing):
+            raise inference_client.InferenceError("tokenize returned a different number of counts")
+    except (inference_client.InferenceError, KeyError, TypeError) as e:
+        print(f"Tokenize failed, estimating token counts: {e}")
+        counts.update((row.id, estimate_tokens(row.content)) for row in missing)
+        return counts
+
+    # Core 테이블로 executemany (ORM bulk update는 WHERE를 직접 줄 수 없다)
+    table = Message.__table__
+    session.execute(
+        update(table).where(table.c.id == bindparam('msg_id')).values(content_len=bindparam('tokens')),
+        [{"msg_id": row.id, "tokens": tokens} for row, tokens in zip(missing, tokenized)],
+    )
+    counts.update((row.id, tokens) for row, tokens in zip(missing, tokenized))
+    return counts
+
+
+def _message_key():
+    return tuple_(Message.created_at, Message.id)
+
+
+def _chat(rows):
+    return [{"role": "user" if row.role == "user" else "assistant", "content": row.content} for row in rows]
+
+
+def window_rows(session, conversation_id, budget=None, since=None):
+    """
+    The newest messages whose token counts add up to at most `budget`, oldest
+    first, only counting messages after `since` ((created_at, id) of the last
+    summarized message). The newest message is always included.
+    """
+    budget = CONTEXT_TOKEN_BUDGET if budget is None else budget
+    query = (
+        session.query(Message.id, Message.role, Message.content, Message.content_len, Message.created_at)
+        .filter(Message.conversation_id == conversation_id)
+    )
+    if since is not None:
+        query = query.filter(_message_key() > tuple_(*since))
+    rows = query.order_by(Message.created_at.desc(), Message.id.desc()).limit(CONTEXT_MAX_MESSAGES).all()
+    counts = fill_token_counts(session, rows)
+
+    window = []
+    used = 0
+    for row in rows:
+        cost = counts[row.id] + MESSAGE_TOKEN_OVERHEAD
+        if window and used + cost > budget:
+            break
+        window.append(row)
+        used += cost
+    window.reverse()
+    return window
+
+
+def _summary_state(session, conversation_id):
+    return (
+        session.query(Conversation.summary, Conversation.summary_through_at, Conversation.summary_through_id)
+        .filter(Conversation.id == conversation_id)
+        .first()
+    )
+
+
+def _since(state):
+    if state is None or state.summary_through_id is None:
+        return None
+    return state.summary_through_at, state.summary_through_id
+
+
+def build_context(session, conversation_id):
+    """Return (recent chat messages, summary of everything before them or None)."""
+    state = _summary_state(session, conversation_id)
+    rows = window_rows(session, conversation_id, since=_since(state))
+    return _chat(rows), state.summary if state else None
+
+
+def update_summary(session, conversation_id):
+    """
+    Fold the turns between the current summary and the reply window into the
+    summary once they reach SUMMARY_TRIGGER_TOKENS. Returns True if the
+    summary was updated. Safe to run concurrently: the write only applies if
+    the summary did not move in the meantime.
+    """
+    state = _summary_state(session, conversation_id)
+    if state is None:
+        return False
+    since = _since(state)
+    window = window_rows(session, conversation_id, since=since)
+    if not window:
+        session.commit()
+        return False
+
+    query = (
+        session.query(Message.id, Message.role, Message.content, Message.content_len, Message.created_at)
+        .filter(Message.conversation_id == conversation_id, _message_key() < tuple_(window[0].created_at, window[0].id))
+    )
+    if since is not None:
+        query = query.filter(_message_key() > tuple_(*since))
+    dropped = query.order_by(Message.created_at.asc(), Message.id.asc()).limit(SUMMARY_MAX_MESSAGES).all()
+    counts = fill_token_counts(session, dropped)
+    # 토큰 수 캐시는 요약 호출 전에 커밋해서 커넥션을 돌려준다
+    session.commit()
+    if sum(counts.values()) < SUMMARY_TRIGGER_TOKENS:
+        return False
+
+    result = inference_client.client.post(SUMMARIZE_PATH, {"summary": state.summary, "messages": _chat(dropped)})
+    summary = (result.get("summary") or "").strip()[:SUMMARY_MAX_CHARS]
+    if not summary:
+        raise inference_client.InferenceError("summarize returned an empty summary")
+
+    last = dropped[-1]
+    updated = session.execute(
+        update(Conversation)
+        .where(
+            Conversation.id == conversation_id,
+            Conversation.summary_through_id.is_not_distinct_from(state.summary_through_id),
+        )
+        .values(summary=summary, summary_through_at=last.created_at, summary_through_id=last.id),
+        execution_options={"synchronize_session": False},
+    )
+    session.commit()
+    return updated.rowcount == 1
+
@@ -0,0 +1,177 @@
+"""
+Atomic maintenance of the USER and POST counter columns.
+
+Writes change counters with a single `UPDATE ... SET x = x + delta RETURNING`
+so concurrent likes/comments never lose updates and no write recounts a
+table. reconcile_counters() repairs any drift in bulk; it runs under
+REPEATABLE READ so a write that commits while it recounts makes it retry
+instead of being overwritten with the stale count.
+"""
+import os
+import threading
+import time
+
+from sqlalchemy import update, func, select, text
+from sqlalchemy.exc import OperationalError
+
+from models import db, User, Post, Comment, Like
+import feed
+import cache
+
+RECONCILE_SECONDS = int(os.getenv('COUNTER_RECONCILE_SECONDS', '3600'))
+RECONCILE_LOCK_ID = 0x636f756e74657273  # pg advisory lock key ("counters")
+RECONCILE_ATTEMPTS = 5
+SERIALIZATION_FAILURE = '40001'
+
+USER_COUNTERS = ('post_cnt', 'comment_cnt', 'like_cnt')
+
+
+def bump_user(user_id, **deltas):
+    """
+    Add the given deltas to USER counters in one statement, clamped at 0.
+    Returns the new values as a row, or None if the user does not exist.
+    """
+    values = {}
+    for name, delta in deltas.items():
+        if name not in USER_COUNTERS:
+            raise ValueError(f"Unknown user counter: {name}")
+        column = getattr(User, name)
+        values[name] = func.greatest(func.coalesce(column, 0) + delta, 0)
+    stmt = (
+        update(User)
+        .where(User.id == user_id)
+        .values(**values)
+        .returning(*(getattr(User, name) for name in deltas))
+    )
+    return db.session.execute(stmt, execution_options={"synchronize_session": False}).first()
+
+
+def bump_post_hearts(post_id, delta):
+    """Change POST.hearts by `delta` and rescore the post in the same statement."""
+    hearts = func.greatest(func.coalesce(Post.hearts, 0) + delta, 0)
+    stmt = (
+        update(Post)
+        .where(Post.id == post_id)
+        .values(hearts=hearts, hot_score=feed.hot_score_expr(hearts=hearts))
+        .returning(Post.hearts)
+    )
+    return db.session.execute(stmt, execution_options={"synchronize_session": False}).scalar()
+
+
+def delete_post_rows(table, counter, post_id):
+    """
+    Delete every row of `table` ("COMMENT" or "LIKE") that belongs to a post
+    and subtract each author's share from their USER `counter`, in one
+    statement. Counting the rows the DELETE actually removed keeps counters
+    exact even if rows are added concurrently.
+    """
+    if (table, counter) not in (('COMMENT', 'comment_cnt'), ('LIKE', 'like_cnt')):
+        raise ValueError(f"Unsupported cascade: {table}.{counter}")
+    return db.session.execute(text(f'''
+        WITH gone AS (
+            DELETE FROM "{table}" WHERE post_id = :post_id RETURNING user_id
+        ), per_user AS (
+            SELECT user_id, count(*) AS cnt FROM gone GROUP BY user_id
+        )
+        UPDATE "USER" u
+        SET {counter} = greatest(coalesce(u.{counter}, 0) - per_user.cnt, 0)
+        FROM per_user
+        WHERE u.id = per_user.user_id
+    '''), {"post_id": post_id}).rowcount
+
+
+def _is_serialization_failure(error):
+    return getattr(error.orig, 'sqlstate', None) == SERIALIZATION_FAILURE
+
+
+def reconcile_counters(session=None, lock_key=None):
+    """
+    Recompute every counter from the source tables and fix rows that drifted.
+    Returns (users_fixed, posts_fixed), or None if `lock_key` is given and
+    another process holds that advisory lock.
+    """
+    session = session or db.session
+    for attempt in range(RECONCILE_ATTEMPTS):
+        # 스냅샷 이후 다른 트랜잭션이 바꾼 행을 덮어쓰려 하면 serialization failure로 처음부터 다시 센다
+        session.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+        try:
+            if lock_key is not None:
+                got_lock = session.execute(text('SELECT pg_try_advisory_xact_lock(:key)'), {"key": lock_key}).scalar()
+                if not got_lock:
+                    session.commit()
+                    return None
+            users_fixed, fixed_post_ids = _reconcile(session)
+            session.commit()
+        except OperationalError as e:
+            session.rollback()
+            if not _is_serialization_failure(e) or attempt == RECONCILE_ATTEMPTS - 1:
+                raise
+            continue
+        if fixed_post_ids:
+            cache.invalidate(*(cache.post_key(post_id) for post_id in fixed_post_ids))
+            feed.bump_version(session)
+        return users_fixed, len(fixed_post_ids)
+
+
+def _reconcile(session):
+    post_counts = select(Post.user_id, func.count().label('cnt')).group_by(Post.user_id).subquery()
+    comment_counts = select(Comment.user_id, func.count().label('cnt')).group_by(Comment.user_id).subquery()
+    like_counts = select(Like.user_id, func.count().label('cnt')).group_by(Like.user_id).subquery()
+    actual = (
+        select(
+            User.id.label('user_id'),
+            func.coalesce(post_counts.c.cnt, 0).label('post_cnt'),
+            func.coalesce(comment_counts.c.cnt, 0).label('comment_cnt'),
+            func.coalesce(like_counts.c.cnt, 0).label('like_cnt'),
+        )
+        .select_from(User)
+        .outerjoin(post_counts, post_counts.c.user_id == User.id)
+        .outerjoin(comment_counts, comment_counts.c.user_id == User.id)
+        .outerjoin(like_counts, like_counts.c.user_id == User.id)
+        .subquery()
+    )
+    users_fixed = session.execute(
+        update(User)
+        .where(User.id == actual.c.user_id)
+        .where(
+            User.post_cnt.is_distinct_from(actual.c.post_cnt)
+            | User.comment_cnt.is_distinct_from(actual.c.comment_cnt)
+            | User.like_cnt.is_distinct_from(actual.c.like_cnt)
+        )
+        .values(post_cnt=actual.c.post_cnt, comment_cnt=actual.c.comment_cnt, like_cnt=actual.c.like_cnt),
+        execution_options={"synchronize_session": False},
+    ).rowcount
+
+    hearts = (
+        select(func.count())
+        .where(Like.post_id == Post.id)
+        .correlate(Post)
+        .scalar_subquery()
+    )
+    fixed_post_ids = session.execute(
+        update(Post)
+        .where(Post.hearts.is_distinct_from(hearts))
+        .values(hearts=hearts, hot_score=feed.hot_score_expr(hearts=hearts))
+        .returning(Post.id),
+        execution_options={"synchronize_session": False},
+    ).scalars().all()
+    return users_fixed, fixed_post_ids
+
+
+def start_reconciler(app):
+    """Run reconcile_counters() every RECONCILE_SECONDS on one worker at a time."""
+    def run():
+        while True:
+            time.sleep(RECONCILE_SECONDS)
+            with app.app_context():
+                try:
+                    fixed = reconcile_counters(lock_key=RECONCILE_LOCK_ID)
+                    if fixed and any(fixed):
+                        print(f"Counter drift repaired: {fixed[0]} users, {fixed[1]} posts")
+                except Exception as e:
+                    print(f"Counter reconcile error: {e}")
+                    db.session.rollback()
+
+    thread = threading.Thread(target=run, name="counter-reconciler", daemon=True)
+    thread.start()
+    return thread
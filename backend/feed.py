@@ -0,0 +1,320 @@
+import hashlib
+import math
+import os
+import secrets
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func, tuple_, literal, update, delete, text, select, all_, DateTime
+from sqlalchemy.dialects.postgresql import ARRAY, UUID, insert as pg_insert
+
+from models import db, Post, FeedSnapshot, feed_version_seq
+from pagination import InvalidCursor, encode_cursor, decode_cursor
+from serializers import POST_COLUMNS
+
+# 가중치
+W_TIME = 0.6
+W_HEART = 0.35
+W_RANDOM = 0.7
+
+# hot_score의 시간 감쇠 항은 최대 RANK_TICK_SECONDS 만큼 늦게 반영된다 (staleness bound).
+# 좋아요 변화는 counters.bump_post_hearts()가 쓰기 트랜잭션 안에서 즉시 반영한다.
+RANK_TICK_SECONDS = int(os.getenv('FEED_RANK_TICK_SECONDS', '60'))
+# 이보다 오래된 글은 시간 항이 0.6 * e^-7 ≈ 0.0005 이하라서 decay tick에서 제외
+DECAY_HORIZON = timedelta(days=7)
+RANKER_LOCK_ID = 0x6665656472616e6b  # pg advisory lock key ("feedrank")
+# 스크롤 중에는 첫 페이지 시점의 순위를 따른다: 상위 FEED_SNAPSHOT_SIZE개만 스냅샷에 담고 그 뒤는 실시간 순위로 이어간다
+FEED_SNAPSHOT_SIZE = int(os.getenv('FEED_SNAPSHOT_SIZE', '500'))
+FEED_SNAPSHOT_TTL = timedelta(seconds=int(os.getenv('FEED_SNAPSHOT_TTL_SECONDS', '1800')))
+
+
+# --- Score ---
+
+def hot_score(created_at, hearts, now=None):
+    """Deterministic part of the feed score: time decay + log hearts."""
+    if now is None:
+        now = datetime.now(timezone.utc)
+    age_hours = (now - created_at).total_seconds() / 3600
+    time_score = math.exp(-age_hours / 24)  # 하루 기준 감쇠
+    heart_score = math.log1p(hearts or 0)  # log(hearts + 1)
+    return W_TIME * time_score + W_HEART * heart_score
+
+
+def hot_score_expr(now=None, hearts=None):
+    """
+    SQL version of hot_score(), used to keep POST.hot_score materialized.
+    `hearts` lets an UPDATE that also changes hearts score the new value.
+    """
+    if now is None:
+        now_expr = func.now()
+    else:
+        now_expr = literal(now, DateTime(timezone=True))
+    if hearts is None:
+        hearts = func.coalesce(Post.hearts, 0)
+    age_hours = func.extract('epoch', now_expr - Post.created_at) / 3600
+    return W_TIME * func.exp(-age_hours / 24) + W_HEART * func.ln(1 + hearts)
+
+
+def decay_tick(session=None):
+    """
+    Periodic decay: refresh hot_score for posts still inside the decay horizon
+    and for rows that were never ranked. Returns the number of updated rows.
+    """
+    session = session or db.session
+    now = datetime.now(timezone.utc)
+    horizon = now - DECAY_HORIZON - timedelta(seconds=RANK_TICK_SECONDS)
+    result = session.execute(
+        update(Post)
+        .where((Post.created_at >= horizon) | (Post.hot_score.is_(None)))
+        .values(hot_score=hot_score_expr(now)),
+        execution_options={"synchronize_session": False},
+    )
+    return result.rowcount
+
+
+def rebuild_scores(session=None):
+    """Recompute hot_score for every post from scratch."""
+    session = session or db.session
+    result = session.execute(
+        update(Post).values(hot_score=hot_score_expr()),
+        execution_options={"synchronize_session": False},
+    )
+    session.commit()
+    bump_version(session)
+    return result.rowcount
+
+
+def start_ranker(app):
+    """
+    Run decay_tick() (and purge expired snapshots) every RANK_TICK_SECONDS in
+    a daemon thread. Every gunicorn worker starts one, but the advisory lock
+    lets only one of them do the work per tick.
+    """
+    def run():
+        while True:
+            with app.app_context():
+                try:
+                    got_lock = db.session.execute(
+                        text('SELECT pg_try_advisory_xact_lock(:key)'), {"key": RANKER_LOCK_ID}
+                    ).scalar()
+                    rescored = decay_tick() if got_lock else 0
+                    if got_lock:
+                        purge_snapshots()
+                    db.session.commit()
+                    if rescored:
+                        bump_version()
+                except Exception as e:
+                    print(f"Feed ranker tick error: {e}")
+                    db.session.rollback()
+            time.sleep(RANK_TICK_SECONDS)
+
+    thread = threading.Thread(target=run, name="feed-ranker", daemon=True)
+    thread.start()
+    return thread
+
+
+# --- Version ---
+
+def feed_version(session=None):
+    """Current feed version; changes whenever feed content or order may have changed."""
+    session = session or db.session
+    return session.execute(text('SELECT last_value FROM feed_version_seq')).scalar()
+
+
+def bump_version(session=None):
+    """
+    Advance the feed version. Call after the write has committed: a reader
+    that sees the new version is then guaranteed to also see the new rows.
+    nextval() is not transactional, so concurrent writers never wait on it.
+    """
+    session = session or db.session
+    return session.execute(select(feed_version_seq.next_value())).scalar()
+
+
+# --- Session jitter & cursor ---
+
+def new_session():
+    return secrets.token_urlsafe(8)
+
+
+def session_seed(user_id, session):
+    """
+    Seed for the random term of the feed score.
+    The same user and session always get the same jitter, so pages stay
+    consistent while scrolling.
+    """
+    return hashlib.sha1(f"{user_id}:{session}".encode()).hexdigest()
+
+
+def jitter(seed, post_id):
+    digest = hashlib.sha1(f"{seed}:{post_id}".encode()).digest()
+    return int.from_bytes(digest[:4], 'big') / 4294967296.0
+
+
+def decode_feed_cursor(cursor):
+    """
+    Cursor state -> {"session", "position"}. `position` is (snapshot, offset,
+    after): an offset into snapshot `snapshot`, or once past its end the
+    (hot_score, id) keyset position `after` of the live scan.
+    """
+    state = decode_cursor(cursor)
+    try:
+        snapshot = int(state["snapshot"]) if state.get("snapshot") is not None else None
+        if "offset" in state:
+            offset, after = int(state["offset"]), None
+            if snapshot is None or offset < 0:
+                raise ValueError("offset cursor without a snapshot")
+        else:
+            # 스냅샷 도입 전 커서 ({"session", "score", "id"})도 실시간 키셋 위치로 받는다
+            offset, after = None, (float(state["score"]), uuid.UUID(str(state["id"])))
+        return {"session": str(state["session"]), "position": (snapshot, offset, after)}
+    except (ValueError, KeyError, TypeError) as e:
+        raise InvalidCursor(str(e))
+
+
+def encode_feed_cursor(session, position):
+    if position is None:
+        return None
+    snapshot, offset, after = position
+    state = {"session": session, "snapshot": snapshot}
+    if offset is not None:
+        state["offset"] = offset
+    else:
+        state["score"], state["id"] = after[0], str(after[1])
+    return encode_cursor(state)
+
+
+# --- Snapshots ---
+
+def take_snapshot(version, session=None):
+    """
+    Freeze the top FEED_SNAPSHOT_SIZE of the ranking under `version` and
+    return it as (post_ids, scores). If another request already froze this
+    version, its snapshot wins and is returned instead.
+    """
+    session = session or db.session
+    rows = session.execute(
+        select(Post.id, Post.hot_score).order_by(Post.hot_score.desc(), Post.id.desc()).limit(FEED_SNAPSHOT_SIZE)
+    ).all()
+    session.execute(
+        pg_insert(FeedSnapshot)
+        .values(
+            version=version,
+            post_ids=[row.id for row in rows],
+            scores=[row.hot_score for row in rows],
+            created_at=datetime.now(timezone.utc),
+        )
+        .on_conflict_do_nothing(index_elements=[FeedSnapshot.version])
+    )
+    session.commit()
+    return load_snapshot(version, session)
+
+
+def load_snapshot(version, session=None):
+    """(post_ids, scores) of snapshot `version`, or None if it was purged."""
+    session = session or db.session
+    row = session.query(FeedSnapshot.post_ids, FeedSnapshot.scores).filter(FeedSnapshot.version == version).first()
+    return (list(row.post_ids), list(row.scores)) if row else None
+
+
+def purge_snapshots(session=None):
+    """Delete snapshots older than FEED_SNAPSHOT_TTL. Returns the number deleted."""
+    session = session or db.session
+    cutoff = datetime.now(timezone.utc) - FEED_SNAPSHOT_TTL
+    result = session.execute(delete(FeedSnapshot).where(FeedSnapshot.created_at < cutoff))
+    return result.rowcount
+
+
+# --- Page reads ---
+
+def resolve_cursor(cursor=None, session=None):
+    """Return (session, position); `position` is None for the first page."""
+    if cursor:
+        state = decode_feed_cursor(cursor)
+        return state["session"], state["position"]
+    return session or new_session(), None
+
+
+def fetch_ranked(after=None, limit=None, exclude=()):
+    """
+    One page of posts in (hot_score, id) order, as a keyset range scan over
+    the ix_post_hot_score index, leaving out the ids in `exclude`. Returns
+    (rows, next_after); `next_after` is None on the last page. `limit=None`
+    returns the rest of the feed.
+    """
+    # 엔티티 대신 직렬화에 필요한 컬럼만 읽는다
+    query = db.session.query(*POST_COLUMNS)
+    if after:
+        query = query.filter(tuple_(Post.hot_score, Post.id) < tuple_(*after))
+    if exclude:
+        query = query.filter(Post.id != all_(literal(list(exclude), ARRAY(UUID(as_uuid=True)))))
+    query = query.order_by(Post.hot_score.desc(), Post.id.desc())
+    if limit is not None:
+        query = query.limit(limit + 1)
+    rows = query.all()
+
+    next_after = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        next_after = (rows[-1].hot_score, rows[-1].id)
+    return rows, next_after
+
+
+def fetch_posts(post_ids):
+    """{id: row} for the posts in `post_ids` that still exist."""
+    if not post_ids:
+        return {}
+    rows = db.session.query(*POST_COLUMNS).filter(Post.id.in_(post_ids)).all()
+    return {row.id: row for row in rows}
+
+
+def fetch_page(version, position=None, limit=None):
+    """
+    One feed page as (rows, scores, next_position); `next_position` is None
+    on the last page and `limit=None` returns the whole live feed.
+
+    hot_score moves with decay ticks and likes, so keyset paging over the
+    live column would repeat or skip posts mid-scroll. The first page freezes
+    the ranking as of `version` into a snapshot and later pages follow it
+    (with the frozen scores); posts deleted since are left out. Past the end
+    of the snapshot the feed continues live, without the snapshot's posts.
+    A scroll that outlives its snapshot continues in the current one.
+    """
+    if limit is None:
+        rows, _ = fetch_ranked()
+        return rows, [row.hot_score for row in rows], None
+
+    snapshot_version, offset, after = position or (version, 0, None)
+    snapshot = load_snapshot(snapshot_version) if snapshot_version is not None else None
+    if snapshot is None and offset is not None:
+        snapshot_version = version
+        snapshot = load_snapshot(version) or take_snapshot(version)
+
+    if offset is None:
+        rows, next_after = fetch_ranked(after, limit, exclude=snapshot[0] if snapshot else ())
+        next_position = (snapshot_version, None, next_after) if next_after else None
+        return rows, [row.hot_score for row in rows], next_position
+
+    post_ids, scores = snapshot
+    end = offset + limit
+    found = fetch_posts(post_ids[offset:end])
+    page = [(found[post_id], score) for post_id, score in zip(post_ids[offset:end], scores[offset:end]) if post_id in found]
+    if end < len(post_ids):
+        next_position = (snapshot_version, end, None)
+    elif len(post_ids) >= FEED_SNAPSHOT_SIZE and scores[-1] is not None:
+        # 스냅샷이 잘린 경우: 스냅샷 마지막 글 다음부터 실시간 순위로
+        next_position = (snapshot_version, None, (scores[-1], post_ids[-1]))
+    else:
+        next_position = None
+    return [row for row, _ in page], [score for _, score in page], next_position
+
+
+def shuffle_page(items, user_id, session, score, post_id):
+    """
+    Reorder one page by hot_score plus the session-seeded random term.
+    `score` and `post_id` read those values from an item.
+    """
+    seed = session_seed(user_id, session)
+    return sorted(items, key=lambda item: (score(item) or 0) + W_RANDOM * jitter(seed, post_id(item)), reverse=True)
@@ -0,0 +1,143 @@
+"""
+Offline verification of Google ID tokens.
+
+Google signs ID tokens with RS256 keys published as a JWKS document. The key
+set is fetched once, kept for as long as its Cache-Control max-age allows and
+refreshed ahead of expiry by a background thread, so logins verify the
+signature locally instead of calling the tokeninfo endpoint.
+
+verify_id_token() takes the key set as an argument; pass a StaticKeySet built
+from a locally generated key pair to exercise it without Google.
+"""
+import os
+import re
+import threading
+import time
+
+import jwt
+import requests
+
+GOOGLE_CERTS_URL = os.getenv('GOOGLE_CERTS_URL', 'https://www.googleapis.com/oauth2/v3/certs')
+GOOGLE_ISSUERS = ('accounts.google.com', 'https://accounts.google.com')
+
+FETCH_TIMEOUT = (3, 5)  # (connect, read) seconds
+DEFAULT_MAX_AGE = 3600  # Cache-Control이 없을 때
+REFRESH_MARGIN = 300  # 만료 이만큼 전에 백그라운드에서 갱신
+RETRY_SECONDS = 60
+# 모르는 kid(키 교체 직후)로 강제 갱신하는 최소 간격
+MIN_FORCED_REFRESH_SECONDS = 30
+CLOCK_SKEW = 60
+
+
+class KeySetUnavailable(Exception):
+    pass
+
+
+def parse_max_age(cache_control):
+    match = re.search(r'max-age=(\d+)', cache_control or '')
+    return int(match.group(1)) if match else DEFAULT_MAX_AGE
+
+
+class StaticKeySet:
+    """Fixed {kid: public key} mapping."""
+
+    def __init__(self, keys):
+        self.keys = dict(keys)
+
+    def get_key(self, kid):
+        return self.keys.get(kid)
+
+
+class JWKSKeySet:
+    """JWKS key set fetched over HTTP and cached per its Cache-Control header."""
+
+    def __init__(self, url, session=None):
+        self.url = url
+        self.http = session or requests.Session()
+        self.keys = {}
+        self.expires_at = 0.0
+        self.fetched_at = 0.0
+        self._lock = threading.Lock()
+        self._refresher = None
+
+    def refresh(self):
+        resp = self.http.get(self.url, timeout=FETCH_TIMEOUT)
+        resp.raise_for_status()
+        keys = {}
+        for jwk in resp.json().get('keys', []):
+            if jwk.get('kty') == 'RSA' and jwk.get('kid'):
+                keys[jwk['kid']] = jwt.PyJWK(jwk, algorithm='RS256').key
+        if not keys:
+            raise KeySetUnavailable("JWKS document has no RSA keys")
+        now = time.time()
+        with self._lock:
+            self.keys = keys
+            self.fetched_at = now
+            self.expires_at = now + parse_max_age(resp.headers.get('Cache-Control'))
+
+    def get_key(self, kid):
+        now = time.time()
+        if not self.keys or now >= self.expires_at:
+            self._refresh_now()
+        key = self.keys.get(kid)
+        if key is None and now - self.fetched_at >= MIN_FORCED_REFRESH_SECONDS:
+            # Google이 키를 교체한 직후일 수 있으므로 한 번만 다시 받아본다
+            self._refresh_now()
+            key = self.keys.get(kid)
+        return key
+
+    def _refresh_now(self):
+        try:
+            self.refresh()
+        except (requests.RequestException, ValueError, KeySetUnavailable, jwt.PyJWTError) as e:
+            # 갱신에 실패해도 이전 키가 있으면 계속 사용
+            if not self.keys:
+                raise KeySetUnavailable(str(e))
+            print(f"JWKS refresh failed, keeping cached keys: {e}")
+
+    def start_refresher(self):
+        """Refresh the key set shortly before it expires, in a daemon thread."""
+        if self._refresher is not None:
+            return self._refresher
+
+        def run():
+            while True:
+                try:
+                    self.refresh()
+                    delay = max(self.expires_at - time.time() - REFRESH_MARGIN, RETRY_SECONDS)
+                except Exception as e:
+                    print(f"JWKS refresh error: {e}")
+                    delay = RETRY_SECONDS
+                time.sleep(delay)
+
+        self._refresher = threading.Thread(target=run, name="jwks-refresher", daemon=True)
+        self._refresher.start()
+        return self._refresher
+
+
+google_keys = JWKSKeySet(GOOGLE_CERTS_URL)
+
+
+def verify_id_token(token, audience, key_set=None):
+    """
+    Verify an ID token's signature, audience, issuer and expiry and return its
+    claims. Raises jwt.InvalidTokenError on any failure.
+    """
+    key_set = key_set or google_keys
+    header = jwt.get_unverified_header(token)
+    if header.get('alg') != 'RS256':
+        raise jwt.InvalidAlgorithmError("ID token must be signed with RS256")
+    key = key_set.get_key(header.get('kid'))
+    if key is None:
+        raise jwt.InvalidKeyError(f"Unknown signing key: {header.get('kid')}")
+    claims = jwt.decode(
+        token,
+        key,
+        algorithms=['RS256'],
+        audience=audience,
+        leeway=CLOCK_SKEW,
+        options={"require": ["exp", "iat", "iss", "aud", "sub"]},
+    )
+    if claims['iss'] not in GOOGLE_ISSUERS:
+        raise jwt.InvalidIssuerError("Invalid issuer")
+    return claims
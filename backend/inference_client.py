@@ -0,0 +1,275 @@
+"""
+HTTP client for the inference server (llm/inference_server.py).
+
+InferenceClient keeps a pooled keep-alive requests.Session, so replies reuse
+TCP connections instead of opening one per request. Requests that failed
+before the server produced anything (connection refused or reset, connect
+timeout, 502/503/504) are retried a bounded number of times with jittered
+exponential backoff; once a response has started streaming, nothing is
+retried here and the failure goes back to the job queue. A CircuitBreaker
+shared by all callers in the process fails fast while the server is down,
+so queued jobs back off instead of each waiting out its own timeouts.
+
+AsyncInferenceClient is the same client on httpx (optional dependency) for
+callers running on an asyncio loop.
+"""
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import httpx
+except ImportError:  # httpx는 선택 의존성: 비동기 클라이언트를 쓸 때만 필요
+    httpx = None
+
+# Use host.docker.internal to reach the host machine from inside the container
+INFERENCE_URL = os.getenv('INFERENCE_URL', 'http://host.docker.internal:5000').rstrip('/')
+CONNECT_TIMEOUT = float(os.getenv('INFERENCE_CONNECT_TIMEOUT_SECONDS', '3'))
+# 스트리밍에서는 전체 생성 시간이 아니라 다음 조각까지 기다리는 시간
+READ_TIMEOUT = float(os.getenv('INFERENCE_READ_TIMEOUT_SECONDS', '60'))
+MAX_RETRIES = int(os.getenv('INFERENCE_MAX_RETRIES', '2'))
+POOL_SIZE = int(os.getenv('INFERENCE_POOL_SIZE', '16'))
+RETRY_BASE_SECONDS = 0.5
+RETRY_MAX_SECONDS = 5
+RETRY_STATUSES = (502, 503, 504)
+BREAKER_FAILURES = int(os.getenv('INFERENCE_BREAKER_FAILURES', '5'))
+BREAKER_RESET_SECONDS = float(os.getenv('INFERENCE_BREAKER_RESET_SECONDS', '30'))
+
+
+class InferenceError(Exception):
+    pass
+
+
+class CircuitOpen(InferenceError):
+    pass
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and rejects calls for
+    `reset_seconds`. Then a single trial call is let through (half-open): its
+    success closes the breaker, its failure opens it again. A trial that ends
+    without either (the caller must call release_trial()) lets the next call
+    try instead.
+    """
+
+    def __init__(self, failure_threshold, reset_seconds):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._lock = threading.Lock()
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+
+    @property
+    def state(self):
+        with self._lock:
+            if self.opened_at is None:
+                return 'closed'
+            if time.monotonic() - self.opened_at < self.reset_seconds:
+                return 'open'
+            return 'half-open'
+
+    def before_call(self):
+        """Raise CircuitOpen, or return True if this call is the half-open trial."""
+        with self._lock:
+            if self.opened_at is None:
+                return False
+            if time.monotonic() - self.opened_at >= self.reset_seconds and not self._trial:
+                self._trial = True
+                return True
+        raise CircuitOpen("Inference server circuit is open")
+
+    def release_trial(self):
+        with self._lock:
+            self._trial = False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self._trial = False
+
+    def stats(self):
+        state = self.state
+        with self._lock:
+            return {"state": state, "consecutiveFailures": self.failures}
+
+
+breaker = CircuitBreaker(BREAKER_FAILURES, BREAKER_RESET_SECONDS)
+
+
+def retry_delay(attempt):
+    return min(RETRY_BASE_SECONDS * 2 ** attempt, RETRY_MAX_SECONDS) * random.uniform(0.5, 1.0)
+
+
+def _decode_events(lines):
+    for line in lines:
+        if line:
+            yield json.loads(line)
+
+
+class InferenceClient:
+    def __init__(self, base_url=INFERENCE_URL, session=None, circuit=breaker):
+        self.base_url = base_url
+        self.circuit = circuit
+        self.timeout = (CONNECT_TIMEOUT, READ_TIMEOUT)
+        if session is None:
+            session = requests.Session()
+            # 재시도는 여기서 직접 한다 (urllib3 재시도는 끔)
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE, max_retries=0)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+        self.http = session
+
+    def _send(self, path, payload, stream):
+        """
+        POST with retries; returns a 200 response (caller closes it). The
+        breaker counts any non-5xx response as success as soon as the headers
+        arrive, and callers report failures that happen while reading the body.
+        """
+        for attempt in range(MAX_RETRIES + 1):
+            trial = self.circuit.before_call()
+            try:
+                resp = self.http.post(self.base_url + path, json=payload, stream=stream, timeout=self.timeout)
+            except (requests.ConnectionError, requests.ConnectTimeout) as e:
+                self.circuit.record_failure()
+                error = InferenceError(f"Error calling LLM inference: {e}")
+            except requests.RequestException as e:
+                self.circuit.record_failure()
+                raise InferenceError(f"Error calling LLM inference: {e}")
+            else:
+                if resp.status_code == 200:
+                    self.circuit.record_success()
+                    return resp
+                try:
+                    body = resp.text[:500]
+                finally:
+                    resp.close()
+                error = InferenceError(f"LLM Server returned error: {resp.status_code} - {body}")
+                if resp.status_code not in RETRY_STATUSES:
+                    # 4xx는 요청 문제: 서버는 정상 응답했으므로 breaker에는 성공으로 센다
+                    if resp.status_code >= 500:
+                        self.circuit.record_failure()
+                    else:
+                        self.circuit.record_success()
+                    raise error
+                self.circuit.record_failure()
+            finally:
+                # 어떤 예외로 끝나도 half-open 시도가 걸린 채로 남지 않게 한다
+                if trial:
+                    self.circuit.release_trial()
+            if attempt < MAX_RETRIES:
+                time.sleep(retry_delay(attempt))
+        raise InferenceError(str(error))
+
+    def post(self, path, payload):
+        """POST `payload` and return the decoded JSON body."""
+        resp = self._send(path, payload, stream=False)
+        try:
+            body = resp.json()
+        except ValueError as e:
+            self.circuit.record_failure()
+            raise InferenceError(f"LLM Server returned invalid JSON: {e}")
+        return body
+
+    def stream(self, path, payload):
+        """POST `payload` and yield the NDJSON events of the streamed response."""
+        resp = self._send(path, payload, stream=True)
+        with resp:
+            try:
+                yield from _decode_events(resp.iter_lines())
+            except (requests.RequestException, ValueError) as e:
+                self.circuit.record_failure()
+                raise InferenceError(f"LLM stream failed: {e}")
+
+
+class AsyncInferenceClient:
+    """InferenceClient for asyncio callers; one instance serves many concurrent streams."""
+
+    def __init__(self, base_url=INFERENCE_URL, circuit=breaker):
+        if httpx is None:
+            raise RuntimeError("AsyncInferenceClient requires httpx (pip install httpx)")
+        self.base_url = base_url
+        self.circuit = circuit
+        self.http = httpx.AsyncClient(
+            timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=POOL_SIZE, max_keepalive_connections=POOL_SIZE),
+        )
+
+    async def _send(self, path, payload):
+        for attempt in range(MAX_RETRIES + 1):
+            trial = self.circuit.before_call()
+            try:
+                request = self.http.build_request('POST', self.base_url + path, json=payload)
+                resp = await self.http.send(request, stream=True)
+            except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+                self.circuit.record_failure()
+                error = InferenceError(f"Error calling LLM inference: {e}")
+            except httpx.HTTPError as e:
+                self.circuit.record_failure()
+                raise InferenceError(f"Error calling LLM inference: {e}")
+            else:
+                if resp.status_code == 200:
+                    self.circuit.record_success()
+                    return resp
+                try:
+                    body = (await resp.aread())[:500].decode(errors='replace')
+                finally:
+                    await resp.aclose()
+                error = InferenceError(f"LLM Server returned error: {resp.status_code} - {body}")
+                if resp.status_code not in RETRY_STATUSES:
+                    if resp.status_code >= 500:
+                        self.circuit.record_failure()
+                    else:
+                        self.circuit.record_success()
+                    raise error
+                self.circuit.record_failure()
+            finally:
+                if trial:
+                    self.circuit.release_trial()
+            if attempt < MAX_RETRIES:
+                await asyncio.sleep(retry_delay(attempt))
+        raise InferenceError(str(error))
+
+    async def post(self, path, payload):
+        resp = await self._send(path, payload)
+        try:
+            body = json.loads(await resp.aread())
+        except (httpx.HTTPError, ValueError) as e:
+            self.circuit.record_failure()
+            raise InferenceError(f"LLM Server returned invalid JSON: {e}")
+        finally:
+            await resp.aclose()
+        return body
+
+    async def stream(self, path, payload):
+        resp = await self._send(path, payload)
+        try:
+            async for line in resp.aiter_lines():
+                if line:
+                    yield json.loads(line)
+        except (httpx.HTTPError, ValueError) as e:
+            self.circuit.record_failure()
+            raise InferenceError(f"LLM stream failed: {e}")
+        finally:
+            await resp.aclose()
+
+    async def aclose(self):
+        await self.http.aclose()
+
+
+client = InferenceClient()
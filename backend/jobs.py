@@ -0,0 +1,192 @@
+"""
+Postgres-backed queue for bot replies (the BOT_JOB table).
+
+The web process only enqueues, in the same transaction as the user message.
+worker.py claims jobs with FOR UPDATE SKIP LOCKED, so any number of worker
+processes can share the queue without handing out a job twice. A claimed job
+is invisible until `locked_until`; if the worker dies, it becomes claimable
+again after the visibility timeout. Each claim increments `attempts`, which
+doubles as a fencing token: complete() and fail() only touch the job if it
+still carries the caller's attempt number, so a worker that lost its lease
+cannot overwrite the newer attempt's result.
+
+Every change a client can observe (progress, completion, dead-lettering)
+also NOTIFYs the job's conversation on commit; see chat_events.
+"""
+import os
+import random
+from datetime import timedelta
+
+from sqlalchemy import update, func, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+import chat_events
+from models import BotJob
+
+VISIBILITY_SECONDS = int(os.getenv('BOT_JOB_VISIBILITY_SECONDS', '180'))
+MAX_ATTEMPTS = int(os.getenv('BOT_JOB_MAX_ATTEMPTS', '5'))
+BACKOFF_BASE_SECONDS = 5
+BACKOFF_MAX_SECONDS = 300
+
+CLAIM_SQL = text('''
+    UPDATE "BOT_JOB" j
+    SET status = 'running',
+        attempts = j.attempts + 1,
+        partial_text = NULL,
+        locked_until = now() + make_interval(secs => :visibility),
+        updated_at = now()
+    WHERE j.id = (
+        SELECT id FROM "BOT_JOB"
+        WHERE ((status = 'pending' AND run_at <= now())
+               OR (status = 'running' AND locked_until < now()))
+          AND attempts < max_attempts
+        ORDER BY run_at
+        LIMIT 1
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING j.id, j.message_id, j.conversation_id, j.user_id, j.use_local_llm, j.attempts, j.max_attempts
+''')
+
+
+def enqueue(session, message_id, conversation_id, user_id, use_local_llm=False):
+    """Queue a reply to `message_id`. Enqueuing the same message twice is a no-op."""
+    stmt = (
+        pg_insert(BotJob)
+        .values(
+            message_id=message_id,
+            conversation_id=conversation_id,
+            user_id=user_id,
+            use_local_llm=bool(use_local_llm),
+            max_attempts=MAX_ATTEMPTS,
+        )
+        .on_conflict_do_nothing(index_elements=[BotJob.message_id])
+        .returning(BotJob.id)
+    )
+    return session.execute(stmt).scalar()
+
+
+def claim(session):
+    """Take the next visible job and commit the lease. Returns the job row or None."""
+    job = session.execute(CLAIM_SQL, {"visibility": VISIBILITY_SECONDS}).first()
+    session.commit()
+    return job
+
+
+def _owned(job):
+    return (BotJob.id == job.id) & (BotJob.attempts == job.attempts) & (BotJob.status == 'running')
+
+
+def save_progress(session, job, partial_text):
+    """Publish the reply generated so far. Returns False if the lease was lost."""
+    result = session.execute(
+        update(BotJob).where(_owned(job)).values(partial_text=partial_text),
+        execution_options={"synchronize_session": False},
+    )
+    owned = result.rowcount == 1
+    if owned:
+        chat_events.notify(session, job.conversation_id)
+    session.commit()
+    return owned
+
+
+def complete(session, job, reply_id):
+    """
+    Mark the job done inside the caller's transaction, which also saves the
+    reply. Returns False if the lease was lost; the caller must roll back.
+    """
+    result = session.execute(
+        update(BotJob).where(_owned(job)).values(status='done', locked_until=None, last_error=None, reply_id=reply_id),
+        execution_options={"synchronize_session": False},
+    )
+    if result.rowcount != 1:
+        return False
+    # 봇 메시지와 같은 트랜잭션: 커밋되어야 대기 중인 요청이 깨어난다
+    chat_events.notify(session, job.conversation_id)
+    return True
+
+
+def backoff_seconds(attempts):
+    delay = min(BACKOFF_BASE_SECONDS * 2 ** (attempts - 1), BACKOFF_MAX_SECONDS)
+    return delay * random.uniform(0.5, 1.0)
+
+
+def fail(session, job, error):
+    """Schedule a retry with exponential backoff, or dead-letter the job after its last attempt."""
+    if job.attempts >= job.max_attempts:
+        values = {"status": 'dead', "locked_until": None}
+    else:
+        values = {
+            "status": 'pending',
+            "locked_until": None,
+            "run_at": func.now() + timedelta(seconds=backoff_seconds(job.attempts)),
+        }
+    result = session.execute(
+        update(BotJob).where(_owned(job)).values(last_error=str(error)[:2000], **values),
+        execution_options={"synchronize_session": False},
+    )
+    if result.rowcount == 1 and values["status"] == 'dead':
+        chat_events.notify(session, job.conversation_id)
+    session.commit()
+    return values["status"]
+
+
+def reap_expired(session):
+    """Dead-letter jobs whose last attempt timed out (no worker will claim them again)."""
+    result = session.execute(
+        update(BotJob)
+        .where(BotJob.status == 'running', BotJob.locked_until < func.now(), BotJob.attempts >= BotJob.max_attempts)
+        .values(status='dead', locked_until=None, last_error=func.coalesce(BotJob.last_error, 'visibility timeout')),
+        execution_options={"synchronize_session": False},
+    )
+    session.commit()
+    return result.rowcount
+
+
+def requeue_dead(session):
+    """Give every dead-lettered job a fresh set of attempts."""
+    result = session.execute(
+        update(BotJob)
+        .where(BotJob.status == 'dead')
+        .values(status='pending', attempts=0, run_at=func.now(), locked_until=None),
+        execution_options={"synchronize_session": False},
+    )
+    session.commit()
+    return result.rowcount
+
+
+def purge_done(session, older_than=timedelta(days=7)):
+    """Delete finished jobs; their idempotency keys only matter while the message is fresh."""
+    result = session.execute(
+        BotJob.__table__.delete().where(BotJob.status == 'done', BotJob.updated_at < func.now() - older_than)
+    )
+    session.commit()
+    return result.rowcount
+
+
+def queue_stats(session):
+    """Queue depth by state, as seen by all worker processes (one scan of the status index)."""
+    now = func.now()
+    ready = (BotJob.status == 'pending') & (BotJob.run_at <= now)
+    row = (
+        session.query(
+            func.count().filter(ready).label('ready'),
+            func.count().filter((BotJob.status == 'pending') & (BotJob.run_at > now)).label('retrying'),
+            func.count().filter(BotJob.status == 'running').label('running'),
+            # lease가 끝났는데 아직 running: 워커가 죽었거나 멈춘 작업
+            func.count().filter((BotJob.status == 'running') & (BotJob.locked_until < now)).label('expired'),
+            func.count().filter(BotJob.status == 'dead').label('dead'),
+            # 가장 오래 기다린 (이미 실행 가능한) 작업의 대기 시간
+            func.extract('epoch', now - func.min(BotJob.run_at).filter(ready)).label('lag'),
+        )
+        .filter(BotJob.status.in_(('pending', 'running', 'dead')))
+        .one()
+    )
+    return {
+        "queueDepth": row.ready,
+        "pending": row.ready + row.retrying,
+        "retrying": row.retrying,
+        "running": row.running,
+        "expiredLeases": row.expired,
+        "dead": row.dead,
+        "oldestPendingSeconds": float(row.lag or 0),
+    }
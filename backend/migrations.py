@@ -0,0 +1,323 @@
+"""
+Versioned schema migrations.
+
+Run explicitly with `flask --app app migrate`; the web process itself does no
+DDL. Every migration is idempotent (IF [NOT] EXISTS, backfills that only touch
+rows still missing data) so a half-applied run can simply be re-run. Index
+builds on existing tables use CREATE INDEX CONCURRENTLY so they never block
+writes; those migrations run outside a transaction.
+"""
+from sqlalchemy import text
+
+from models import LAST_MESSAGE_PREVIEW_LEN
+
+MIGRATION_LOCK_ID = 0x6d69677261746521  # pg advisory lock key ("migrate!")
+
+MIGRATIONS = []
+
+
+def migration(version, name, transactional=True):
+    def register(fn):
+        MIGRATIONS.append((version, name, transactional, fn))
+        return fn
+    return register
+
+
+def create_index_concurrently(conn, name, ddl):
+    """
+    Build an index without blocking writes. A failed CONCURRENTLY build leaves
+    an INVALID index behind, so drop that one first and retry.
+    """
+    valid = conn.execute(text('''
+        SELECT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE c.relname = :name
+    '''), {"name": name}).scalar()
+    if valid:
+        return
+    if valid is not None:
+        conn.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS {name}'))
+    conn.execute(text(ddl.format(name=name)))
+
+
+# --- Migrations ---
+
+# 마이그레이션 도입 전 스키마 (당시 models.py의 create_all 결과 그대로). 이후 변경은 2번부터의 마이그레이션이 맡는다
+BASELINE_DDL = [
+    'CREATE EXTENSION IF NOT EXISTS vector',
+    '''DO $$ BEGIN
+        CREATE TYPE style_enum AS ENUM ('comfort', 'funny');
+    EXCEPTION WHEN duplicate_object THEN NULL; END $$''',
+    '''DO $$ BEGIN
+        CREATE TYPE gender_enum AS ENUM ('male', 'female');
+    EXCEPTION WHEN duplicate_object THEN NULL; END $$''',
+    '''CREATE TABLE IF NOT EXISTS "USER" (
+        id UUID NOT NULL PRIMARY KEY,
+        email VARCHAR(255) NOT NULL UNIQUE,
+        password_hash VARCHAR(255),
+        display_name VARCHAR(100),
+        created_at TIMESTAMPTZ,
+        updated_at TIMESTAMPTZ,
+        last_login_at TIMESTAMPTZ,
+        google_sub VARCHAR(255) UNIQUE,
+        age INTEGER,
+        gender gender_enum,
+        setting_mbti VARCHAR(10),
+        setting_intensity INTEGER,
+        style style_enum,
+        post_cnt INTEGER,
+        post_history UUID[],
+        comment_cnt INTEGER,
+        comment_history UUID[],
+        like_cnt INTEGER
+    )''',
+    '''CREATE TABLE IF NOT EXISTS "CONVERSATION" (
+        id UUID NOT NULL PRIMARY KEY,
+        user_id UUID NOT NULL REFERENCES "USER" (id) ON DELETE CASCADE,
+        title VARCHAR(255),
+        created_at TIMESTAMPTZ,
+        updated_at TIMESTAMPTZ,
+        deleted BOOLEAN
+    )''',
+    '''CREATE TABLE IF NOT EXISTS "POST" (
+        id UUID NOT NULL PRIMARY KEY,
+        user_id UUID NOT NULL REFERENCES "USER" (id) ON DELETE CASCADE,
+        msgs UUID[],
+        hearts INTEGER,
+        created_at TIMESTAMPTZ,
+        is_anonymous BOOLEAN
+    )''',
+    '''CREATE TABLE IF NOT EXISTS "COMMENT" (
+        id UUID NOT NULL PRIMARY KEY,
+        user_id UUID NOT NULL REFERENCES "USER" (id) ON DELETE CASCADE,
+        post_id UUID NOT NULL REFERENCES "POST" (id) ON DELETE CASCADE,
+        anonymous BOOLEAN,
+        content TEXT,
+        created_at TIMESTAMPTZ
+    )''',
+    '''CREATE TABLE IF NOT EXISTS "LIKE" (
+        id UUID NOT NULL PRIMARY KEY,
+        user_id UUID NOT NULL REFERENCES "USER" (id) ON DELETE CASCADE,
+        post_id UUID NOT NULL REFERENCES "POST" (id) ON DELETE CASCADE,
+        created_at TIMESTAMPTZ
+    )''',
+    '''CREATE TABLE IF NOT EXISTS "MESSAGE" (
+        id UUID NOT NULL PRIMARY KEY,
+        conversation_id UUID NOT NULL REFERENCES "CONVERSATION" (id) ON DELETE CASCADE,
+        user_id UUID NOT NULL REFERENCES "USER" (id) ON DELETE CASCADE,
+        role VARCHAR(50) NOT NULL,
+        created_at TIMESTAMPTZ,
+        content TEXT,
+        content_len INTEGER,
+        language VARCHAR(50),
+        model_name VARCHAR(100),
+        temperature FLOAT,
+        embedding VECTOR(1024)
+    )''',
+]
+
+
+@migration(1, 'baseline')
+def baseline(conn):
+    for ddl in BASELINE_DDL:
+        conn.execute(text(ddl))
+
+
+@migration(2, 'post_hot_score')
+def post_hot_score(conn):
+    import feed
+    from models import Post
+    conn.execute(text('ALTER TABLE "POST" ADD COLUMN IF NOT EXISTS hot_score DOUBLE PRECISION'))
+    conn.execute(
+        Post.__table__.update().where(Post.hot_score.is_(None)).values(hot_score=feed.hot_score_expr())
+    )
+
+
+@migration(3, 'conversation_summary')
+def conversation_summary(conn):
+    conn.execute(text('ALTER TABLE "CONVERSATION" ADD COLUMN IF NOT EXISTS last_message TEXT'))
+    conn.execute(text('ALTER TABLE "CONVERSATION" ADD COLUMN IF NOT EXISTS last_message_at TIMESTAMPTZ'))
+    conn.execute(text('ALTER TABLE "CONVERSATION" ADD COLUMN IF NOT EXISTS message_count INTEGER'))
+    # 기존 대화방의 요약 필드 채우기 (message_count가 비어 있는 방만)
+    conn.execute(text('''
+        UPDATE "CONVERSATION" c
+        SET message_count = s.cnt,
+            last_message = left(s.content, :preview_len),
+            last_message_at = s.created_at
+        FROM (
+            SELECT conversation_id, count(*) OVER w AS cnt, content, created_at,
+                   row_number() OVER (PARTITION BY conversation_id ORDER BY created_at DESC) AS rn
+            FROM "MESSAGE"
+            WINDOW w AS (PARTITION BY conversation_id)
+        ) s
+        WHERE s.conversation_id = c.id AND s.rn = 1 AND c.message_count IS NULL
+    '''), {"preview_len": LAST_MESSAGE_PREVIEW_LEN})
+    conn.execute(text('UPDATE "CONVERSATION" SET message_count = 0 WHERE message_count IS NULL'))
+
+
+# (user_id, post_id)마다 가장 먼저 생긴 좋아요 하나만 남긴다. created_at이 NULL인 행은 맨 뒤, 동률은 id로 갈라서
+# 정확히 한 행만 남게 한다 (행 비교 (created_at, id) > ...는 NULL이면 참이 되지 않아 중복이 남았다)
+DEDUPE_LIKES_SQL = '''
+    DELETE FROM "LIKE" WHERE id IN (
+        SELECT id FROM (
+            SELECT id, row_number() OVER (
+                PARTITION BY user_id, post_id ORDER BY created_at NULLS LAST, id
+            ) AS rn
+            FROM "LIKE"
+        ) ranked
+        WHERE rn > 1
+    )
+'''
+
+
+@migration(4, 'dedupe_likes')
+def dedupe_likes(conn):
+    # 유니크 인덱스를 만들기 전에 중복 좋아요 정리
+    conn.execute(text(DEDUPE_LIKES_SQL))
+
+
+@migration(5, 'hot_table_indexes', transactional=False)
+def hot_table_indexes(conn):
+    indexes = [
+        ('ix_post_hot_score', 'CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON "POST" (hot_score DESC, id DESC)'),
+        ('ix_post_user_id', 'CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON "POST" (user_id)'),
+        ('ix_message_conversation_created', 'CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON "MESSAGE" (conversation_id, created_at, id)'),
+        ('ix_conversation_user_deleted_updated', 'CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON "CONVERSATION" (user_id, deleted, updated_at)'),
+        ('ix_comment_post_id', 'CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON "COMMENT" (post_id)'),
+        ('ix_comment_user_id', 'CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON "COMMENT" (user_id)'),
+        ('ix_like_post_id', 'CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON "LIKE" (post_id)'),
+        ('ix_like_user_post', 'CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS {name} ON "LIKE" (user_id, post_id)'),
+    ]
+    for name, ddl in indexes:
+        if name == 'ix_like_user_post':
+            # 예전 4번 마이그레이션이 남긴 중복(created_at이 NULL인 행)이 있으면 유니크 인덱스가 실패한다
+            conn.execute(text(DEDUPE_LIKES_SQL))
+        create_index_concurrently(conn, name, ddl)
+
+
+@migration(6, 'retire_user_history_arrays')
+def retire_user_history_arrays(conn):
+    # post_history/comment_history가 추적하던 정보는 POST/COMMENT에서 다시 계산해 카운터에 반영한 뒤 컬럼 삭제
+    conn.execute(text('''
+        UPDATE "USER" u
+        SET post_cnt = (SELECT count(*) FROM "POST" p WHERE p.user_id = u.id),
+            comment_cnt = (SELECT count(*) FROM "COMMENT" c WHERE c.user_id = u.id)
+    '''))
+    conn.execute(text('ALTER TABLE "USER" DROP COLUMN IF EXISTS post_history'))
+    conn.execute(text('ALTER TABLE "USER" DROP COLUMN IF EXISTS comment_history'))
+
+
+@migration(7, 'feed_version_seq')
+def feed_version_seq(conn):
+    conn.execute(text('CREATE SEQUENCE IF NOT EXISTS feed_version_seq'))
+
+
+@migration(8, 'bot_job_queue')
+def bot_job_queue(conn):
+    conn.execute(text('''
+        CREATE TABLE IF NOT EXISTS "BOT_JOB" (
+            id UUID NOT NULL PRIMARY KEY,
+            message_id UUID REFERENCES "MESSAGE" (id) ON DELETE CASCADE,
+            conversation_id UUID NOT NULL REFERENCES "CONVERSATION" (id) ON DELETE CASCADE,
+            user_id UUID NOT NULL REFERENCES "USER" (id) ON DELETE CASCADE,
+            use_local_llm BOOLEAN NOT NULL,
+            status VARCHAR(20) NOT NULL,
+            attempts INTEGER NOT NULL,
+            max_attempts INTEGER NOT NULL,
+            run_at TIMESTAMPTZ NOT NULL,
+            locked_until TIMESTAMPTZ,
+            last_error TEXT,
+            created_at TIMESTAMPTZ,
+            updated_at TIMESTAMPTZ
+        )
+    '''))
+    conn.execute(text('CREATE UNIQUE INDEX IF NOT EXISTS ix_bot_job_message_id ON "BOT_JOB" (message_id)'))
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_bot_job_status_run_at ON "BOT_JOB" (status, run_at)'))
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_bot_job_status_locked_until ON "BOT_JOB" (status, locked_until)'))
+
+
+@migration(9, 'bot_job_streaming')
+def bot_job_streaming(conn):
+    conn.execute(text('ALTER TABLE "BOT_JOB" ADD COLUMN IF NOT EXISTS partial_text TEXT'))
+    conn.execute(text(
+        'ALTER TABLE "BOT_JOB" ADD COLUMN IF NOT EXISTS reply_id UUID REFERENCES "MESSAGE"(id) ON DELETE SET NULL'
+    ))
+
+
+@migration(10, 'conversation_rolling_summary')
+def conversation_rolling_summary(conn):
+    conn.execute(text('ALTER TABLE "CONVERSATION" ADD COLUMN IF NOT EXISTS summary TEXT'))
+    conn.execute(text('ALTER TABLE "CONVERSATION" ADD COLUMN IF NOT EXISTS summary_through_at TIMESTAMPTZ'))
+    conn.execute(text('ALTER TABLE "CONVERSATION" ADD COLUMN IF NOT EXISTS summary_through_id UUID'))
+
+
+@migration(11, 'feed_snapshot')
+def feed_snapshot(conn):
+    conn.execute(text('''
+        CREATE TABLE IF NOT EXISTS "FEED_SNAPSHOT" (
+            version BIGINT NOT NULL PRIMARY KEY,
+            post_ids UUID[] NOT NULL,
+            scores DOUBLE PRECISION[] NOT NULL,
+            created_at TIMESTAMPTZ NOT NULL
+        )
+    '''))
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_feed_snapshot_created_at ON "FEED_SNAPSHOT" (created_at)'))
+
+
+# --- Runner ---
+
+def ensure_version_table(engine):
+    with engine.begin() as conn:
+        conn.execute(text('''
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                name VARCHAR(255) NOT NULL,
+                applied_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP
+            )
+        '''))
+
+
+def applied_versions(engine):
+    with engine.connect() as conn:
+        return {row[0] for row in conn.execute(text('SELECT version FROM schema_migrations'))}
+
+
+def migrate(engine, target=None):
+    """
+    Apply pending migrations in version order and return the versions applied.
+    A session-level advisory lock serializes concurrent `migrate` runs.
+    """
+    ensure_version_table(engine)
+    applied = []
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as lock_conn:
+        lock_conn.execute(text('SELECT pg_advisory_lock(:key)'), {"key": MIGRATION_LOCK_ID})
+        try:
+            done = applied_versions(engine)
+            for version, name, transactional, fn in sorted(MIGRATIONS, key=lambda m: m[0]):
+                if version in done or (target is not None and version > target):
+                    continue
+                print(f"Applying migration {version:04d}_{name}...")
+                if transactional:
+                    with engine.begin() as conn:
+                        fn(conn)
+                        record(conn, version, name)
+                else:
+                    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+                        fn(conn)
+                        record(conn, version, name)
+                applied.append(version)
+        finally:
+            lock_conn.execute(text('SELECT pg_advisory_unlock(:key)'), {"key": MIGRATION_LOCK_ID})
+    return applied
+
+
+def record(conn, version, name):
+    conn.execute(
+        text('INSERT INTO schema_migrations (version, name) VALUES (:version, :name) ON CONFLICT (version) DO NOTHING'),
+        {"version": version, "name": name},
+    )
+
+
+def pending(engine):
+    ensure_version_table(engine)
+    done = applied_versions(engine)
+    return [(version, name) for version, name, _, _ in sorted(MIGRATIONS, key=lambda m: m[0]) if version not in done]
@@ -1,7 +1,7 @@
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import Column, String, Integer, DateTime, Boolean, ForeignKey, Float, Text
+from sqlalchemy import Column, String, Integer, BigInteger, DateTime, Boolean, ForeignKey, Float, Text, Index, Sequence
 from sqlalchemy.dialects.postgresql import UUID, ARRAY, ENUM
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, deferred
 from pgvector.sqlalchemy import Vector
 import uuid
 from datetime import datetime
@@ -14,6 +14,11 @@ db = SQLAlchemy()
 style_enum = ENUM('comfort', 'funny', name='style_enum', create_type=True)
 gender_enum = ENUM('male', 'female', name='gender_enum', create_type=True)
 
+LAST_MESSAGE_PREVIEW_LEN = 200
+
+# 피드 버전: 피드 내용이 바뀌는 쓰기(커밋 후)마다 nextval, GET /community의 ETag에 사용
+feed_version_seq = Sequence('feed_version_seq', metadata=db.metadata)
+
 def get_current_time():
     return datetime.now(pytz.utc)
 
@@ -37,12 +42,11 @@ class User(db.Model):
     setting_intensity = Column(Integer, default=1) # 1 | 2 | 3 | 4 | 5
     style = Column(style_enum, default='comfort') # Only 'comfort' and 'funny' allowed
     post_cnt = Column(Integer, default=0)
-    post_history = Column(ARRAY(UUID(as_uuid=True))) # Array of Post IDs
     comment_cnt = Column(Integer, default=0)
-    comment_history = Column(ARRAY(UUID(as_uuid=True))) # Array of Comment IDs
     like_cnt = Column(Integer, default=0)  # 좋아요한 포스트 개수
 
     conversations = relationship("Conversation", back_populates="user", cascade="all, delete-orphan")
+    # 작성한 글/댓글 목록은 POST.user_id / COMMENT.user_id 인덱스를 타는 relationship으로 조회
     posts = relationship("Post", back_populates="user", cascade="all, delete-orphan")
     comments = relationship("Comment", back_populates="user", cascade="all, delete-orphan")
     likes = relationship("Like", back_populates="user", cascade="all, delete-orphan")
@@ -56,10 +60,24 @@ class Conversation(db.Model):
     created_at = Column(DateTime(timezone=True), default=get_current_time)
     updated_at = Column(DateTime(timezone=True), default=get_current_time, onupdate=get_current_time)
     deleted = Column(Boolean, default=False)
+    # --- 채팅 목록용 비정규화 필드 (add_chat_message / trigger_chatbot_response에서 갱신) ---
+    last_message = Column(Text) # 마지막 메시지 미리보기
+    last_message_at = Column(DateTime(timezone=True))
+    message_count = Column(Integer, default=0)
+    # --- 오래된 대화의 누적 요약 (context.update_summary가 워커에서 갱신) ---
+    summary = deferred(Column(Text))
+    # 요약에 포함된 마지막 메시지의 (created_at, id)
+    summary_through_at = Column(DateTime(timezone=True))
+    summary_through_id = Column(UUID(as_uuid=True))
 
     user = relationship("User", back_populates="conversations")
     messages = relationship("Message", back_populates="conversation", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        # GET /chat: user_id + deleted 필터, updated_at 내림차순
+        Index('ix_conversation_user_deleted_updated', user_id, deleted, updated_at),
+    )
+
 class Message(db.Model):
     __tablename__ = 'MESSAGE'
 
@@ -69,7 +87,7 @@ class Message(db.Model):
     role = Column(String(50), nullable=False)
     created_at = Column(DateTime(timezone=True), default=get_current_time)
     content = Column(Text)
-    content_len = Column(Integer)
+    content_len = Column(Integer) # 토큰 수 캐시 (context.window_rows가 채움)
     language = Column(String(50))
     model_name = Column(String(100))
     temperature = Column(Float)
@@ -78,6 +96,11 @@ class Message(db.Model):
     conversation = relationship("Conversation", back_populates="messages")
     user = relationship("User") # No back_populates needed on User unless traversing frequently
 
+    __table_args__ = (
+        # /chat/messages의 (created_at, id) 키셋 페이지네이션용
+        Index('ix_message_conversation_created', conversation_id, created_at, id),
+    )
+
 class Post(db.Model):
     __tablename__ = 'POST'
 
@@ -87,11 +110,30 @@ class Post(db.Model):
     hearts = Column(Integer, default=0)
     created_at = Column(DateTime(timezone=True), default=get_current_time)
     is_anonymous = Column(Boolean, default=False)
+    hot_score = Column(Float) # 피드 랭킹 점수 (시간 감쇠 + 좋아요), feed.py의 ranker가 갱신
 
     user = relationship("User", back_populates="posts")
     comments = relationship("Comment", back_populates="post", cascade="all, delete-orphan")
     likes = relationship("Like", back_populates="post", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        Index('ix_post_hot_score', hot_score.desc(), id.desc()),
+        Index('ix_post_user_id', user_id),
+    )
+
+class FeedSnapshot(db.Model):
+    """Feed ranking frozen at one feed version; later pages of a scroll follow it (feed.py)."""
+    __tablename__ = 'FEED_SNAPSHOT'
+
+    version = Column(BigInteger, primary_key=True) # 스냅샷을 뜰 때의 feed_version_seq 값
+    post_ids = Column(ARRAY(UUID(as_uuid=True)), nullable=False) # (hot_score, id) 내림차순
+    scores = Column(ARRAY(Float), nullable=False) # post_ids와 같은 순서의 당시 hot_score
+    created_at = Column(DateTime(timezone=True), default=get_current_time, nullable=False)
+
+    __table_args__ = (
+        Index('ix_feed_snapshot_created_at', created_at),
+    )
+
 class Comment(db.Model):
     __tablename__ = 'COMMENT'
 
@@ -105,6 +147,11 @@ class Comment(db.Model):
     user = relationship("User", back_populates="comments")
     post = relationship("Post", back_populates="comments")
 
+    __table_args__ = (
+        Index('ix_comment_post_id', post_id),
+        Index('ix_comment_user_id', user_id),
+    )
+
 class Like(db.Model):
     __tablename__ = 'LIKE'
 
@@ -114,4 +161,40 @@ class Like(db.Model):
     created_at = Column(DateTime(timezone=True), default=get_current_time)
 
     user = relationship("User", back_populates="likes")
-    post = relationship("Post", back_populates="likes")
\ No newline at end of file
+    post = relationship("Post", back_populates="likes")
+
+    __table_args__ = (
+        # 한 유저는 한 포스트에 한 번만 좋아요 가능
+        Index('ix_like_user_post', user_id, post_id, unique=True),
+        Index('ix_like_post_id', post_id),
+    )
+
+class BotJob(db.Model):
+    """
+    Durable bot-reply job, consumed by worker.py with FOR UPDATE SKIP LOCKED.
+    status: pending -> running -> done, or dead after max_attempts failures.
+    """
+    __tablename__ = 'BOT_JOB'
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    # 멱등성 키: 사용자 메시지 하나당 작업 하나
+    message_id = Column(UUID(as_uuid=True), ForeignKey('MESSAGE.id', ondelete='CASCADE'))
+    conversation_id = Column(UUID(as_uuid=True), ForeignKey('CONVERSATION.id', ondelete='CASCADE'), nullable=False)
+    user_id = Column(UUID(as_uuid=True), ForeignKey('USER.id', ondelete='CASCADE'), nullable=False)
+    use_local_llm = Column(Boolean, default=False, nullable=False)
+    status = Column(String(20), default='pending', nullable=False)
+    attempts = Column(Integer, default=0, nullable=False)
+    max_attempts = Column(Integer, default=5, nullable=False)
+    run_at = Column(DateTime(timezone=True), default=get_current_time, nullable=False) # 재시도 backoff 이후 다시 보이는 시각
+    locked_until = Column(DateTime(timezone=True)) # visibility timeout: 지나면 다른 워커가 다시 가져감
+    last_error = Column(Text)
+    partial_text = Column(Text) # 스트리밍 중인 답변 (워커가 주기적으로 flush, GET /chat/stream이 tail)
+    reply_id = Column(UUID(as_uuid=True), ForeignKey('MESSAGE.id', ondelete='SET NULL')) # 완료 후 저장된 봇 메시지
+    created_at = Column(DateTime(timezone=True), default=get_current_time)
+    updated_at = Column(DateTime(timezone=True), default=get_current_time, onupdate=get_current_time)
+
+    __table_args__ = (
+        Index('ix_bot_job_message_id', message_id, unique=True),
+        Index('ix_bot_job_status_run_at', status, run_at),
+        Index('ix_bot_job_status_locked_until', status, locked_until),
+    )
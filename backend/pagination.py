@@ -0,0 +1,67 @@
+import base64
+import binascii
+import json
+import uuid
+from datetime import datetime
+
+from sqlalchemy import tuple_
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(state):
+    """Opaque, URL-safe cursor for a small JSON-serializable dict."""
+    raw = json.dumps(state, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        state = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (binascii.Error, ValueError, TypeError) as e:
+        raise InvalidCursor(str(e))
+    if not isinstance(state, dict):
+        raise InvalidCursor("cursor must encode an object")
+    return state
+
+
+def encode_keyset(created_at, row_id):
+    """Cursor for (created_at, id) keyset pagination."""
+    return encode_cursor({"t": created_at.isoformat(), "id": str(row_id)})
+
+
+def decode_keyset(cursor):
+    state = decode_cursor(cursor)
+    try:
+        return datetime.fromisoformat(state["t"]), uuid.UUID(str(state["id"]))
+    except (KeyError, ValueError, TypeError) as e:
+        raise InvalidCursor(str(e))
+
+
+def page_size(args, default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    """Read `limit` from request args, clamped to [1, maximum]."""
+    limit = args.get('limit', default, type=int)
+    return max(1, min(limit, maximum))
+
+
+def keyset_page(query, args, created_at, row_id, key=lambda row: (row.created_at, row.id)):
+    """
+    One page of `query`, which must be ordered by (created_at, id) descending,
+    using `limit` and `cursor` from request args. Returns (rows, next_cursor);
+    next_cursor is None on the last page. Raises InvalidCursor.
+    """
+    limit = page_size(args)
+    if args.get('cursor'):
+        query = query.filter(tuple_(created_at, row_id) < tuple_(*decode_keyset(args['cursor'])))
+    # 한 행 더 읽어서 다음 페이지가 있는지 본다
+    rows = query.limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_keyset(*key(rows[-1]))
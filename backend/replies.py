@@ -0,0 +1,107 @@
+"""
+Bot reply generation: conversation history in, persona-configured completion
+from the inference server out. Used by worker.py; failures raise ReplyError so
+the job queue can retry them.
+"""
+import datetime
+
+from sqlalchemy import func
+
+import context
+import inference_client
+from models import User, Conversation, Message, get_current_time, LAST_MESSAGE_PREVIEW_LEN
+
+STREAM_PATH = '/generate/stream'
+
+
+class ReplyError(Exception):
+    pass
+
+
+def record_last_message(conv, content):
+    """Keep the denormalized last-message fields on CONVERSATION current."""
+    conv.last_message = (content or "")[:LAST_MESSAGE_PREVIEW_LEN]
+    conv.last_message_at = get_current_time()
+    conv.message_count = func.coalesce(Conversation.message_count, 0) + 1
+
+
+def persona_config(user, use_local_llm):
+    return {
+        "mbti": user.setting_mbti,
+        "intensity": user.setting_intensity,
+        "style": user.style,
+        "temperature": 0.85,
+        "name": user.display_name,
+        "age": user.age,
+        "gender": user.gender,
+        "useLocalLLM": use_local_llm
+    }
+
+
+def build_request(session, conversation_id, user_id, use_local_llm=False):
+    """
+    Inference request body: the conversation summary, the recent turns that
+    fit the token budget and the user's persona settings.
+    """
+    user = session.get(User, user_id)
+    if not user:
+        raise ReplyError(f"User {user_id} not found")
+    messages, summary = context.build_context(session, conversation_id)
+    return {"messages": messages, "summary": summary, "config": persona_config(user, use_local_llm)}
+
+
+def _reply_event(event):
+    if "error" in event:
+        raise ReplyError(f"LLM Server failed while streaming: {event['error']}")
+    if event.get("done"):
+        if not event.get("response"):
+            raise ReplyError("LLM Server returned an empty response")
+        return "done", event["response"]
+    return "delta", event.get("delta", "")
+
+
+def stream_reply(payload, client=None):
+    """
+    Stream the next bot message from /generate/stream.
+    Yields ("delta", text) for each piece and finally ("done", full_text).
+    """
+    client = client or inference_client.client
+    try:
+        for event in client.stream(STREAM_PATH, payload):
+            kind, value = _reply_event(event)
+            yield kind, value
+            if kind == "done":
+                return
+    except inference_client.InferenceError as e:
+        raise ReplyError(str(e))
+    raise ReplyError("LLM stream ended without a final response")
+
+
+async def stream_reply_async(payload, client):
+    """stream_reply() over an inference_client.AsyncInferenceClient."""
+    try:
+        async for event in client.stream(STREAM_PATH, payload):
+            kind, value = _reply_event(event)
+            yield kind, value
+            if kind == "done":
+                return
+    except inference_client.InferenceError as e:
+        raise ReplyError(str(e))
+    raise ReplyError("LLM stream ended without a final response")
+
+
+def save_reply(session, conversation_id, user_id, content):
+    """Add the bot message and update the conversation summary (caller commits)."""
+    bot_msg = Message(
+        conversation_id=conversation_id,
+        user_id=user_id,
+        role='bot',
+        content=content
+    )
+    session.add(bot_msg)
+    conv = session.get(Conversation, conversation_id)
+    if conv is None:
+        raise ReplyError(f"Conversation {conversation_id} no longer exists")
+    conv.updated_at = datetime.datetime.utcnow()
+    record_last_message(conv, content)
+    return bot_msg
@@ -0,0 +1,129 @@
+"""
+JSON payloads for messages, conversations, posts and comments.
+
+Every route builds these shapes through the functions below and sends them
+with json_response(). Serializers read attributes, so they accept ORM objects
+and column-only result rows alike; routes select just the columns listed in
+*_COLUMNS instead of loading whole entities. UUIDs and datetimes are handed to
+the encoder as-is: orjson writes them natively (same text as str() and
+isoformat()), and the stdlib fallback converts them in `_default`.
+"""
+import datetime
+import json
+import uuid
+
+from flask import Response
+
+from models import Message, Post, User, Comment
+
+try:
+    import orjson
+except ImportError:  # orjson는 선택 의존성: 없으면 표준 json으로 동작
+    orjson = None
+
+ANONYMOUS_AUTHOR = "익명의 사용자"
+ANONYMOUS_COMMENTER = "익명"
+
+# 라우트가 엔티티 전체 대신 조회하는 컬럼 묶음
+MESSAGE_COLUMNS = (Message.id, Message.role, Message.content, Message.created_at)
+POST_COLUMNS = (Post.id, Post.user_id, Post.msgs, Post.hearts, Post.is_anonymous, Post.created_at, Post.hot_score)
+AUTHOR_COLUMNS = (User.id, User.display_name, User.email)
+COMMENT_COLUMNS = (Comment.id, Comment.post_id, Comment.anonymous, Comment.content, Comment.created_at)
+
+
+# --- Encoding ---
+
+def _default(value):
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(obj):
+    """Encode `obj` to UTF-8 JSON bytes."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=_default).encode()
+
+
+def json_response(obj, status=200):
+    return Response(dumps(obj), status=status, mimetype='application/json')
+
+
+def sse_event(event, data, event_id=None):
+    """One server-sent event with a JSON `data` field."""
+    head = f"id: {event_id}\n" if event_id is not None else ""
+    return head.encode() + f"event: {event}\ndata: ".encode() + dumps(data) + b"\n\n"
+
+
+# --- Payloads ---
+
+def message(msg):
+    return {
+        "id": msg.id,
+        "sender": "user" if msg.role == "user" else "bot",
+        "content": msg.content,
+        "timestamp": msg.created_at,
+    }
+
+
+def message_rows(rows):
+    """Serialize (id, role, content, created_at) tuples selected with MESSAGE_COLUMNS."""
+    return [
+        {"id": msg_id, "sender": "user" if role == "user" else "bot", "content": content, "timestamp": created_at}
+        for msg_id, role, content, created_at in rows
+    ]
+
+
+def conversation(conv, author_email, messages=None):
+    room = {
+        "id": conv.id,
+        "title": conv.title or "새 채팅",
+        "lastMessage": conv.last_message or "",
+        "lastMessageAt": conv.last_message_at,
+        "messageCount": conv.message_count or 0,
+        "createdAt": conv.created_at,
+        "updatedAt": conv.updated_at,
+        "authorEmail": author_email,
+    }
+    if messages is not None:
+        room["messages"] = messages
+    return room
+
+
+def post(p, author, messages, hearts, liked=False, anonymize=True):
+    """
+    Community post payload. `messages` maps message id to an already
+    serialized message; ids that no longer exist are skipped.
+    """
+    if anonymize:
+        author_name = ANONYMOUS_AUTHOR if (p.is_anonymous or not author or not author.display_name) else author.display_name
+    else:
+        author_name = author.display_name if author else "Unknown"
+    msg_ids = p.msgs or []
+    return {
+        "id": p.id,
+        "chatId": "",
+        "messageIds": list(msg_ids),
+        "messages": [messages[m_id] for m_id in msg_ids if m_id in messages],
+        "author": author_name,
+        "authorEmail": author.email if author else "",
+        "createdAt": p.created_at,
+        "reactions": [
+            {"type": "empathy", "count": hearts, "users": []}
+        ],
+        "likedByMe": liked,
+        "comments": []  # Comments are now fetched via /community/comment
+    }
+
+
+def comment(c, author_name, author_email):
+    return {
+        "id": c.id,
+        "author": ANONYMOUS_COMMENTER if c.anonymous else author_name,
+        "authorEmail": author_email,
+        "content": c.content,
+        "timestamp": c.created_at,
+    }
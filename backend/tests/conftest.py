@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 백엔드 모듈은 backend/에서 `import jobs`처럼 최상위로 import한다
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,129 @@
+import uuid
+from collections import namedtuple
+
+import pytest
+
+import feed
+
+Row = namedtuple('Row', ['id', 'hot_score'])
+LIMIT = 2
+
+
+class FakeFeed:
+    """POST.hot_score and FEED_SNAPSHOT in memory, behind the functions fetch_page reads through."""
+
+    def __init__(self, count):
+        # id 순서와 점수 순서를 일부러 어긋나게 만든다
+        self.scores = {uuid.uuid4(): float(count - i) for i in range(count)}
+        self.snapshots = {}
+
+    def ranked(self):
+        return sorted(self.scores.items(), key=lambda item: (item[1], item[0]), reverse=True)
+
+    def take_snapshot(self, version, session=None):
+        top = self.ranked()[:feed.FEED_SNAPSHOT_SIZE]
+        self.snapshots.setdefault(version, ([post_id for post_id, _ in top], [score for _, score in top]))
+        return self.load_snapshot(version)
+
+    def load_snapshot(self, version, session=None):
+        snapshot = self.snapshots.get(version)
+        return (list(snapshot[0]), list(snapshot[1])) if snapshot else None
+
+    def fetch_ranked(self, after=None, limit=None, exclude=()):
+        rows = [
+            Row(post_id, score) for post_id, score in self.ranked()
+            if post_id not in exclude and (after is None or (score, post_id) < after)
+        ]
+        if limit is None or len(rows) <= limit:
+            return rows, None
+        rows = rows[:limit]
+        return rows, (rows[-1].hot_score, rows[-1].id)
+
+    def fetch_posts(self, post_ids):
+        return {post_id: Row(post_id, self.scores[post_id]) for post_id in post_ids if post_id in self.scores}
+
+
+@pytest.fixture
+def posts(monkeypatch):
+    fake = FakeFeed(6)
+    for name in ('take_snapshot', 'load_snapshot', 'fetch_ranked', 'fetch_posts'):
+        monkeypatch.setattr(feed, name, getattr(fake, name))
+    return fake
+
+
+def page(version, position, limit=LIMIT):
+    """One page through the public cursor round trip: (post ids, position for the next page)."""
+    rows, scores, next_position = feed.fetch_page(version, position, limit)
+    assert scores == sorted(scores, reverse=True)
+    cursor = feed.encode_feed_cursor('session', next_position)
+    return [row.id for row in rows], feed.resolve_cursor(cursor)[1] if cursor else None
+
+
+def scroll_all(version, position, limit=LIMIT):
+    seen = []
+    while position is not None:
+        ids, position = page(version, position, limit)
+        seen.extend(ids)
+    return seen
+
+
+def test_score_changes_between_pages_neither_repeat_nor_skip(posts):
+    order = [post_id for post_id, _ in posts.ranked()]
+    first, position = page(1, None)
+    assert first == order[:LIMIT]
+
+    # decay tick + 좋아요: 이미 본 글은 아래로, 아직 안 본 꼴찌 글은 맨 위로
+    posts.scores[order[0]] = 0.5
+    posts.scores[order[-1]] = 100.0
+    seen = first + scroll_all(2, position)
+    assert seen == order
+    assert len(set(seen)) == len(posts.scores)
+
+
+def test_new_scroll_sees_the_new_ranking(posts):
+    order = [post_id for post_id, _ in posts.ranked()]
+    page(1, None)
+    posts.scores[order[-1]] = 100.0
+    first, _ = page(2, None)
+    assert first[0] == order[-1]
+
+
+def test_deleted_post_is_left_out_of_its_page(posts):
+    order = [post_id for post_id, _ in posts.ranked()]
+    _, position = page(1, None)
+    del posts.scores[order[2]]
+    assert scroll_all(2, position) == order[3:]
+
+
+def test_past_the_snapshot_continues_live_without_repeats(posts, monkeypatch):
+    monkeypatch.setattr(feed, 'FEED_SNAPSHOT_SIZE', 3)
+    order = [post_id for post_id, _ in posts.ranked()]
+    first, position = page(1, None)
+    # 스냅샷에 들어 있던 글이 스냅샷 경계 아래로 떨어져도 실시간 구간에서 다시 나오지 않는다
+    posts.scores[order[0]] = 0.1
+    seen = first + scroll_all(2, position)
+    assert seen == order
+    assert len(posts.snapshots[1][0]) == 3
+
+
+def test_expired_snapshot_continues_in_the_current_one(posts):
+    order = [post_id for post_id, _ in posts.ranked()]
+    first, position = page(1, None)
+    posts.snapshots.clear()
+    seen = first + scroll_all(2, position)
+    assert seen == order
+    assert list(posts.snapshots) == [2]
+
+
+def test_pre_snapshot_cursor_is_still_accepted(posts):
+    order = [post_id for post_id, _ in posts.ranked()]
+    cursor = feed.encode_cursor({"session": "s", "score": posts.scores[order[1]], "id": str(order[1])})
+    session, position = feed.resolve_cursor(cursor)
+    assert session == "s"
+    assert scroll_all(2, position) == order[2:]
+
+
+def test_offset_cursor_without_snapshot_is_rejected():
+    cursor = feed.encode_cursor({"session": "s", "offset": 4})
+    with pytest.raises(feed.InvalidCursor):
+        feed.resolve_cursor(cursor)
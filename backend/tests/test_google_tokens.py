@@ -0,0 +1,158 @@
+import time
+
+import jwt
+import pytest
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jwt.algorithms import RSAAlgorithm
+
+import google_tokens
+from google_tokens import StaticKeySet, JWKSKeySet, verify_id_token
+
+AUDIENCE = 'test-client-id.apps.googleusercontent.com'
+
+
+@pytest.fixture(scope='module')
+def private_key():
+    return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+
+@pytest.fixture(scope='module')
+def key_set(private_key):
+    return StaticKeySet({'kid-1': private_key.public_key()})
+
+
+def make_token(private_key, kid='kid-1', **overrides):
+    now = int(time.time())
+    claims = {
+        'iss': 'https://accounts.google.com',
+        'aud': AUDIENCE,
+        'sub': '1234567890',
+        'email': 'user@example.com',
+        'iat': now,
+        'exp': now + 3600,
+    }
+    claims.update(overrides)
+    return jwt.encode(claims, private_key, algorithm='RS256', headers={'kid': kid})
+
+
+class FakeResponse:
+    def __init__(self, keys):
+        self._body = {'keys': keys}
+        self.headers = {'Cache-Control': 'public, max-age=3600'}
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self._body
+
+
+class FakeSession:
+    """Serves a JWKS document and counts fetches."""
+
+    def __init__(self, *public_keys):
+        self.fetches = 0
+        self.set_keys(*public_keys)
+
+    def set_keys(self, *public_keys):
+        self.keys = []
+        for kid, public_key in public_keys:
+            jwk = RSAAlgorithm.to_jwk(public_key, as_dict=True)
+            jwk.update(kid=kid, alg='RS256', use='sig')
+            self.keys.append(jwk)
+
+    def get(self, url, timeout=None):
+        self.fetches += 1
+        return FakeResponse(self.keys)
+
+
+def test_valid_token(private_key, key_set):
+    claims = verify_id_token(make_token(private_key), AUDIENCE, key_set)
+    assert claims['sub'] == '1234567890'
+    assert claims['email'] == 'user@example.com'
+
+
+def test_issuer_without_scheme_is_accepted(private_key, key_set):
+    claims = verify_id_token(make_token(private_key, iss='accounts.google.com'), AUDIENCE, key_set)
+    assert claims['iss'] == 'accounts.google.com'
+
+
+def test_wrong_audience(private_key, key_set):
+    with pytest.raises(jwt.InvalidAudienceError):
+        verify_id_token(make_token(private_key, aud='someone-else'), AUDIENCE, key_set)
+
+
+def test_wrong_issuer(private_key, key_set):
+    with pytest.raises(jwt.InvalidIssuerError):
+        verify_id_token(make_token(private_key, iss='https://evil.example.com'), AUDIENCE, key_set)
+
+
+def test_expired_token(private_key, key_set):
+    past = int(time.time()) - 2 * 3600
+    token = make_token(private_key, iat=past, exp=past + 3600)
+    with pytest.raises(jwt.ExpiredSignatureError):
+        verify_id_token(token, AUDIENCE, key_set)
+
+
+def test_expiry_within_clock_skew_is_accepted(private_key, key_set):
+    token = make_token(private_key, exp=int(time.time()) - google_tokens.CLOCK_SKEW // 2)
+    assert verify_id_token(token, AUDIENCE, key_set)['aud'] == AUDIENCE
+
+
+def test_tampered_signature(private_key, key_set):
+    header, payload, signature = make_token(private_key).split('.')
+    middle = len(signature) // 2
+    flipped = 'A' if signature[middle] != 'A' else 'B'
+    token = '.'.join([header, payload, signature[:middle] + flipped + signature[middle + 1:]])
+    with pytest.raises(jwt.InvalidSignatureError):
+        verify_id_token(token, AUDIENCE, key_set)
+
+
+def test_tampered_payload(private_key, key_set):
+    header, _, signature = make_token(private_key).split('.')
+    _, payload, _ = make_token(private_key, sub='someone-else').split('.')
+    with pytest.raises(jwt.InvalidSignatureError):
+        verify_id_token('.'.join([header, payload, signature]), AUDIENCE, key_set)
+
+
+def test_signed_by_another_key(key_set):
+    other = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    with pytest.raises(jwt.InvalidSignatureError):
+        verify_id_token(make_token(other), AUDIENCE, key_set)
+
+
+def test_non_rs256_token_is_rejected(key_set):
+    token = jwt.encode({'sub': 'x'}, 'secret', algorithm='HS256', headers={'kid': 'kid-1'})
+    with pytest.raises(jwt.InvalidAlgorithmError):
+        verify_id_token(token, AUDIENCE, key_set)
+
+
+def test_unknown_kid_refreshes_then_rejects(private_key):
+    session = FakeSession(('kid-1', private_key.public_key()))
+    keys = JWKSKeySet('https://example.com/certs', session=session)
+    verify_id_token(make_token(private_key), AUDIENCE, keys)
+    assert session.fetches == 1
+
+    # 마지막 갱신 후 MIN_FORCED_REFRESH_SECONDS가 지난 상태
+    keys.fetched_at -= google_tokens.MIN_FORCED_REFRESH_SECONDS
+    with pytest.raises(jwt.InvalidKeyError):
+        verify_id_token(make_token(private_key, kid='kid-unknown'), AUDIENCE, keys)
+    assert session.fetches == 2
+
+    # 방금 갱신했으므로 또 모르는 kid가 와도 바로 다시 받지 않는다
+    with pytest.raises(jwt.InvalidKeyError):
+        verify_id_token(make_token(private_key, kid='kid-unknown'), AUDIENCE, keys)
+    assert session.fetches == 2
+
+
+def test_unknown_kid_picks_up_rotated_key(private_key):
+    rotated = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    session = FakeSession(('kid-1', private_key.public_key()))
+    keys = JWKSKeySet('https://example.com/certs', session=session)
+    verify_id_token(make_token(private_key), AUDIENCE, keys)
+
+    session.set_keys(('kid-1', private_key.public_key()), ('kid-2', rotated.public_key()))
+    keys.fetched_at -= google_tokens.MIN_FORCED_REFRESH_SECONDS
+    claims = verify_id_token(make_token(rotated, kid='kid-2'), AUDIENCE, keys)
+    assert claims['sub'] == '1234567890'
+    assert session.fetches == 2
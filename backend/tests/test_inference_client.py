@@ -0,0 +1,158 @@
+import asyncio
+
+import httpx
+import pytest
+import requests
+
+import inference_client
+from inference_client import AsyncInferenceClient, CircuitBreaker, CircuitOpen, InferenceClient, InferenceError
+
+
+def fake_response(status, body=b'{}'):
+    resp = requests.Response()
+    resp.status_code = status
+    resp._content = body
+    return resp
+
+
+class FakeSession:
+    """requests.Session stand-in: each post() pops the next response or raises it."""
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    def post(self, url, **kwargs):
+        self.calls += 1
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return outcome
+
+
+def half_open_breaker():
+    """A breaker that is open and already past its reset time."""
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=0)
+    breaker.record_failure()
+    return breaker
+
+
+def test_opens_after_threshold():
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=60)
+    client = InferenceClient('http://llm', session=FakeSession(fake_response(500), fake_response(500)), circuit=breaker)
+    for _ in range(2):
+        with pytest.raises(InferenceError):
+            client.post('/generate', {})
+    assert breaker.state == 'open'
+    with pytest.raises(CircuitOpen):
+        client.post('/generate', {})
+
+
+def test_trial_success_closes():
+    breaker = half_open_breaker()
+    client = InferenceClient('http://llm', session=FakeSession(fake_response(200, b'{"ok": true}')), circuit=breaker)
+    assert client.post('/generate', {}) == {"ok": True}
+    assert breaker.state == 'closed'
+
+
+def test_trial_5xx_reopens():
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=60)
+    breaker.record_failure()
+    breaker.opened_at -= 60
+    client = InferenceClient('http://llm', session=FakeSession(fake_response(500)), circuit=breaker)
+    with pytest.raises(InferenceError):
+        client.post('/generate', {})
+    assert breaker.state == 'open'
+
+
+def test_trial_4xx_closes():
+    breaker = half_open_breaker()
+    session = FakeSession(fake_response(400, b'bad request'), fake_response(200))
+    client = InferenceClient('http://llm', session=session, circuit=breaker)
+    with pytest.raises(InferenceError):
+        client.post('/generate', {})
+    # 4xx도 서버가 응답한 것이므로 breaker가 닫히고 다음 호출이 나간다
+    assert breaker.state == 'closed'
+    assert client.post('/generate', {}) == {}
+    assert session.calls == 2
+
+
+def test_trial_unexpected_error_releases_trial():
+    breaker = half_open_breaker()
+    session = FakeSession(RuntimeError("boom"), fake_response(200))
+    client = InferenceClient('http://llm', session=session, circuit=breaker)
+    with pytest.raises(RuntimeError):
+        client.post('/generate', {})
+    # 결과 없이 끝난 시도는 다음 호출이 다시 시도할 수 있게 풀린다
+    assert client.post('/generate', {}) == {}
+    assert breaker.state == 'closed'
+
+
+def test_only_one_trial_at_a_time():
+    breaker = half_open_breaker()
+    assert breaker.before_call() is True
+    with pytest.raises(CircuitOpen):
+        breaker.before_call()
+    breaker.release_trial()
+    assert breaker.before_call() is True
+
+
+def test_non_trial_call_does_not_release_trial():
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=0)
+
+    class Session:
+        def post(self, url, **kwargs):
+            # 이 호출이 진행되는 동안 breaker가 열리고 다른 호출이 half-open 시도를 가져간다
+            breaker.record_failure()
+            assert breaker.before_call() is True
+            raise RuntimeError("boom")
+
+    client = InferenceClient('http://llm', session=Session(), circuit=breaker)
+    with pytest.raises(RuntimeError):
+        client.post('/generate', {})
+    with pytest.raises(CircuitOpen):
+        breaker.before_call()
+
+
+def async_client(breaker, *statuses):
+    statuses = list(statuses)
+
+    def handler(request):
+        status = statuses.pop(0)
+        if isinstance(status, BaseException):
+            raise status
+        return httpx.Response(status, json={} if status == 200 else None)
+
+    client = AsyncInferenceClient('http://llm', circuit=breaker)
+    client.http = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return client
+
+
+@pytest.mark.skipif(inference_client.httpx is None, reason="httpx not installed")
+def test_async_trial_4xx_closes():
+    breaker = half_open_breaker()
+    client = async_client(breaker, 404, 200)
+
+    async def run():
+        with pytest.raises(InferenceError):
+            await client.post('/generate', {})
+        assert breaker.state == 'closed'
+        assert await client.post('/generate', {}) == {}
+        await client.aclose()
+
+    asyncio.run(run())
+
+
+@pytest.mark.skipif(inference_client.httpx is None, reason="httpx not installed")
+def test_async_trial_cancelled_releases_trial():
+    breaker = half_open_breaker()
+    client = async_client(breaker, asyncio.CancelledError(), 200)
+
+    async def run():
+        with pytest.raises(asyncio.CancelledError):
+            await client.post('/generate', {})
+        assert await client.post('/generate', {}) == {}
+        assert breaker.state == 'closed'
+        await client.aclose()
+
+    asyncio.run(run())
@@ -0,0 +1,42 @@
+import os
+
+import pytest
+
+# app은 import 시점에 DB URL을 읽기만 하고 연결은 하지 않는다
+os.environ.setdefault('DATABASE_URL', 'postgresql+psycopg://localhost/unused')
+
+import app as backend
+
+TOKEN = 'internal-metrics-token'
+
+
+@pytest.fixture
+def client(monkeypatch):
+    # before_request가 ranker/LISTEN 스레드를 띄우지 않게 한다
+    monkeypatch.setattr(backend, '_background_started', True)
+    monkeypatch.setattr(backend, 'METRICS_TOKEN', TOKEN)
+    monkeypatch.setattr(backend.jobs, 'queue_stats', lambda session: {"queueDepth": 0})
+    return backend.app.test_client()
+
+
+def test_signed_in_user_cannot_read_background_metrics(client):
+    access_token, _ = backend.create_tokens('00000000-0000-0000-0000-000000000001')
+    resp = client.get('/metrics/background', headers={'Authorization': f'Bearer {access_token}'})
+    assert resp.status_code == 403
+
+
+def test_wrong_metrics_token_is_rejected(client):
+    resp = client.get('/metrics/background', headers={'X-Metrics-Token': TOKEN + 'x'})
+    assert resp.status_code == 403
+
+
+def test_metrics_token_opens_background_metrics(client):
+    resp = client.get('/metrics/background', headers={'X-Metrics-Token': TOKEN})
+    assert resp.status_code == 200
+    assert resp.get_json()["botJobs"] == {"queueDepth": 0}
+
+
+def test_background_metrics_are_off_without_a_configured_token(client, monkeypatch):
+    monkeypatch.setattr(backend, 'METRICS_TOKEN', None)
+    resp = client.get('/metrics/background', headers={'X-Metrics-Token': ''})
+    assert resp.status_code == 404
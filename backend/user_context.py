@@ -0,0 +1,68 @@
+"""
+Authenticated user context.
+
+require_auth verifies the access token through a small TTL cache of
+token -> claims, and routes call current_user() for a read-only profile
+snapshot that is loaded at most once per request and cached per process.
+Counters (post_cnt, ...) are not part of the snapshot; routes that show them
+load the User row themselves.
+
+PATCH /my calls invalidate_profile(). Other gunicorn workers pick up the
+change once their entry expires, i.e. within PROFILE_TTL seconds.
+"""
+import os
+import time
+
+import jwt
+from flask import g
+
+from cache import LocalCache
+from models import db, User
+
+TOKEN_TTL = int(os.getenv('AUTH_TOKEN_CACHE_SECONDS', '300'))
+PROFILE_TTL = int(os.getenv('AUTH_PROFILE_CACHE_SECONDS', '30'))
+
+PROFILE_COLUMNS = (
+    User.id, User.email, User.display_name, User.age, User.gender,
+    User.setting_mbti, User.setting_intensity, User.style,
+)
+
+_tokens = LocalCache(max_entries=int(os.getenv('AUTH_TOKEN_CACHE_SIZE', '10000')))
+_profiles = LocalCache(max_entries=int(os.getenv('AUTH_PROFILE_CACHE_SIZE', '10000')))
+
+
+def decode_access_token(token, secret):
+    """
+    Verified claims of an HS256 token. Raises jwt.InvalidTokenError (or
+    ExpiredSignatureError) like jwt.decode; only valid tokens are cached, and
+    never past their `exp`.
+    """
+    found = _tokens.get_many([token])
+    if token in found:
+        return found[token]
+    payload = jwt.decode(token, secret, algorithms=['HS256'])
+    ttl = TOKEN_TTL
+    if 'exp' in payload:
+        ttl = min(ttl, payload['exp'] - time.time())
+    if ttl > 0:
+        _tokens.set(token, payload, ttl)
+    return payload
+
+
+def current_user():
+    """Profile snapshot (PROFILE_COLUMNS) of g.user_id, or None if the user does not exist."""
+    if 'user' not in g:
+        key = str(g.user_id)
+        found = _profiles.get_many([key])
+        if key in found:
+            g.user = found[key]
+        else:
+            g.user = db.session.query(*PROFILE_COLUMNS).filter(User.id == g.user_id).first()
+            if g.user is not None:
+                _profiles.set(key, g.user, PROFILE_TTL)
+    return g.user
+
+
+def invalidate_profile(user_id):
+    _profiles.delete(str(user_id))
+    g.pop('user', None)
@@ -0,0 +1,232 @@
+"""
+Bot reply worker.
+
+Claims BOT_JOB rows and generates the replies. Run as many worker processes
+(on as many machines) as needed; they coordinate through the table only.
+
+    python worker.py --concurrency 4
+    python worker.py --async --concurrency 32
+
+With --async the generations run as asyncio tasks over one pooled httpx
+client, so many replies can stream at once without a thread each; the short
+database calls between stream chunks still run on a small thread pool.
+"""
+import argparse
+import asyncio
+import os
+import signal
+import time
+
+import background
+import context
+import inference_client
+import jobs
+import replies
+
+POLL_SECONDS = float(os.getenv('BOT_WORKER_POLL_SECONDS', '1'))
+# 스트리밍 중인 답변을 BOT_JOB.partial_text에 쓰는 최소 간격 (GET /chat/stream 지연과 DB 쓰기 수의 절충)
+FLUSH_SECONDS = float(os.getenv('BOT_STREAM_FLUSH_SECONDS', '0.25'))
+MAINTENANCE_SECONDS = 60
+STATS_SECONDS = 60
+
+
+def prepare(session, job):
+    payload = replies.build_request(session, job.conversation_id, job.user_id, job.use_local_llm)
+    session.commit()  # 생성하는 동안 커넥션을 풀에 돌려준다
+    return payload
+
+
+def finish(session, job, content):
+    # 답변 저장과 완료 표시를 한 트랜잭션으로: lease를 잃었으면 둘 다 버린다
+    bot_msg = replies.save_reply(session, job.conversation_id, job.user_id, content)
+    session.flush()
+    if not jobs.complete(session, job, bot_msg.id):
+        session.rollback()
+        print(f"Bot job {job.id} lost its lease (attempt {job.attempts}), dropping reply")
+        return
+    session.commit()
+    summarize(session, job.conversation_id)
+
+
+def summarize(session, conversation_id):
+    """Roll old turns into the conversation summary; failures only delay it to a later reply."""
+    try:
+        context.update_summary(session, conversation_id)
+    except Exception as e:
+        session.rollback()
+        print(f"Conversation {conversation_id} summary update failed: {e}")
+
+
+def record_failure(session, job, error):
+    session.rollback()
+    status = jobs.fail(session, job, error)
+    print(f"Bot job {job.id} attempt {job.attempts}/{job.max_attempts} failed ({status}): {error}")
+
+
+def process(job):
+    session = background.Session()
+    try:
+        try:
+            payload = prepare(session, job)
+            content = stream_to_job(session, job, payload)
+            if content is not None:
+                finish(session, job, content)
+        except Exception as e:
+            record_failure(session, job, e)
+    finally:
+        session.close()
+
+
+async def process_async(job, client):
+    session = background.Session()
+    try:
+        try:
+            payload = await asyncio.to_thread(prepare, session, job)
+            content = await stream_to_job_async(session, job, payload, client)
+            if content is not None:
+                await asyncio.to_thread(finish, session, job, content)
+        except Exception as e:
+            await asyncio.to_thread(record_failure, session, job, e)
+    finally:
+        await asyncio.to_thread(session.close)
+
+
+def stream_to_job(session, job, payload):
+    """
+    Relay the streamed reply into BOT_JOB.partial_text, at most once per
+    FLUSH_SECONDS. Returns the final text, or None if the lease was lost.
+    """
+    text = ""
+    last_flush = time.monotonic()
+    for kind, value in replies.stream_reply(payload):
+        if kind == "done":
+            return value
+        text += value
+        if time.monotonic() - last_flush >= FLUSH_SECONDS:
+            if not jobs.save_progress(session, job, text):
+                print(f"Bot job {job.id} lost its lease (attempt {job.attempts}), stopping stream")
+                return None
+            last_flush = time.monotonic()
+
+
+async def stream_to_job_async(session, job, payload, client):
+    """stream_to_job() for process_async()."""
+    text = ""
+    last_flush = time.monotonic()
+    async for kind, value in replies.stream_reply_async(payload, client):
+        if kind == "done":
+            return value
+        text += value
+        if time.monotonic() - last_flush >= FLUSH_SECONDS:
+            if not await asyncio.to_thread(jobs.save_progress, session, job, text):
+                print(f"Bot job {job.id} lost its lease (attempt {job.attempts}), stopping stream")
+                return None
+            last_flush = time.monotonic()
+
+
+def maintenance():
+    session = background.Session()
+    try:
+        reaped = jobs.reap_expired(session)
+        if reaped:
+            print(f"Dead-lettered {reaped} timed-out bot jobs")
+        jobs.purge_done(session)
+    except Exception as e:
+        session.rollback()
+        print(f"Bot job maintenance error: {e}")
+    finally:
+        session.close()
+
+
+def claim_next():
+    session = background.Session()
+    try:
+        return jobs.claim(session)
+    except Exception as e:
+        session.rollback()
+        print(f"Bot job claim error: {e}")
+        return None
+    finally:
+        session.close()
+
+
+def run_threads(concurrency, stopping):
+    executor = background.BoundedExecutor(concurrency, 0, name="bot-worker")
+    next_maintenance = next_stats = time.monotonic()
+    while not stopping:
+        now = time.monotonic()
+        if now >= next_maintenance:
+            maintenance()
+            next_maintenance = now + MAINTENANCE_SECONDS
+        if now >= next_stats:
+            print(f"Bot worker stats: {executor.stats()} inference={inference_client.breaker.stats()}")
+            next_stats = now + STATS_SECONDS
+
+        if not executor.has_capacity():
+            time.sleep(0.05)
+            continue
+        job = claim_next()
+        if job is None:
+            time.sleep(POLL_SECONDS)
+            continue
+        executor.submit(process, job)
+
+    print("Bot worker stopping, waiting for running jobs")
+    executor.shutdown()
+
+
+async def run_async(concurrency, stopping):
+    client = inference_client.AsyncInferenceClient()
+    running = set()
+    next_maintenance = next_stats = time.monotonic()
+    while not stopping:
+        now = time.monotonic()
+        if now >= next_maintenance:
+            await asyncio.to_thread(maintenance)
+            next_maintenance = now + MAINTENANCE_SECONDS
+        if now >= next_stats:
+            print(f"Bot worker stats: running={len(running)} inference={inference_client.breaker.stats()}")
+            next_stats = now + STATS_SECONDS
+
+        if len(running) >= concurrency:
+            await asyncio.wait(running, timeout=POLL_SECONDS, return_when=asyncio.FIRST_COMPLETED)
+            continue
+        job = await asyncio.to_thread(claim_next)
+        if job is None:
+            await asyncio.sleep(POLL_SECONDS)
+            continue
+        task = asyncio.create_task(process_async(job, client))
+        running.add(task)
+        task.add_done_callback(running.discard)
+
+    print("Bot worker stopping, waiting for running jobs")
+    if running:
+        await asyncio.wait(running)
+    await client.aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--concurrency', type=int, default=int(os.getenv('BOT_WORKER_CONCURRENCY', '4')))
+    parser.add_argument('--async', dest='use_async', action='store_true',
+                        default=os.getenv('BOT_WORKER_ASYNC', '0') == '1',
+                        help='Run generations as asyncio tasks (requires httpx).')
+    args = parser.parse_args()
+
+    # app을 import하면 설정이 로드되고 background.Session이 앱 엔진에 바인딩된다
+    import app  # noqa: F401
+
+    stopping = []
+    # SIGTERM: 새 작업은 그만 가져오고, 실행 중인 작업은 끝낸 뒤 종료
+    signal.signal(signal.SIGTERM, lambda *_: stopping.append(True))
+    signal.signal(signal.SIGINT, lambda *_: stopping.append(True))
+
+    print(f"Bot worker started with concurrency {args.concurrency}{' (async)' if args.use_async else ''}")
+    if args.use_async:
+        asyncio.run(run_async(args.concurrency, stopping))
+    else:
+        run_threads(args.concurrency, stopping)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,317 @@
+"""
+Dynamic request batching for the local LLM.
+
+BatchScheduler owns the model: one scheduler thread collects pending requests
+for up to `max_wait_ms` (or until `max_batch_size` are waiting), left-pads
+them into one batch and runs a single generate() call. Generated tokens are
+routed back to each request as they are produced, so both the blocking and
+the streaming endpoints are served from the same batches.
+
+Requests are only batched with others that use the same sampling settings
+(generate() takes one temperature/top_p). Rows may use different LoRA
+adapters when the ChatBot supports mixed-adapter batches; otherwise the
+adapter is part of the batching key as well. Each row stops on its own (EOS,
+its own max_new_tokens, foreign script, or the client going away) through a
+per-row stopping criterion. A request waits at most `queue_timeout` for a
+place in a batch; once its batch starts, STREAM_TIMEOUT applies between
+pieces.
+
+BatchScheduler.generate_response() and stream_response() take the same
+arguments as ChatBot's, so inference_server.py can use either.
+
+Try it on CPU with a tiny model:
+
+    python batching.py --model hf-internal-testing/tiny-random-LlamaForCausalLM --requests 8
+"""
+import queue
+import threading
+import time
+from collections import deque
+
+import torch
+from transformers import StoppingCriteria, StoppingCriteriaList
+from transformers.generation.streamers import BaseStreamer
+
+from chatbot_not_merged_model import FOREIGN_SCRIPT, STREAM_TIMEOUT, truncate_foreign
+
+METRIC_SAMPLES = 200  # 통계에 쓰는 최근 배치/요청 수
+MIN_RESPONSE_CHARS = 5  # 이보다 짧게 잘린 답변은 다시 생성 (ChatBot.generate_response와 동일)
+QUEUE_TIMEOUT = 120  # 배치에 들어가기까지 기다리는 최대 시간 (들어간 뒤 조각 사이 대기는 STREAM_TIMEOUT)
+_END = object()
+_STARTED = object()
+
+
+class GenerationRequest:
+    """One conversation waiting for (or being served by) a batch."""
+
+    def __init__(self, messages, max_new_tokens, temperature, top_p, adapter=None, queue_timeout=QUEUE_TIMEOUT):
+        self.messages = messages
+        self.adapter = adapter
+        self.max_new_tokens = max_new_tokens
+        self.temperature = temperature
+        self.top_p = top_p
+        self.enqueued_at = time.monotonic()
+        self.queue_timeout = queue_timeout
+        self.cancelled = False
+        self.stopped_foreign = False
+        self.raw_text = None  # 외국어에서 멈춘 경우, 그 외국어까지 포함한 원문
+        self._pieces = queue.Queue()
+
+    def start(self):
+        # 배치에 들어간 시점부터 조각 사이 타임아웃(STREAM_TIMEOUT)을 적용한다
+        self._pieces.put(_STARTED)
+
+    def push(self, piece):
+        self._pieces.put(piece)
+
+    def finish(self, error=None):
+        self._pieces.put(error if error is not None else _END)
+
+    def cancel(self):
+        self.cancelled = True
+
+    def __iter__(self):
+        queued = True
+        while True:
+            try:
+                item = self._pieces.get(timeout=self.queue_timeout if queued else STREAM_TIMEOUT)
+            except queue.Empty:
+                self.cancel()
+                if queued:
+                    raise TimeoutError("Timed out waiting for a slot in a generation batch")
+                raise TimeoutError("Timed out waiting for the generation batch")
+            if item is _STARTED:
+                queued = False
+                continue
+            if item is _END:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+
+
+class _BatchStreamer(BaseStreamer):
+    """Routes each row's new tokens to its request as text pieces."""
+
+    def __init__(self, tokenizer, requests, eos_ids):
+        self.tokenizer = tokenizer
+        self.requests = requests
+        self.eos_ids = eos_ids
+        self.tokens = [[] for _ in requests]
+        self.sent = [0] * len(requests)
+        self.done = [False] * len(requests)
+        self._prompt_seen = False
+
+    def put(self, value):
+        # 첫 호출은 프롬프트 토큰
+        if not self._prompt_seen:
+            self._prompt_seen = True
+            return
+        for i, token in enumerate(value.reshape(-1).tolist()):
+            if self.done[i]:
+                continue
+            request = self.requests[i]
+            if request.cancelled or token in self.eos_ids:
+                self.done[i] = True
+                continue
+            self.tokens[i].append(token)
+            self._emit(i)
+            if len(self.tokens[i]) >= request.max_new_tokens:
+                self.done[i] = True
+
+    def _emit(self, i):
+        text = self.tokenizer.decode(self.tokens[i], skip_special_tokens=True)
+        # 멀티바이트 글자가 토큰 중간에서 잘린 상태면 다음 토큰까지 기다린다
+        if text.endswith('�'):
+            return
+        piece = text[self.sent[i]:]
+        foreign_match = FOREIGN_SCRIPT.search(piece)
+        if foreign_match:
+            piece = piece[:foreign_match.start()]
+            self.requests[i].stopped_foreign = True
+            self.requests[i].raw_text = text
+            self.done[i] = True
+        if piece:
+            self.requests[i].push(piece)
+        self.sent[i] = len(text)
+
+    def end(self):
+        for request in self.requests:
+            request.finish()
+
+
+class _RowsDone(StoppingCriteria):
+    """Per-row stop flags from the streamer (finished rows stop generating)."""
+
+    def __init__(self, streamer):
+        self.streamer = streamer
+
+    def __call__(self, input_ids, scores, **kwargs):
+        return torch.tensor(self.streamer.done, dtype=torch.bool, device=input_ids.device)
+
+
+class BatchScheduler:
+    def __init__(self, bot, max_batch_size: int = 8, max_wait_ms: float = 10, name: str = "batcher", queue_timeout: float = QUEUE_TIMEOUT):
+        self.bot = bot
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.queue_timeout = queue_timeout
+        self.name = name
+        self._pending = deque()
+        self._cond = threading.Condition()
+        self._lock = threading.Lock()
+        self._batch_sizes = deque(maxlen=METRIC_SAMPLES)
+        self._adapters_per_batch = deque(maxlen=METRIC_SAMPLES)
+        self._waits = deque(maxlen=METRIC_SAMPLES)
+        self.batches = 0
+        self.requests = 0
+        self.failed = 0
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, messages: list, max_new_tokens: int = 200, temperature: float = 0.6, top_p: float = 0.95, adapter: str = None) -> GenerationRequest:
+        # 잘못된 어댑터 이름은 큐에 넣기 전에 거절한다 (배치에 섞이면 같은 배치의 요청까지 모두 실패한다)
+        self.bot.check_adapters([adapter])
+        request = GenerationRequest(messages, max_new_tokens, temperature, top_p, adapter, self.queue_timeout)
+        with self._cond:
+            self._pending.append(request)
+            self._cond.notify()
+        return request
+
+    def stream_response(self, messages: list, max_new_tokens: int = 200, temperature: float = 0.6, top_p: float = 0.95, adapter: str = None):
+        """Same as ChatBot.stream_response, served from a batch."""
+        request = self.submit(messages, max_new_tokens, temperature, top_p, adapter)
+        try:
+            yield from request
+        finally:
+            # 클라이언트 연결이 끊기면 배치 안의 이 행만 멈춘다
+            request.cancel()
+
+    def generate_response(self, messages: list, max_new_tokens: int = 200, temperature: float = 0.6, top_p: float = 0.95, max_retries: int = 3, adapter: str = None) -> str:
+        """Same as ChatBot.generate_response, served from a batch."""
+        truncated_response = ""
+        for attempt in range(max_retries + 1):
+            # Dynamic temperature: lower it on retries to be more conservative
+            current_temp = max(0.1, temperature - (attempt * 0.1))
+            request = self.submit(messages, max_new_tokens, current_temp, top_p, adapter)
+            response = "".join(request)
+            if not request.stopped_foreign:
+                return response
+            truncated_response = truncate_foreign(request.raw_text)
+            if len(response.strip()) >= MIN_RESPONSE_CHARS:
+                return truncated_response
+            print(f"[Warning] Detected foreign script (e.g. English/Chinese) in attempt {attempt+1}. Retrying...")
+
+        print("[Error] Failed to generate pure Korean response after retries.")
+        if len(truncated_response) > MIN_RESPONSE_CHARS:
+            return truncated_response
+        return "말문이 막히네... (오류: 답변 생성 실패)"
+
+    def _key(self, request):
+        if self.bot.mixed_adapter_batches:
+            return (request.temperature, request.top_p)
+        return (request.temperature, request.top_p, request.adapter)
+
+    def _next_batch(self):
+        with self._cond:
+            while not self._pending:
+                self._cond.wait()
+            deadline = self._pending[0].enqueued_at + self.max_wait
+            while len(self._pending) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            # 가장 오래 기다린 요청과 샘플링 설정이 같은 요청만 함께 묶는다
+            key = self._key(self._pending[0])
+            batch = [r for r in self._pending if self._key(r) == key and not r.cancelled][:self.max_batch_size]
+            taken = set(map(id, batch))
+            self._pending = deque(r for r in self._pending if id(r) not in taken and not r.cancelled)
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                continue
+            started = time.monotonic()
+            with self._lock:
+                self.batches += 1
+                self.requests += len(batch)
+                self._batch_sizes.append(len(batch))
+                self._adapters_per_batch.append(len({r.adapter for r in batch}))
+                self._waits.extend(started - r.enqueued_at for r in batch)
+            for request in batch:
+                request.start()
+            try:
+                self._generate(batch)
+            except Exception as e:
+                print(f"{self.name} batch of {len(batch)} failed: {e}")
+                with self._lock:
+                    self.failed += len(batch)
+                for request in batch:
+                    request.finish(e)
+
+    def _generate(self, batch):
+        streamer = _BatchStreamer(self.bot.tokenizer, batch, self.bot.eos_token_ids())
+        self.bot.generate_batch(
+            [r.messages for r in batch],
+            max_new_tokens=max(r.max_new_tokens for r in batch),
+            temperature=batch[0].temperature,
+            top_p=batch[0].top_p,
+            streamer=streamer,
+            stopping_criteria=StoppingCriteriaList([_RowsDone(streamer)]),
+            adapters=[r.adapter for r in batch],
+        )
+
+    def stats(self):
+        with self._lock:
+            sizes = list(self._batch_sizes)
+            adapters_per_batch = list(self._adapters_per_batch)
+            waits = sorted(self._waits)
+            pending = len(self._pending)
+            return {
+                "pending": pending,
+                "batches": self.batches,
+                "requests": self.requests,
+                "failed": self.failed,
+                "maxBatchSize": self.max_batch_size,
+                "batchSizeAvg": sum(sizes) / len(sizes) if sizes else 0.0,
+                "batchSizeMax": max(sizes) if sizes else 0,
+                "adaptersPerBatchAvg": sum(adapters_per_batch) / len(adapters_per_batch) if adapters_per_batch else 0.0,
+                "queueWaitMsAvg": 1000 * sum(waits) / len(waits) if waits else 0.0,
+                "queueWaitMsP95": 1000 * waits[min(len(waits) - 1, int(len(waits) * 0.95))] if waits else 0.0,
+                "queueWaitMsMax": 1000 * waits[-1] if waits else 0.0,
+            }
+
+
+if __name__ == "__main__":
+    import argparse
+    from concurrent.futures import ThreadPoolExecutor
+
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+
+    from chatbot_not_merged_model import ChatBot
+
+    parser = argparse.ArgumentParser(description="Run concurrent requests through a BatchScheduler on CPU.")
+    parser.add_argument("--model", default="hf-internal-testing/tiny-random-LlamaForCausalLM")
+    parser.add_argument("--requests", type=int, default=8)
+    parser.add_argument("--max-batch-size", type=int, default=4)
+    parser.add_argument("--max-wait-ms", type=float, default=20)
+    args = parser.parse_args()
+
+    tokenizer = AutoTokenizer.from_pretrained(args.model)
+    if tokenizer.chat_template is None:
+        # 테스트용 작은 모델에는 chat template이 없는 경우가 많다
+        tokenizer.chat_template = "{% for m in messages %}{{ m['role'] }}: {{ m['content'] }}\n{% endfor %}assistant:"
+    model = AutoModelForCausalLM.from_pretrained(args.model)
+    scheduler = BatchScheduler(ChatBot(model=model, tokenizer=tokenizer), args.max_batch_size, args.max_wait_ms)
+
+    def ask(i):
+        messages = [{"role": "user", "content": f"요청 {i}"}]
+        return "".join(scheduler.stream_response(messages, max_new_tokens=8 + i, temperature=0.7))
+
+    with ThreadPoolExecutor(max_workers=args.requests) as pool:
+        for i, text in enumerate(pool.map(ask, range(args.requests))):
+            print(f"[{i}] {text!r}")
+    print(scheduler.stats())
@@ -1,13 +1,64 @@
 import torch
-from transformers import AutoTokenizer, AutoModelForCausalLM, BitsAndBytesConfig
+from transformers import AutoTokenizer, AutoModelForCausalLM, BitsAndBytesConfig, TextIteratorStreamer, StoppingCriteria, StoppingCriteriaList
 from peft import PeftModel
+from threading import Thread
 import re
 
+# Latin (a-z), Chinese (\u4e00-\u9fff), Japanese kana, Cyrillic (\u0400-\u04ff)
+FOREIGN_SCRIPT = re.compile(r'[a-zA-Z\u4e00-\u9fff\u3040-\u30ff\u0400-\u04ff]')
+STREAM_TIMEOUT = 60 # seconds to wait for the next streamed piece
+
+def truncate_foreign(response: str) -> str:
+    """
+    Cut the response right before the first foreign-script character and end
+    it on the last sentence punctuation. Returns the response unchanged if it
+    is pure Korean.
+    """
+    foreign_match = FOREIGN_SCRIPT.search(response)
+    if not foreign_match:
+        return response
+    # 외국어가 나오기 직전까지만 잘라서 살리기
+    truncated_response = response[:foreign_match.start()].strip()
+    # 문장 부호로 깔끔하게 마무리
+    last_punct = -1
+    for char in ".!?~":
+        pos = truncated_response.rfind(char)
+        if pos > last_punct:
+            last_punct = pos
+    if last_punct != -1:
+        truncated_response = truncated_response[:last_punct+1]
+    return truncated_response
+
+class _StopFlag(StoppingCriteria):
+    """Lets the streaming consumer stop generate() early."""
+    def __init__(self):
+        self.stop = False
+
+    def __call__(self, input_ids, scores, **kwargs):
+        return self.stop
+
+BASE_ADAPTER = "__base__" # adapter_names에서 어댑터 없이 base 모델만 쓰는 PEFT 예약 이름
+
 class ChatBot:
-    def __init__(self, base_model_path: str = "LGAI-EXAONE/EXAONE-3.0-7.8B-Instruct", adapter_path: str = "./lora_adapter_funny"):
+    def __init__(self, base_model_path: str = "LGAI-EXAONE/EXAONE-3.0-7.8B-Instruct", adapter_path: str = "./lora_adapter_funny", model=None, tokenizer=None):
         """
         Initialize the ChatBot model with 4-bit quantization and LoRA adapter.
+        The base model is loaded once; `adapter_path` is registered as the
+        "default" adapter and more can be added with load_adapter(). Every
+        generate method takes an `adapter` name, so one ChatBot serves all
+        styles (adapters only cost their own LoRA weights).
+        Pass `model` and `tokenizer` to use an already loaded model instead
+        (e.g. a tiny causal LM on CPU for testing the batching code).
         """
+        self.adapters = []
+        if model is not None:
+            self.model = model
+            self.tokenizer = tokenizer
+            if isinstance(model, PeftModel):
+                self.adapters = list(model.peft_config)
+            self._setup_padding()
+            return
+
         print(f"Loading base model from: {base_model_path} (4-bit mode)...")
         
         # 4-bit Quantization Configuration
@@ -31,8 +82,7 @@ class ChatBot:
             
             # 2. Load LoRA Adapter
             if adapter_path:
-                print(f"Loading LoRA adapter from: {adapter_path}...")
-                self.model = PeftModel.from_pretrained(self.model, adapter_path)
+                self.load_adapter("default", adapter_path)
                 
             print("Model & Adapter loaded successfully.")
             
@@ -40,19 +90,73 @@ class ChatBot:
             print(f"Error loading model: {e}")
             print("Make sure you have installed: pip install bitsandbytes accelerate peft")
             raise e
+        self._setup_padding()
+
+    def load_adapter(self, name: str, adapter_path: str):
+        """Register a LoRA adapter under `name` on top of the shared base model."""
+        print(f"Loading LoRA adapter '{name}' from: {adapter_path}...")
+        if isinstance(self.model, PeftModel):
+            self.model.load_adapter(adapter_path, adapter_name=name)
+        else:
+            self.model = PeftModel.from_pretrained(self.model, adapter_path, adapter_name=name)
+        self.model.eval()
+        self.adapters.append(name)
+
+    def set_adapter(self, name: str):
+        """Make `name` the adapter used when a call does not pick one."""
+        self.model.set_adapter(name)
+
+    @property
+    def mixed_adapter_batches(self) -> bool:
+        # PEFT LoRA는 adapter_names=로 행마다 다른 어댑터를 쓸 수 있다
+        return isinstance(self.model, PeftModel)
+
+    def check_adapters(self, adapters: list):
+        """Raise ValueError unless every name is None, BASE_ADAPTER or a loaded adapter."""
+        if not any(adapters):
+            return
+        if not self.adapters:
+            raise ValueError(f"No LoRA adapters are loaded (requested {adapters})")
+        unknown = {a for a in adapters if a and a != BASE_ADAPTER and a not in self.adapters}
+        if unknown:
+            raise ValueError(f"Unknown adapter(s): {', '.join(sorted(unknown))}")
 
-    def generate_response(self, messages: list, max_new_tokens: int = 200, temperature: float = 0.6, top_p: float = 0.95, max_retries: int = 3) -> str:
+    def _adapter_kwargs(self, adapters: list) -> dict:
+        """generate() kwargs for per-row adapters; None means the active adapter."""
+        self.check_adapters(adapters)
+        if not any(adapters):
+            return {}
+        active = self.model.active_adapter
+        return {"adapter_names": [a or active for a in adapters]}
+
+    def _setup_padding(self):
+        # 배치 생성은 왼쪽 패딩이어야 모든 행의 새 토큰이 같은 위치에서 시작한다
+        self.tokenizer.padding_side = "left"
+        if self.tokenizer.pad_token is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
+
+    def eos_token_ids(self) -> set:
+        eos = self.model.generation_config.eos_token_id
+        ids = set(eos) if isinstance(eos, (list, tuple)) else {eos}
+        ids.add(self.tokenizer.eos_token_id)
+        return {i for i in ids if i is not None}
+
+    def build_prompt(self, messages: list) -> str:
+        return self.tokenizer.apply_chat_template(
+            messages,
+            tokenize=False,
+            add_generation_prompt=True,
+        )
+
+    def generate_response(self, messages: list, max_new_tokens: int = 200, temperature: float = 0.6, top_p: float = 0.95, max_retries: int = 3, adapter: str = None) -> str:
         """
         Generate a response for the given conversation history.
         Retries if non-Korean (Chinese/Vietnamese) characters are detected.
         """
+        adapter_kwargs = self._adapter_kwargs([adapter])
         for attempt in range(max_retries + 1):
             # Apply the chat template
-            prompt = self.tokenizer.apply_chat_template(
-                messages,
-                tokenize=False,
-                add_generation_prompt=True,
-            )
+            prompt = self.build_prompt(messages)
             
             # Tokenize inputs
             inputs = self.tokenizer(prompt, return_tensors="pt").to(self.model.device)
@@ -69,6 +173,7 @@ class ChatBot:
                     top_p=top_p,
                     do_sample=True,
                     repetition_penalty=1.2, 
+                    **adapter_kwargs,
                 )
                 
             # Decode only the newly generated tokens
@@ -76,29 +181,13 @@ class ChatBot:
             response = self.tokenizer.decode(generated_tokens, skip_special_tokens=True)
             
             # Check for non-Korean characters
-            # Latin (a-z), Chinese (\u4e00-\u9fff), Cyrillic (\u0400-\u04ff)
-            foreign_match = re.search(r'[a-zA-Z\u4e00-\u9fff\u3040-\u30ff\u0400-\u04ff]', response)
-            
+            foreign_match = FOREIGN_SCRIPT.search(response)
             if foreign_match:
-                # 외국어가 나오기 직전까지만 잘라서 살리기
-                first_foreign_index = foreign_match.start()
-                truncated_response = response[:first_foreign_index].strip()
-                
                 # 잘린 문장이 너무 짧으면(예: 5글자 미만) 그냥 재시도
-                if len(truncated_response) < 5:
+                if len(response[:foreign_match.start()].strip()) < 5:
                     print(f"[Warning] Detected foreign script (e.g. English/Chinese) in attempt {attempt+1}. Retrying...")
                     continue
-                
-                # 문장 부호로 깔끔하게 마무리
-                last_punct = -1
-                for char in ".!?~":
-                    pos = truncated_response.rfind(char)
-                    if pos > last_punct:
-                        last_punct = pos
-                
-                if last_punct != -1:
-                    truncated_response = truncated_response[:last_punct+1]
-                
+                truncated_response = truncate_foreign(response)
                 print(f"[Info] Sanitized response by removing foreign script part.")
                 return truncated_response
                 
@@ -110,6 +199,78 @@ class ChatBot:
              
         return "말문이 막히네... (오류: 답변 생성 실패)"
 
+    def stream_response(self, messages: list, max_new_tokens: int = 200, temperature: float = 0.6, top_p: float = 0.95, adapter: str = None):
+        """
+        Yield the response text piece by piece as it is generated.
+        Streaming cannot take back text that was already sent, so instead of
+        retrying on foreign script this stops at the first foreign character;
+        pass the joined pieces through truncate_foreign() for the final text.
+        """
+        adapter_kwargs = self._adapter_kwargs([adapter])
+        prompt = self.build_prompt(messages)
+        inputs = self.tokenizer(prompt, return_tensors="pt").to(self.model.device)
+        # timeout: generate()가 예외로 죽으면 소비자가 영원히 기다리지 않도록
+        streamer = TextIteratorStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True, timeout=STREAM_TIMEOUT)
+        stop_flag = _StopFlag()
+
+        def run():
+            with torch.no_grad():
+                self.model.generate(
+                    **inputs,
+                    max_new_tokens=max_new_tokens,
+                    temperature=temperature,
+                    top_p=top_p,
+                    do_sample=True,
+                    repetition_penalty=1.2,
+                    streamer=streamer,
+                    stopping_criteria=StoppingCriteriaList([stop_flag]),
+                    **adapter_kwargs,
+                )
+
+        thread = Thread(target=run, daemon=True)
+        thread.start()
+        try:
+            for piece in streamer:
+                foreign_match = FOREIGN_SCRIPT.search(piece)
+                if foreign_match:
+                    if foreign_match.start():
+                        yield piece[:foreign_match.start()]
+                    break
+                if piece:
+                    yield piece
+        finally:
+            # 외국어 감지나 클라이언트 연결 종료 시 생성도 멈춘다
+            stop_flag.stop = True
+            thread.join(timeout=STREAM_TIMEOUT)
+
+    def generate_batch(self, conversations: list, max_new_tokens: int = 200, temperature: float = 0.6, top_p: float = 0.95, streamer=None, stopping_criteria=None, adapters: list = None):
+        """
+        Run one left-padded generate() over several conversations and return
+        the generated token ids for each (padding and EOS included; callers
+        decode them). `adapters` names the adapter per conversation; rows may
+        mix adapters when mixed_adapter_batches is true. temperature <= 0
+        decodes greedily. Used by batching.BatchScheduler.
+        """
+        adapter_kwargs = self._adapter_kwargs(adapters or [None] * len(conversations))
+        prompts = [self.build_prompt(messages) for messages in conversations]
+        inputs = self.tokenizer(prompts, return_tensors="pt", padding=True).to(self.model.device)
+        if temperature > 0:
+            sampling = {"do_sample": True, "temperature": temperature, "top_p": top_p}
+        else:
+            sampling = {"do_sample": False}
+        with torch.no_grad():
+            outputs = self.model.generate(
+                **inputs,
+                max_new_tokens=max_new_tokens,
+                **sampling,
+                repetition_penalty=1.2,
+                pad_token_id=self.tokenizer.pad_token_id,
+                streamer=streamer,
+                stopping_criteria=stopping_criteria,
+                **adapter_kwargs,
+            )
+        return outputs[:, inputs.input_ids.shape[1]:]
+
 if __name__ == "__main__":
     print("Testing ChatBot class (Base + LoRA)...")
     try:
@@ -1,6 +1,9 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
 import sys
 import os
+import copy
+import json
+import threading
 from dotenv import load_dotenv
 from openai import OpenAI
 
@@ -9,21 +12,55 @@ client = OpenAI(api_key=os.environ["OPENAI_API_KEY"])
 
 # Add the current directory to sys.path to import ChatBot
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-from chatbot_not_merged_model import ChatBot
+from chatbot_not_merged_model import ChatBot, truncate_foreign
+from batching import BatchScheduler
 
 app = Flask(__name__)
 
-# Initialize the chatbot
+# Style -> LoRA adapter path, e.g. "funny=./lora_adapter_funny,comfort=./lora_adapter_comfort".
 # The model path should be relative to the server script or an absolute path
-bot_funny = ChatBot(adapter_path="./lora_adapter_funny")
-bot_comfort = ChatBot(adapter_path="./lora_adapter_comfort")
+LORA_ADAPTERS = dict(
+    item.split("=", 1)
+    for item in os.getenv("LORA_ADAPTERS", "funny=./lora_adapter_funny,comfort=./lora_adapter_comfort").split(",")
+)
+DEFAULT_STYLE = "funny" if "funny" in LORA_ADAPTERS else next(iter(LORA_ADAPTERS))
 
-@app.route('/generate', methods=['POST'])
-def generate():
-    data = request.get_json()
-    if not data or 'messages' not in data:
-        return jsonify({"error": "Messages are required"}), 400
-    
+# Initialize the chatbot: base 모델은 한 번만 올리고 스타일마다 어댑터만 추가
+bot = ChatBot(adapter_path=None)
+for style_name, adapter_path in LORA_ADAPTERS.items():
+    bot.load_adapter(style_name, adapter_path)
+
+# 동시 요청을 모아 한 번의 generate()로 처리 (LOCAL_LLM_BATCHING=0이면 요청마다 단독 생성)
+BATCHING = os.getenv("LOCAL_LLM_BATCHING", "1") == "1"
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "8"))
+BATCH_MAX_WAIT_MS = float(os.getenv("BATCH_MAX_WAIT_MS", "10"))
+# 부하가 몰려 배치 자리를 기다리는 시간의 상한 (토큰 사이 타임아웃과 별도)
+BATCH_QUEUE_TIMEOUT = float(os.getenv("BATCH_QUEUE_TIMEOUT_SECONDS", "120"))
+# ChatBot or BatchScheduler; both have generate_response/stream_response
+local_llm = BatchScheduler(bot, BATCH_MAX_SIZE, BATCH_MAX_WAIT_MS, queue_timeout=BATCH_QUEUE_TIMEOUT) if BATCHING else bot
+
+# /tokenize 전용 토크나이저: 배치 스레드가 bot.tokenizer의 padding 설정을 바꾸는 동안 같은 인스턴스를
+# 다른 스레드에서 쓰면 fast tokenizer가 "Already borrowed"로 실패한다. 요청끼리는 락으로 순서대로 쓴다
+count_tokenizer = copy.deepcopy(bot.tokenizer)
+count_lock = threading.Lock()
+
+def adapter_for(style):
+    return style if style in bot.adapters else DEFAULT_STYLE
+
+OPENAI_MODEL = "ft:gpt-4o-2024-08-06:personal::D02LnSLU"
+SUMMARY_MODEL = os.getenv("SUMMARY_MODEL", "gpt-4o-mini")
+
+SUMMARY_PROMPT = """너는 대화 기록을 정리하는 요약기야.
+기존 요약과 그 뒤에 이어진 대화를 합쳐서 하나의 새 요약을 써.
+## 규칙
+1. 사용자에 대한 사실(이름, 관계, 일, 고민), 있었던 사건, 사용자의 감정 변화를 중심으로 남긴다.
+2. 인사, 맞장구, 반복되는 표현은 버린다.
+3. 한국어 평서문으로, 최대 8문장 이내로 쓴다.
+4. 요약문만 출력한다.
+"""
+
+def build_prompt(data):
+    """Return (messages with the persona system prompt, temperature, style, useLocalLLM)."""
     messages = data['messages']
     config = data['config']
 
@@ -72,23 +109,36 @@ assistant : 안녕이라고 말해준 것만으로도 지금 네가 여기 있
 
 user : 방금 개발하다가 코드 날릴 뻔했어
 assistant : 많이 놀랐지. 순간 심장 철렁했을 거야. 그래도 진짜 중요한 건 결국 안 날렸다는 거야. 코드 날릴 뻔했다는 건 집중이 풀린 게 아니라 끝까지 신경 쓰고 있었다는 뜻이야. 아무 생각 없이 작업했으면 ‘뻔했어’도 없이 그냥 사라졌을 거야. 멈춰서 다시 확인하고 손을 뗐다는 게 이미 실력이고 책임감이야. 오늘은 실수한 날이 아니라, 큰 사고 하나를 조용히 막아낸 날이야. 그런 날도 분명히 잘한 날이야.
+"""
+
+    summary = data.get('summary')
+    if summary:
+        system_content += f"""
+## 지금까지의 대화 요약
+{summary}
 """
 
     messages.insert(0, {"role": "system", "content": system_content})
+    return messages, temperature, style, useLocalLLM
+
+@app.route('/generate', methods=['POST'])
+def generate():
+    data = request.get_json()
+    if not data or 'messages' not in data:
+        return jsonify({"error": "Messages are required"}), 400
+
+    messages, temperature, style, useLocalLLM = build_prompt(data)
 
     print(f"user : {messages}")
     print("generating response..")
     
     try:
         if useLocalLLM:
-            if style == "comfort":    
-                response = bot_comfort.generate_response(messages, temperature=temperature)
-            else:
-                response = bot_funny.generate_response(messages, temperature=temperature)
+            response = local_llm.generate_response(messages, temperature=temperature, adapter=adapter_for(style))
         else:
             try:
                 resp = client.responses.create(
-                    model="ft:gpt-4o-2024-08-06:personal::D02LnSLU",
+                    model=OPENAI_MODEL,
                     input=messages,
                     temperature=temperature
                 )
@@ -105,6 +155,103 @@ assistant : 많이 놀랐지. 순간 심장 철렁했을 거야. 그래도 진
         print(f"Error during generation: {e}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/generate/stream', methods=['POST'])
+def generate_stream():
+    """
+    Same input as /generate, but the reply is streamed as newline-delimited
+    JSON: {"delta": "..."} per piece, then {"done": true, "response": "..."}
+    with the final text, or {"error": "..."} if generation failed midway.
+    """
+    data = request.get_json()
+    if not data or 'messages' not in data:
+        return jsonify({"error": "Messages are required"}), 400
+
+    messages, temperature, style, useLocalLLM = build_prompt(data)
+
+    def pieces():
+        if useLocalLLM:
+            yield from local_llm.stream_response(messages, temperature=temperature, adapter=adapter_for(style))
+        else:
+            stream = client.responses.create(
+                model=OPENAI_MODEL,
+                input=messages,
+                temperature=temperature,
+                stream=True
+            )
+            for event in stream:
+                if event.type == "response.output_text.delta":
+                    yield event.delta
+
+    def events():
+        text = ""
+        try:
+            for piece in pieces():
+                text += piece
+                yield json.dumps({"delta": piece}, ensure_ascii=False) + "\n"
+        except Exception as e:
+            print(f"Error during streaming generation: {e}")
+            yield json.dumps({"error": str(e)}, ensure_ascii=False) + "\n"
+            return
+        response = truncate_foreign(text) if useLocalLLM else text
+        print(f"bot response : {response}")
+        yield json.dumps({"done": True, "response": response}, ensure_ascii=False) + "\n"
+
+    return Response(stream_with_context(events()), mimetype='application/x-ndjson')
+
+@app.route('/tokenize', methods=['POST'])
+def tokenize():
+    """
+    Token counts for {"texts": [...]}: {"counts": [...]} in the same order.
+    Counts come from the local model's tokenizer and exclude chat-template
+    tokens; the backend uses them to fit history into its context budget.
+    """
+    data = request.get_json()
+    if not data or not isinstance(data.get('texts'), list):
+        return jsonify({"error": "texts is required"}), 400
+    texts = [text or "" for text in data['texts']]
+    if not texts:
+        return jsonify({"counts": []})
+    with count_lock:
+        encoded = count_tokenizer(texts, add_special_tokens=False)
+    return jsonify({"counts": [len(ids) for ids in encoded["input_ids"]]})
+
+@app.route('/summarize', methods=['POST'])
+def summarize():
+    """
+    Fold {"messages": [...]} into {"summary": previous summary or null} and
+    return {"summary": "..."}. The backend calls this for turns that no longer
+    fit the reply context window.
+    """
+    data = request.get_json()
+    if not data or not data.get('messages'):
+        return jsonify({"error": "Messages are required"}), 400
+
+    transcript = "\n".join(
+        f"{'사용자' if m.get('role') == 'user' else 'AI'}: {m.get('content') or ''}" for m in data['messages']
+    )
+    user_content = f"## 기존 요약\n{data.get('summary') or '(없음)'}\n\n## 이어진 대화\n{transcript}"
+    try:
+        resp = client.responses.create(
+            model=SUMMARY_MODEL,
+            input=[
+                {"role": "system", "content": SUMMARY_PROMPT},
+                {"role": "user", "content": user_content},
+            ],
+            temperature=0.2,
+            max_output_tokens=400,
+        )
+        return jsonify({"summary": resp.output_text.strip()})
+    except Exception as e:
+        print(f"Error during summarization: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    info = {"adapters": bot.adapters, "mixedAdapterBatches": bot.mixed_adapter_batches, "batching": BATCHING}
+    if BATCHING:
+        info["scheduler"] = local_llm.stats()
+    return jsonify(info)
+
 @app.route('/health', methods=['GET'])
 def health():
     return jsonify({"status": "ok"})
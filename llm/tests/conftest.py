@@ -0,0 +1,54 @@
+import os
+import sys
+
+import pytest
+
+# llm/ 모듈은 서로를 최상위 이름으로 import한다 (예: from chatbot_not_merged_model import ChatBot)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 테스트용 글자 단위 어휘: 한글만 써서 외국어 감지(FOREIGN_SCRIPT)에 걸리지 않게 한다
+HANGUL = "가나다라마바사아자차카타파하거너더러머버서어저처커터퍼허고노도로모보소오조초코토포호구누두루무부수우주추쿠투푸후"
+SPECIAL_TOKENS = ["<pad>", "<unk>", "<eos>"]
+
+
+@pytest.fixture(scope="session")
+def tiny_tokenizer():
+    """Character-level tokenizer over Hangul syllables with a minimal chat template."""
+    pytest.importorskip("transformers")
+    from tokenizers import Tokenizer, decoders, models, pre_tokenizers
+    from transformers import PreTrainedTokenizerFast
+
+    vocab = {token: i for i, token in enumerate(SPECIAL_TOKENS + list(HANGUL) + [" ", "\n"])}
+    backend = Tokenizer(models.WordLevel(vocab, unk_token="<unk>"))
+    backend.pre_tokenizer = pre_tokenizers.Split("", behavior="isolated")
+    backend.decoder = decoders.Fuse()
+    tokenizer = PreTrainedTokenizerFast(
+        tokenizer_object=backend, pad_token="<pad>", unk_token="<unk>", eos_token="<eos>",
+        model_input_names=["input_ids", "attention_mask"],
+    )
+    tokenizer.chat_template = "{% for m in messages %}{{ m['content'] }}\n{% endfor %}"
+    return tokenizer
+
+
+@pytest.fixture
+def tiny_model(tiny_tokenizer):
+    """A randomly initialized two-layer Llama, small enough to run on CPU in milliseconds."""
+    torch = pytest.importorskip("torch")
+    from transformers import LlamaConfig, LlamaForCausalLM
+
+    torch.manual_seed(0)
+    config = LlamaConfig(
+        vocab_size=len(tiny_tokenizer),
+        hidden_size=32,
+        intermediate_size=64,
+        num_hidden_layers=2,
+        num_attention_heads=4,
+        num_key_value_heads=2,
+        max_position_embeddings=256,
+        pad_token_id=tiny_tokenizer.pad_token_id,
+        eos_token_id=tiny_tokenizer.eos_token_id,
+        bos_token_id=None,
+    )
+    model = LlamaForCausalLM(config)
+    model.eval()
+    return model
@@ -0,0 +1,88 @@
+import pytest
+
+pytest.importorskip("transformers")
+pytest.importorskip("peft")
+torch = pytest.importorskip("torch")
+
+from peft import LoraConfig, get_peft_model
+
+from batching import BatchScheduler
+from chatbot_not_merged_model import BASE_ADAPTER, ChatBot
+
+PROMPTS = ["가나다", "라마바사아자차", "카타", "파하거너더러머버서어"]
+ADAPTERS = ["funny", "comfort", BASE_ADAPTER, "funny"]
+MAX_NEW_TOKENS = 10
+GREEDY = 0.0
+
+
+def conversation(text):
+    return [{"role": "user", "content": text}]
+
+
+def lora_config():
+    # init_lora_weights=False: B를 0이 아닌 값으로 초기화해서 어댑터마다 출력이 달라지게 한다
+    return LoraConfig(r=4, lora_alpha=8, target_modules=["q_proj", "v_proj"], init_lora_weights=False)
+
+
+@pytest.fixture
+def bot(tiny_model, tiny_tokenizer):
+    torch.manual_seed(1)
+    model = get_peft_model(tiny_model, lora_config(), adapter_name="funny")
+    model.add_adapter("comfort", lora_config())
+    model.eval()
+    return ChatBot(model=model, tokenizer=tiny_tokenizer)
+
+
+def single_adapter(bot, prompt, adapter):
+    """Greedy text for one prompt with only `adapter` active (no adapter_names)."""
+    scheduler = BatchScheduler(bot, max_batch_size=1, max_wait_ms=0, name="reference")
+    if adapter == BASE_ADAPTER:
+        with bot.model.disable_adapter():
+            return "".join(scheduler.submit(conversation(prompt), max_new_tokens=MAX_NEW_TOKENS, temperature=GREEDY))
+    bot.set_adapter(adapter)
+    return "".join(scheduler.submit(conversation(prompt), max_new_tokens=MAX_NEW_TOKENS, temperature=GREEDY))
+
+
+def test_mixed_adapter_batch_matches_single_adapter_runs(bot):
+    assert bot.mixed_adapter_batches
+    expected = [single_adapter(bot, p, a) for p, a in zip(PROMPTS, ADAPTERS)]
+    # 같은 프롬프트라도 어댑터가 다르면 결과가 달라야 비교가 의미 있다
+    assert single_adapter(bot, PROMPTS[0], "comfort") != expected[0]
+    assert single_adapter(bot, PROMPTS[0], BASE_ADAPTER) != expected[0]
+
+    # 활성 어댑터와 상관없이 행마다 지정한 어댑터를 써야 한다
+    bot.set_adapter("comfort")
+    scheduler = BatchScheduler(bot, max_batch_size=len(PROMPTS), max_wait_ms=5000)
+    requests = [
+        scheduler.submit(conversation(p), max_new_tokens=MAX_NEW_TOKENS, temperature=GREEDY, adapter=a)
+        for p, a in zip(PROMPTS, ADAPTERS)
+    ]
+    assert ["".join(request) for request in requests] == expected
+    stats = scheduler.stats()
+    assert stats["batches"] == 1
+    assert stats["adaptersPerBatchAvg"] == len(set(ADAPTERS))
+
+
+def test_unknown_adapter_fails_before_generate(bot, monkeypatch):
+    def generate(*args, **kwargs):
+        raise AssertionError("generate() must not be called with an unknown adapter")
+
+    monkeypatch.setattr(bot.model, "generate", generate)
+    with pytest.raises(ValueError, match="nope"):
+        bot.generate_batch([conversation(PROMPTS[0])], max_new_tokens=MAX_NEW_TOKENS, temperature=GREEDY, adapters=["nope"])
+    with pytest.raises(ValueError, match="nope"):
+        bot.generate_batch(
+            [conversation(p) for p in PROMPTS[:2]], max_new_tokens=MAX_NEW_TOKENS, temperature=GREEDY, adapters=["funny", "nope"],
+        )
+
+
+def test_unknown_adapter_is_rejected_at_submit(bot):
+    scheduler = BatchScheduler(bot, max_batch_size=2, max_wait_ms=200)
+    good = scheduler.submit(conversation(PROMPTS[0]), max_new_tokens=MAX_NEW_TOKENS, temperature=GREEDY, adapter="funny")
+    with pytest.raises(ValueError, match="nope"):
+        scheduler.submit(conversation(PROMPTS[1]), max_new_tokens=MAX_NEW_TOKENS, temperature=GREEDY, adapter="nope")
+    # 거절된 요청은 큐에 들어가지 않으므로 같은 시점의 다른 요청은 그대로 생성된다
+    assert "".join(good) == single_adapter(bot, PROMPTS[0], "funny")
+    stats = scheduler.stats()
+    assert stats["requests"] == 1
+    assert stats["failed"] == 0
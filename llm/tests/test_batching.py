@@ -0,0 +1,156 @@
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("transformers")
+torch = pytest.importorskip("torch")
+
+import batching
+from batching import BatchScheduler
+from chatbot_not_merged_model import ChatBot
+
+# 길이가 다른 프롬프트: 왼쪽 패딩이 결과를 바꾸지 않는지도 함께 본다
+PROMPTS = ["가나다", "라마바사아자차", "카타", "파하거너더러머버서어"]
+MAX_NEW_TOKENS = [6, 12, 9, 16]
+GREEDY = 0.0
+TIMEOUT = 30
+
+
+def conversation(text):
+    return [{"role": "user", "content": text}]
+
+
+def one_at_a_time(bot, prompts, max_new_tokens):
+    scheduler = BatchScheduler(bot, max_batch_size=1, max_wait_ms=0, name="reference")
+    return ["".join(scheduler.submit(conversation(p), max_new_tokens=n, temperature=GREEDY)) for p, n in zip(prompts, max_new_tokens)]
+
+
+def batched(scheduler, prompts, max_new_tokens):
+    requests = [
+        scheduler.submit(conversation(p), max_new_tokens=n, temperature=GREEDY)
+        for p, n in zip(prompts, max_new_tokens)
+    ]
+    return ["".join(request) for request in requests]
+
+
+@pytest.fixture
+def bot(tiny_model, tiny_tokenizer):
+    return ChatBot(model=tiny_model, tokenizer=tiny_tokenizer)
+
+
+def greedy_ids(bot, prompt, max_new_tokens):
+    """Token ids of a plain greedy generate() for one prompt (no streamer, no stop criteria)."""
+    return bot.generate_batch([conversation(prompt)], max_new_tokens=max_new_tokens, temperature=GREEDY)[0].tolist()
+
+
+def test_batched_matches_one_at_a_time(bot):
+    expected = one_at_a_time(bot, PROMPTS, MAX_NEW_TOKENS)
+    # max_wait를 넉넉히 줘서 네 요청이 반드시 한 배치로 묶이게 한다
+    scheduler = BatchScheduler(bot, max_batch_size=len(PROMPTS), max_wait_ms=5000)
+    assert batched(scheduler, PROMPTS, MAX_NEW_TOKENS) == expected
+    stats = scheduler.stats()
+    assert stats["batches"] == 1
+    assert stats["batchSizeMax"] == len(PROMPTS)
+
+
+def test_rows_respect_their_own_max_new_tokens(bot):
+    scheduler = BatchScheduler(bot, max_batch_size=len(PROMPTS), max_wait_ms=5000)
+    texts = batched(scheduler, PROMPTS, MAX_NEW_TOKENS)
+    for prompt, limit, text in zip(PROMPTS, MAX_NEW_TOKENS, texts):
+        # 같은 프롬프트를 긴 한도로 단독 생성한 결과의 앞부분과 같아야 한다
+        full = bot.tokenizer.decode(greedy_ids(bot, prompt, max(MAX_NEW_TOKENS))[:limit], skip_special_tokens=True)
+        assert text == full
+        assert len(bot.tokenizer(text, add_special_tokens=False).input_ids) <= limit
+
+
+def test_row_stops_on_eos_without_stopping_others(bot):
+    ids = greedy_ids(bot, PROMPTS[3], max(MAX_NEW_TOKENS))
+    specials = set(bot.tokenizer.all_special_ids)
+    # 4번째 행의 단독 생성에서 처음 나온 (특수 토큰이 아닌) 토큰을 EOS로 지정한다
+    stop_at = next(i for i, token in enumerate(ids) if i >= 2 and token not in specials and token not in ids[:i])
+    bot.model.generation_config.eos_token_id = [bot.tokenizer.eos_token_id, ids[stop_at]]
+
+    expected = one_at_a_time(bot, PROMPTS, MAX_NEW_TOKENS)
+    assert expected[3] == bot.tokenizer.decode(ids[:stop_at], skip_special_tokens=True)
+    scheduler = BatchScheduler(bot, max_batch_size=len(PROMPTS), max_wait_ms=5000)
+    assert batched(scheduler, PROMPTS, MAX_NEW_TOKENS) == expected
+
+
+def test_cancelled_request_does_not_stall_its_batch(bot):
+    expected = one_at_a_time(bot, PROMPTS, MAX_NEW_TOKENS)
+    # 한 step마다 조금씩 쉬게 해서 취소가 반드시 생성 도중에 일어나게 한다
+    hook = bot.model.register_forward_pre_hook(lambda module, args: time.sleep(0.02))
+    try:
+        scheduler = BatchScheduler(bot, max_batch_size=len(PROMPTS), max_wait_ms=5000)
+        requests = [
+            scheduler.submit(conversation(p), max_new_tokens=n, temperature=GREEDY)
+            for p, n in zip(PROMPTS, MAX_NEW_TOKENS)
+        ]
+        cancelled = requests[1]
+        results = {}
+
+        def consume(i, request):
+            pieces = []
+            for piece in request:
+                pieces.append(piece)
+                if request is cancelled:
+                    # 첫 조각을 받자마자 클라이언트가 떠난 상황
+                    request.cancel()
+            results[i] = "".join(pieces)
+
+        threads = [threading.Thread(target=consume, args=(i, r)) for i, r in enumerate(requests)]
+        started = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(TIMEOUT)
+        assert not any(thread.is_alive() for thread in threads), "a request in the batch never finished"
+    finally:
+        hook.remove()
+
+    for i, text in results.items():
+        if i == 1:
+            assert len(text) < len(expected[1])
+            assert expected[1].startswith(text)
+        else:
+            assert text == expected[i]
+    # 배치 전체가 가장 긴 행의 생성 시간 안에 끝난다 (취소된 행 때문에 기다리지 않음)
+    assert time.monotonic() - started < TIMEOUT
+    assert scheduler.stats()["failed"] == 0
+
+
+def slow_steps(bot, seconds):
+    return bot.model.register_forward_pre_hook(lambda module, args: time.sleep(seconds))
+
+
+def test_queued_request_is_not_timed_out_by_the_stream_timeout(bot, monkeypatch):
+    # 조각 사이 타임아웃보다 오래 큐에서 기다려도, 배치에 들어간 뒤 정상적으로 생성되면 성공해야 한다
+    monkeypatch.setattr(batching, "STREAM_TIMEOUT", 0.3)
+    expected = one_at_a_time(bot, PROMPTS[:2], [16, 4])
+    hook = slow_steps(bot, 0.05)
+    try:
+        scheduler = BatchScheduler(bot, max_batch_size=1, max_wait_ms=0)
+        first = scheduler.submit(conversation(PROMPTS[0]), max_new_tokens=16, temperature=GREEDY)
+        second = scheduler.submit(conversation(PROMPTS[1]), max_new_tokens=4, temperature=GREEDY)
+        # 두 번째 요청을 먼저 읽는다: 첫 배치가 끝날 때까지 조각 없이 기다린다
+        assert "".join(second) == expected[1]
+        assert "".join(first) == expected[0]
+    finally:
+        hook.remove()
+    assert scheduler.stats()["batches"] == 2
+
+
+def test_request_that_never_gets_a_batch_slot_times_out(bot):
+    hook = slow_steps(bot, 0.05)
+    try:
+        scheduler = BatchScheduler(bot, max_batch_size=1, max_wait_ms=0, queue_timeout=0.1)
+        first = scheduler.submit(conversation(PROMPTS[0]), max_new_tokens=16, temperature=GREEDY)
+        second = scheduler.submit(conversation(PROMPTS[1]), max_new_tokens=4, temperature=GREEDY)
+        with pytest.raises(TimeoutError, match="slot"):
+            "".join(second)
+        assert "".join(first)
+    finally:
+        hook.remove()
+    # 포기한 요청은 배치로 묶이지 않는다
+    assert scheduler.stats()["requests"] == 1
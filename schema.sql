@@ -32,7 +32,15 @@ CREATE TABLE "CONVERSATION" (
     title VARCHAR(255),
     created_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
-    deleted BOOLEAN DEFAULT FALSE
+    deleted BOOLEAN DEFAULT FALSE,
+    -- denormalized summary for the chat list, maintained by the backend on every new message
+    last_message TEXT,
+    last_message_at TIMESTAMPTZ,
+    message_count INTEGER DEFAULT 0,
+    -- rolling summary of turns that fell out of the reply context window (backend/context.py)
+    summary TEXT,
+    summary_through_at TIMESTAMPTZ,
+    summary_through_id UUID
 );
 
 CREATE TABLE "MESSAGE" (
@@ -49,13 +57,23 @@ CREATE TABLE "MESSAGE" (
     embedding vector(1024)
 );
 
+CREATE INDEX ix_conversation_user_deleted_updated ON "CONVERSATION" (user_id, deleted, updated_at);
+
+CREATE INDEX ix_message_conversation_created ON "MESSAGE" (conversation_id, created_at, id);
+
 CREATE TABLE "POST" (
     id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
     user_id UUID NOT NULL REFERENCES "USER"(id) ON DELETE CASCADE,
     msgs UUID[],
-    hearts INTEGER DEFAULT 0
+    hearts INTEGER DEFAULT 0,
+    created_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
+    is_anonymous BOOLEAN DEFAULT FALSE,
+    hot_score DOUBLE PRECISION -- feed ranking score, maintained by backend/feed.py
 );
 
+CREATE INDEX ix_post_hot_score ON "POST" (hot_score DESC, id DESC);
+CREATE INDEX ix_post_user_id ON "POST" (user_id);
+
 CREATE TABLE "COMMENT" (
     id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
     user_id UUID NOT NULL REFERENCES "USER"(id) ON DELETE CASCADE,
@@ -64,3 +82,42 @@ CREATE TABLE "COMMENT" (
     content TEXT,
     created_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP
 );
+
+CREATE INDEX ix_comment_post_id ON "COMMENT" (post_id);
+CREATE INDEX ix_comment_user_id ON "COMMENT" (user_id);
+
+CREATE TABLE "LIKE" (
+    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    user_id UUID NOT NULL REFERENCES "USER"(id) ON DELETE CASCADE,
+    post_id UUID NOT NULL REFERENCES "POST"(id) ON DELETE CASCADE,
+    created_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE UNIQUE INDEX ix_like_user_post ON "LIKE" (user_id, post_id);
+CREATE INDEX ix_like_post_id ON "LIKE" (post_id);
+
+-- 피드 버전 (GET /community의 ETag)
+CREATE SEQUENCE feed_version_seq;
+
+-- 봇 답변 작업 큐 (backend/worker.py가 FOR UPDATE SKIP LOCKED로 가져감)
+CREATE TABLE "BOT_JOB" (
+    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    message_id UUID REFERENCES "MESSAGE"(id) ON DELETE CASCADE,
+    conversation_id UUID NOT NULL REFERENCES "CONVERSATION"(id) ON DELETE CASCADE,
+    user_id UUID NOT NULL REFERENCES "USER"(id) ON DELETE CASCADE,
+    use_local_llm BOOLEAN NOT NULL DEFAULT FALSE,
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 5,
+    run_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    locked_until TIMESTAMPTZ,
+    last_error TEXT,
+    partial_text TEXT,
+    reply_id UUID REFERENCES "MESSAGE"(id) ON DELETE SET NULL,
+    created_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE UNIQUE INDEX ix_bot_job_message_id ON "BOT_JOB" (message_id);
+CREATE INDEX ix_bot_job_status_run_at ON "BOT_JOB" (status, run_at);
+CREATE INDEX ix_bot_job_status_locked_until ON "BOT_JOB" (status, locked_until);